@@ -0,0 +1,90 @@
+import argparse
+import datetime
+import tempfile
+import time
+import numpy as np
+from src.api.fetch import Exchange
+from src.api.synthetic import order_book_frame
+from src.db.asset import AssetPairDbManager, LEVEL_COLUMNS
+from src.db.execution import ExecutionDbManager
+from src.execution.backtest import Backtester, target_positions
+
+YEAR_OF_BOOKS = 365 * 24 * 60 * 60 * 10  # 100ms snapshots.
+
+
+def synthetic_signals(count, seed=0):
+    """ A slowly wandering up-probability, one per snapshot, like the CNN produces. """
+    rng = np.random.default_rng(seed)
+    logits = (np.cumsum(rng.normal(0, 0.05, count)) + 2) % 4 - 2
+    return 1 / (1 + np.exp(-logits))
+
+
+def per_order_baseline(db, execution_db, times, signals, size, fee, count):
+    """ One boundary_snapshots lookup, a Python depth walk and a record_transaction commit per order. """
+    targets = target_positions(signals, size=size)
+    orders = np.diff(targets, prepend=0.0)
+    index = np.flatnonzero(orders)[:count]
+    position = 0.0
+    started = time.perf_counter()
+    for i in index:
+        when = datetime.datetime.fromtimestamp(times[i] / 1e9, datetime.timezone.utc).replace(tzinfo=None)
+        _, values = db.boundary_snapshots([when], 'after', LEVEL_COLUMNS, within=datetime.timedelta(seconds=1))
+        book = values[0].reshape(2, 20, 2)[1 if orders[i] > 0 else 0]
+        remaining, cost = abs(orders[i]), 0.0
+        for price, available in book:
+            taken = min(remaining, available)
+            cost += taken * price
+            remaining -= taken
+        filled = abs(orders[i]) - remaining
+        position += np.sign(orders[i]) * filled
+        execution_db.record_transaction(when, 'buy' if orders[i] > 0 else 'sell', filled,
+                                        cost / filled * (1 + fee), position)
+    return (time.perf_counter() - started) / len(index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of Backtester over synthetic 100ms books.")
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--backend', default='columnar', choices=['columnar', 'sqlite'])
+    parser.add_argument('--size', type=float, default=1.0)
+    args = parser.parse_args()
+
+    rows_per_hour = 60 * 60 * 10
+    with tempfile.TemporaryDirectory() as tmp:
+        db = AssetPairDbManager(Exchange.BINANCE, "ETH-USDT", backend=args.backend, db_path=tmp)
+        execution_db = ExecutionDbManager(Exchange.BINANCE, "ETH-USDT", db_path=tmp)
+        for hour in range(args.hours):
+            start = datetime.datetime(2022, 1, 1) + datetime.timedelta(hours=hour)
+            db.bulk_save(order_book_frame(rows_per_hour, start=start, seed=hour))
+
+        backtester = Backtester(db, execution_db, size=args.size)
+        books = 0
+        started = time.perf_counter()
+        # Replay a day at a time, as a year-long run would.
+        day = datetime.datetime(2022, 1, 1)
+        end = day + datetime.timedelta(hours=args.hours)
+        while day < end:
+            next_day = min(day + datetime.timedelta(days=1), end)
+            times, _ = db.read_range(day, next_day - datetime.timedelta(microseconds=1), [])
+            backtester.run(times - 50000000, synthetic_signals(len(times), seed=books))
+            books += len(times)
+            day = next_day
+        elapsed = time.perf_counter() - started
+        summary = backtester.summary()
+
+        baseline_db = ExecutionDbManager(Exchange.BINANCE, "ETH-USDT", db_path=f"{tmp}/baseline")
+        times, _ = db.read_range(datetime.datetime(2022, 1, 1), datetime.datetime(2022, 1, 1, 1), [])
+        per_order = per_order_baseline(db, baseline_db, times - 50000000, synthetic_signals(len(times)),
+                                       args.size, backtester.fee, 200)
+
+    orders_per_book = summary['orders'] / books
+    print(f"books:     {books:,} ({args.hours}h, {args.backend})")
+    print(f"orders:    {summary['orders']:,}, {summary['trades']:,} filled, equity {summary['equity']:,.2f}")
+    print(f"backtest:  {elapsed:.2f}s ({books / elapsed:,.0f} books/sec)")
+    print(f"year:      ~{YEAR_OF_BOOKS / (books / elapsed) / 60:.1f} min for {YEAR_OF_BOOKS:,} books")
+    print(f"baseline:  {per_order * 1000:.2f}ms per order, "
+          f"~{YEAR_OF_BOOKS * orders_per_book * per_order / 3600:.1f} h for a year at the same order rate")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import argparse
+import contextlib
+import datetime
+import io
+import tempfile
+import time
+from src.api.fetch import Exchange
+from src.api.synthetic import order_book_frame
+from src.db.asset import AssetPairDbManager
+from src.db.bars import BarStore, book_bars, parse_resolution
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve bars from a BarStore vs aggregating raw book rows per request.")
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--backend', default='sqlite', choices=['sqlite', 'columnar'])
+    args = parser.parse_args()
+
+    start = datetime.datetime(2022, 1, 1)
+    end = start + datetime.timedelta(hours=args.hours)
+    with tempfile.TemporaryDirectory() as tmp:
+        with contextlib.redirect_stdout(io.StringIO()):
+            db = AssetPairDbManager(Exchange.BINANCE, "ETH-USDT", backend=args.backend, db_path=tmp)
+            for hour in range(args.hours):
+                db.bulk_save(order_book_frame(36000, start=start + datetime.timedelta(hours=hour), seed=hour))
+            store = BarStore(db, root=f"{tmp}/bars")
+            started = time.perf_counter()
+            store.update(start.date(), (end - datetime.timedelta(microseconds=1)).date())
+            build = time.perf_counter() - started
+
+        print(f"books:   {args.hours * 36000:,} ({args.hours}h, {args.backend}), bars built in {build:.2f}s")
+        for resolution in ('1s', '1m', '5m', '1h'):
+            started = time.perf_counter()
+            bars = store.bars(start, end, resolution)
+            served = time.perf_counter() - started
+            started = time.perf_counter()
+            timestamps, values = db.read_range(start, end - datetime.timedelta(microseconds=1), store.columns)
+            book_bars(timestamps, values, parse_resolution(resolution), store.depth)
+            raw = time.perf_counter() - started
+            print(f"{resolution:>3}:     {len(bars):>7,} bars in {served * 1000:8.2f}ms, "
+                  f"from raw rows {raw * 1000:9.1f}ms ({raw / served:,.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
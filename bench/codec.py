@@ -0,0 +1,71 @@
+import argparse
+import datetime
+import json
+import time
+import numpy as np
+from src.api.synthetic import order_book_frame
+from src.db.asset import LEVEL_COLUMNS
+from src.common.codec import BookDecoder, BookEncoder, decode, decode_books, encode_book, encode_books
+
+
+def rate(label, count, seconds, size=None):
+    line = f"{label:<22} {count / seconds:>12,.0f} msgs/sec"
+    if size is not None:
+        line += f"  {size / count:>7.1f} bytes/msg"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the binary book codec with the JSON path.")
+    parser.add_argument('--messages', type=int, default=50000)
+    args = parser.parse_args()
+
+    frame = order_book_frame(args.messages)
+    received = frame['received_time'].to_numpy().astype('datetime64[ns]').view(np.int64)
+    origin = frame['origin_time'].to_numpy().astype('datetime64[ns]').view(np.int64)
+    sequence = frame['sequence_number'].to_numpy()
+    levels = frame[LEVEL_COLUMNS].to_numpy()
+    # Real books move a few levels per tick; keep most sizes unchanged between snapshots.
+    levels[:, 1::2] = np.where(np.random.default_rng(0).random(levels[:, 1::2].shape) < 0.9,
+                               levels[0, 1::2], levels[:, 1::2])
+    n = args.messages
+
+    # JSON, as MarketUI used to receive it: ISO time strings parsed with strptime on every message.
+    times = [datetime.datetime.fromtimestamp(t / 1e9, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S') for t in received]
+    started = time.perf_counter()
+    payloads = [json.dumps({'time': times[i], 'sequence_number': int(sequence[i]), 'levels': levels[i].tolist()}).encode()
+                for i in range(n)]
+    rate("json encode", n, time.perf_counter() - started, sum(map(len, payloads)))
+    started = time.perf_counter()
+    for payload in payloads:
+        message = json.loads(payload)
+        datetime.datetime.strptime(message['time'], '%Y-%m-%dT%H:%M:%S')
+    rate("json decode", n, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    payloads = [encode_book(received[i], origin[i], sequence[i], levels[i]) for i in range(n)]
+    rate("binary encode", n, time.perf_counter() - started, sum(map(len, payloads)))
+    started = time.perf_counter()
+    for payload in payloads:
+        decode(payload)
+    rate("binary decode", n, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    buffer = encode_books(received, origin, sequence, levels)
+    rate("binary batch encode", n, time.perf_counter() - started, len(buffer))
+    started = time.perf_counter()
+    decode_books(buffer)['levels'].sum()
+    rate("binary batch decode", n, time.perf_counter() - started)
+
+    encoder, decoder = BookEncoder(), BookDecoder()
+    started = time.perf_counter()
+    payloads = [encoder.encode(received[i], origin[i], sequence[i], levels[i]) for i in range(n)]
+    rate("delta encode", n, time.perf_counter() - started, sum(map(len, payloads)))
+    started = time.perf_counter()
+    decoded = [decoder.decode(payload) for payload in payloads]
+    rate("delta decode", n, time.perf_counter() - started)
+    assert np.array_equal(decoded[-1].levels, levels[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import datetime
+import sqlite3
+import tempfile
+import threading
+import time
+import pandas as pd
+from src.api.fetch import Exchange
+from src.api.synthetic import order_book_frame
+from src.db.asset import AssetPairDbManager
+from src.db.execution import ExecutionDbManager
+
+INSERT = """
+    INSERT INTO transactions (timestamp, transaction_type, quantity, price, total_position)
+    VALUES (?, ?, ?, ?, ?)
+"""
+LATEST = "SELECT MAX(received_time) FROM order_book"
+WINDOW = "SELECT received_time, bid_0_price, ask_0_price FROM order_book WHERE received_time BETWEEN ? AND ? ORDER BY received_time"
+
+
+def window_params(i):
+    """ A one-second window of the first synthetic hour, in the int64 nanoseconds of schema version 2. """
+    start = pd.Timestamp(2022, 1, 1) + pd.Timedelta(seconds=i % 3600)
+    return start.value, (start + pd.Timedelta(seconds=1)).value
+
+
+def rate(operation, count):
+    started = time.perf_counter()
+    for i in range(count):
+        operation(i)
+    return count / (time.perf_counter() - started)
+
+
+def connect_per_call(db_file):
+    """ The previous pattern: a fresh connection, and a fresh statement cache, for every call. """
+    def write(i):
+        with sqlite3.connect(db_file) as conn:
+            conn.execute(INSERT, (datetime.datetime(2022, 1, 1, 0, 0, i % 60).isoformat(), 'buy', 1.0, 1500.0, i))
+            conn.commit()
+
+    def latest(i):
+        with sqlite3.connect(db_file) as conn:
+            return conn.execute(LATEST).fetchone()
+
+    def window(i):
+        with sqlite3.connect(db_file) as conn:
+            return conn.execute(WINDOW, window_params(i)).fetchall()
+    return write, latest, window
+
+
+def pooled(pool):
+    def write(i):
+        with pool.write() as conn:
+            conn.execute(INSERT, (datetime.datetime(2022, 1, 1, 0, 0, i % 60).isoformat(), 'buy', 1.0, 1500.0, i))
+
+    def latest(i):
+        return pool.connection().execute(LATEST).fetchone()
+
+    def window(i):
+        return pool.connection().execute(WINDOW, window_params(i)).fetchall()
+    return write, latest, window
+
+
+def concurrent_reads(books, seconds):
+    """ Window reads/sec per reader thread while another thread keeps bulk-saving books. """
+    stop = threading.Event()
+    reads = []
+
+    def reader():
+        count = 0
+        while not stop.is_set():
+            start = datetime.datetime(2022, 1, 1) + datetime.timedelta(seconds=count % 3600)
+            books.read_range(start, start + datetime.timedelta(seconds=1), ['bid_0_price'])
+            count += 1
+        reads.append(count)
+
+    def writer():
+        hour = 1
+        while not stop.is_set():
+            books.bulk_save(order_book_frame(3600, start=datetime.datetime(2022, 1, 1) + datetime.timedelta(hours=hour)))
+            hour += 1
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(reads) / len(reads) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Small reads and writes with per-call connections vs the connection pool.")
+    parser.add_argument('--count', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        books = AssetPairDbManager(Exchange.BINANCE, "ETH-USDT", db_path=tmp)
+        executions = ExecutionDbManager(Exchange.BINANCE, "ETH-USDT", db_path=tmp)
+        books.bulk_save(order_book_frame(36000))
+
+        results = {}
+        for name, operations in (('per call', lambda db: connect_per_call(db.db_file)),
+                                 ('pooled', lambda db: pooled(db.pool))):
+            write, _, _ = operations(executions)
+            _, latest, window = operations(books)
+            results[name] = [rate(write, args.count), rate(latest, args.count), rate(window, args.count)]
+        reads = concurrent_reads(books, 3.0)
+
+    print(f"{'':10}{'writes/sec':>14}{'latest/sec':>14}{'window/sec':>14}")
+    for name, (writes, latest, window) in results.items():
+        print(f"{name:10}{writes:>14,.0f}{latest:>14,.0f}{window:>14,.0f}")
+    print(f"speedup:  {results['pooled'][0] / results['per call'][0]:>13.1f}x"
+          f"{results['pooled'][1] / results['per call'][1]:>13.1f}x{results['pooled'][2] / results['per call'][2]:>13.1f}x")
+    print(f"readers:  {reads:,.0f} window reads/sec per thread while a writer bulk-saves")
+
+
+if __name__ == "__main__":
+    main()
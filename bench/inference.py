@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import tempfile
+import threading
+import time
+import numpy as np
+from src.api.synthetic import order_book_frame
+from src.common.codec import BookEncoder, SIGNAL, topic
+from src.common.sock import AsyncSocketServer, SockClient
+from src.db.asset import LEVEL_COLUMNS
+from src.training.cnn import CNNModel
+from src.training.inference import InferenceService
+from src.training.normalize import FeatureStats
+from src.training.pipeline import feature_columns
+
+
+def untrained_model(levels, book_values):
+    """ A built CNNModel with statistics from the synthetic book; inference cost doesn't depend on the weights. """
+    cnn = CNNModel(None, window=64, levels=levels)
+    cnn.stats = FeatureStats(feature_columns(levels))
+    cnn.stats.update(book_values[:, [LEVEL_COLUMNS.index(c) for c in feature_columns(levels)]])
+    with contextlib.redirect_stdout(io.StringIO()):
+        cnn.build_model()
+    return cnn
+
+
+def per_message_baseline(cnn, count):
+    """ Latency of scoring one window at a time with model.predict, the naive approach. """
+    sample = np.zeros((1, cnn.window, cnn.levels * 4, 1), dtype=np.float32)
+    cnn.model.predict(sample, verbose=0)
+    started = time.perf_counter()
+    for _ in range(count):
+        cnn.model.predict(sample, verbose=0)
+    return (time.perf_counter() - started) / count * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and batching of InferenceService against a local feed.")
+    parser.add_argument('--rate', type=float, default=2000, help="Snapshots per second published.")
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-latency', type=float, default=0.005)
+    parser.add_argument('--backend', default='keras', choices=['keras', 'savedmodel', 'tflite'])
+    args = parser.parse_args()
+
+    frame = order_book_frame(int(args.rate * args.seconds))
+    received = frame['received_time'].to_numpy().astype('datetime64[ns]').view(np.int64)
+    levels = frame[LEVEL_COLUMNS].to_numpy()
+    cnn = untrained_model(5, levels)
+
+    loop = asyncio.new_event_loop()
+    feed = topic('BINANCE', 'ETH-USDT')
+    server = AsyncSocketServer(port=0, max_queue=100000)
+    loop.run_until_complete(server.start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    # Subscribes to the feed like a UI would, and counts the signals the server relays to it.
+    subscriber = SockClient(port=server.port, topics=[feed])
+    subscriber.connect()
+    signals = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        service = InferenceService(cnn, port=server.port, max_batch=args.max_batch, max_latency=args.max_latency,
+                                   backend=args.backend, export_dir=tmp, topic=feed)
+        worker = threading.Thread(target=service.run)
+        worker.start()
+        while len(server.sessions) < 2:
+            time.sleep(0.01)
+        time.sleep(0.1)  # Let the subscriptions arrive.
+
+        encoder = BookEncoder()
+        started = time.perf_counter()
+        for i in range(len(frame)):
+            # Pace the feed at the requested rate.
+            delay = started + i / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            server.broadcast_threadsafe(encoder.encode(received[i], received[i], i, levels[i]), feed)
+            if i % 1000 == 0:
+                signals += sum(payload[0] == SIGNAL for payload in subscriber.receive_batch())
+        time.sleep(0.5)
+        service.stop()
+        worker.join()
+        time.sleep(0.1)
+        signals += sum(payload[0] == SIGNAL for payload in subscriber.receive_batch())
+        subscriber.close()
+
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    stats = service.stats()
+    print(f"backend:   {args.backend}, max_batch {args.max_batch}, max_latency {args.max_latency * 1000:.1f}ms")
+    print(f"snapshots: {stats['snapshots']} received, {stats['signals']} signals, {signals} relayed to a subscriber")
+    print(f"latency:   p50 {stats['p50_ms']:.2f}ms, p99 {stats['p99_ms']:.2f}ms")
+    print(f"batches:   {stats['batches']}, sizes {stats['batch_sizes']}")
+    print(f"baseline:  model.predict per message {per_message_baseline(cnn, 50):.2f}ms "
+          f"(caps out at {1000 / per_message_baseline(cnn, 20):,.0f} msgs/sec)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import argparse
+import tempfile
+import time
+from src.api.fetch import Exchange
+from src.db.asset import AssetPairDbManager
+from src.api.synthetic import order_book_frame
+
+
+def measure(save, dataframe):
+    """ Runs one save and returns rows/sec. """
+    started = time.perf_counter()
+    save(dataframe)
+    return len(dataframe) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare DbManager.save and DbManager.bulk_save throughput.")
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    dataframe = order_book_frame(args.rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = AssetPairDbManager(Exchange.BINANCE, "ETH-USDT", db_path=f"{tmp}/save")
+        bulk = AssetPairDbManager(Exchange.BINANCE, "ETH-USDT", db_path=f"{tmp}/bulk")
+        # `save` converts datetime columns in place, so it gets its own copy.
+        save_rate = measure(legacy.save, dataframe.copy())
+        bulk_rate = measure(bulk.bulk_save, dataframe)
+
+    print(f"rows:      {args.rows}")
+    print(f"save:      {save_rate:,.0f} rows/sec")
+    print(f"bulk_save: {bulk_rate:,.0f} rows/sec ({bulk_rate / save_rate:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import tempfile
+import time
+from src.api.fetch import Exchange
+from src.api.synthetic import order_book_frame
+from src.common import metrics
+from src.db.asset import AssetPairDbManager
+
+
+def per_call(function, count):
+    """ Nanoseconds per call of `function`, net of the loop itself. """
+    started = time.perf_counter()
+    for _ in range(count):
+        pass
+    loop = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(count):
+        function()
+    return (time.perf_counter() - started - loop) / count * 1e9
+
+
+def span():
+    with metrics.span('bench.span'):
+        pass
+
+
+def inc():
+    metrics.inc('bench.counter')
+
+
+def bulk_save_rate(frame, tmp, name):
+    db = AssetPairDbManager(Exchange.BINANCE, "ETH-USDT", db_path=f"{tmp}/{name}")
+    started = time.perf_counter()
+    db.bulk_save(frame)
+    return len(frame) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overhead of the instrumentation layer, disabled and enabled.")
+    parser.add_argument('--calls', type=int, default=500000)
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    frame = order_book_frame(args.rows)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for state in ('disabled', 'enabled', 'profiled'):
+            if state == 'disabled':
+                metrics.disable()
+            else:
+                metrics.enable()
+            if state == 'profiled':
+                metrics.profile('db.bulk_save')
+            results[state] = (per_call(span, args.calls), per_call(inc, args.calls), bulk_save_rate(frame, tmp, state))
+    metrics.disable()
+
+    for state, (span_ns, inc_ns, rate) in results.items():
+        print(f"{state:>9}: span {span_ns:6.0f}ns, inc {inc_ns:6.0f}ns, bulk_save {rate:,.0f} rows/sec")
+    profiler = metrics.profile('db.bulk_save')
+    hottest = profiler.top(1)
+    print(f"profiled:  {profiler.samples} samples, hottest: {hottest[0][0].split(';')[-1] if hottest else None}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import contextlib
+import datetime
+import io
+import tempfile
+import time
+from src.api.fetch import Exchange
+from src.api.orchestrator import CollectionJob, CollectionOrchestrator
+from src.api.synthetic import order_book_frame
+
+
+class SlowSource:
+    """ Small synthetic days behind a fixed network latency, recording when each exchange was called. """
+
+    def __init__(self, latency, rows):
+        self.latency = latency
+        self.rows = rows
+        self.calls = []
+
+    def __call__(self, table, start, end, symbols=None, exchanges=None, **kwargs):
+        self.calls.append((exchanges[0], symbols[0], time.monotonic()))
+        time.sleep(self.latency)
+        return order_book_frame(self.rows, start=start, seed=start.toordinal())
+
+
+def finished_at(run, source, tmp):
+    """ Calls `run` and returns (total seconds, seconds until each job's last day was saved). """
+    started = time.monotonic()
+    finished = {}
+
+    def record(orchestrator):
+        base = orchestrator._record
+
+        def timed(job, result):
+            base(job, result)
+            finished[job.name] = time.monotonic() - started
+        orchestrator._record = timed
+        return orchestrator
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        run(record, source, tmp)
+    return time.monotonic() - started, finished
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to finish daily incrementals queued behind a large backfill.")
+    parser.add_argument('--backfill-days', type=int, default=120)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.2, help="Seconds per simulated fetch.")
+    parser.add_argument('--rate', type=float, default=20, help="Requests per second per exchange.")
+    args = parser.parse_args()
+
+    end = datetime.date(2023, 10, 9)
+    jobs = [CollectionJob('backfill', Exchange.BINANCE, "ETH-USDT", end - datetime.timedelta(days=args.backfill_days), end)]
+    for exchange, pair in ((Exchange.BINANCE, "BTC-USDT"), (Exchange.KUCOIN, "ETH-USDT"), (Exchange.OKX, "BTC-USDT")):
+        jobs.append(CollectionJob(f"daily {exchange.value} {pair}", exchange, pair, end - datetime.timedelta(days=1), end))
+    settings = dict(concurrency=args.concurrency, default_rate=args.rate, burst=args.concurrency)
+
+    def one_by_one(record, source, tmp):
+        # One orchestrator per job in config order, like looping over collect.py's single-pair scheduler.
+        for job in jobs:
+            record(CollectionOrchestrator([job], db_path=f"{tmp}/serial", source=source, **settings)).run()
+
+    def shared(record, source, tmp):
+        record(CollectionOrchestrator(jobs, db_path=f"{tmp}/shared", source=source, **settings)).run()
+
+    print(f"jobs:     backfill of {args.backfill_days + 1} days + {len(jobs) - 1} daily incrementals, "
+          f"{args.latency * 1000:.0f}ms per fetch, {args.rate:g} req/s per exchange")
+    for name, run in (('serial', one_by_one), ('shared', shared)):
+        with tempfile.TemporaryDirectory() as tmp:
+            total, finished = finished_at(run, SlowSource(args.latency, 100), tmp)
+        dailies = max(seconds for job, seconds in finished.items() if job != 'backfill')
+        print(f"{name}:   all done in {total:6.2f}s, incrementals done after {dailies:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
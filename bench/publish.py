@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import threading
+import time
+from src.api.fetch import Exchange
+from src.api.publish import BookPublisher, book_frames
+from src.api.synthetic import order_book_frame
+from src.common.codec import encode_book, topic
+from src.common.sock import AsyncSocketServer, SockClient, encode_frame
+from src.db.asset import LEVEL_COLUMNS
+from src.db.columnar import to_nanoseconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fan-out of BookPublisher to many subscribers, one topic each.")
+    parser.add_argument('--snapshots', type=int, default=50000)
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--pairs', type=int, default=2, help="Topics the clients are spread over.")
+    args = parser.parse_args()
+
+    frame = order_book_frame(args.snapshots)
+    received = to_nanoseconds(frame['received_time'])
+    origin = to_nanoseconds(frame['origin_time'])
+    sequence = frame['sequence_number'].to_numpy()
+    levels = frame[LEVEL_COLUMNS].to_numpy()
+
+    # Encoding cost: once per message for everyone vs once per message per client.
+    started = time.perf_counter()
+    book_frames(received, origin, sequence, levels)
+    once = time.perf_counter() - started
+    started = time.perf_counter()
+    for r, o, s, l in zip(received.tolist(), origin.tolist(), sequence.tolist(), levels):
+        encode_frame(encode_book(r, o, s, l))
+    per_message = (time.perf_counter() - started) * args.clients / args.pairs
+
+    loop = asyncio.new_event_loop()
+    server = AsyncSocketServer(port=0, max_queue=args.snapshots + 1)
+    loop.run_until_complete(server.start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    pairs = [f"PAIR{i}-USDT" for i in range(args.pairs)]
+    clients = [SockClient(port=server.port, topics=[topic('BINANCE', pairs[i % args.pairs])])
+               for i in range(args.clients)]
+    for client in clients:
+        client.connect()
+    while len(server.sessions) < args.clients:
+        time.sleep(0.01)
+    time.sleep(0.1)
+
+    started = time.perf_counter()
+    publisher = BookPublisher(server, Exchange.BINANCE, pairs[0])
+    publisher.publish(received, origin, sequence, levels)
+    expected = sum(1 for i in range(args.clients) if i % args.pairs == 0) * args.snapshots
+    delivered = [0] * args.clients
+    while sum(delivered) < expected and time.perf_counter() - started < 60:
+        for i, client in enumerate(clients):
+            delivered[i] += len(client.receive_batch())
+    elapsed = time.perf_counter() - started
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+
+    print(f"snapshots: {args.snapshots:,} to {args.clients} clients over {args.pairs} topics")
+    print(f"encode:    once {once * 1000:.1f}ms, per client {per_message * 1000:.1f}ms "
+          f"({per_message / once:.0f}x)")
+    print(f"delivered: {sum(delivered):,} of {expected:,} frames in {elapsed:.2f}s "
+          f"({sum(delivered) / elapsed:,.0f} frames/sec), other topics got "
+          f"{sum(d for i, d in enumerate(delivered) if i % args.pairs):,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import asyncio
+import time
+from src.common.sock import AsyncSocketServer, read_frame
+
+
+async def subscriber(port, received, slow):
+    reader, writer = await asyncio.open_connection('localhost', port)
+    try:
+        while True:
+            await read_frame(reader)
+            received[0] += 1
+            if slow:
+                await asyncio.sleep(0.001)
+    except asyncio.IncompleteReadError:
+        pass
+    finally:
+        writer.close()
+
+
+async def run(clients, messages, size, slow_clients, max_queue, policy, burst):
+    server = AsyncSocketServer(port=0, max_queue=max_queue, policy=policy)
+    await server.start()
+    counters = [[0] for _ in range(clients)]
+    tasks = [asyncio.create_task(subscriber(server.port, counters[i], i < slow_clients))
+             for i in range(clients)]
+    while len(server.sessions) < clients:
+        await asyncio.sleep(0.01)
+
+    payload = b'x' * size
+    started = time.perf_counter()
+    for i in range(messages):
+        server.broadcast(payload)
+        if i % burst == 0:
+            await asyncio.sleep(0)  # Let the senders run, as a live feed would between bursts.
+    # Wait until every queue has been flushed and the subscribers have read what was sent.
+    while any(s['queued'] for s in server.stats()) or \
+            sum(c[0] for c in counters) < sum(s['messages_sent'] for s in server.stats()):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+
+    stats = server.stats()
+    for task in tasks:
+        task.cancel()
+    await server.stop()
+    delivered = sum(c[0] for c in counters)
+    print(f"clients:   {clients} ({slow_clients} slow)")
+    print(f"messages:  {messages} x {size} bytes")
+    print(f"fan-out:   {delivered / elapsed:,.0f} msgs/sec delivered in {elapsed:.2f}s")
+    print(f"dropped:   {sum(s['dropped'] for s in stats)}, coalesced: {sum(s['coalesced'] for s in stats)}")
+    print(f"max lag:   {max(s['lag_seconds'] for s in stats):.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-generate against AsyncSocketServer.")
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--slow-clients', type=int, default=10)
+    parser.add_argument('--max-queue', type=int, default=256)
+    parser.add_argument('--policy', default='drop_oldest')
+    parser.add_argument('--burst', type=int, default=10, help="Messages broadcast between event loop yields.")
+    args = parser.parse_args()
+    asyncio.run(run(args.clients, args.messages, args.size, args.slow_clients, args.max_queue, args.policy, args.burst))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+from src.analysis.spectral import SpectralAnalyzer
+from src.api.fetch import Exchange
+from src.api.publish import BookPublisher
+from src.api.synthetic import order_book_frame
+from src.common.codec import topic
+from src.common.sock import AsyncSocketServer, SockClient
+from src.db.asset import AssetPairDbManager, LEVEL_COLUMNS
+from src.db.columnar import to_nanoseconds
+from src.db.impute import Imputer
+
+STAGES = ('ingest', 'read', 'gaps', 'impute', 'fft', 'fanout', 'cnn_preprocess')
+START = datetime.datetime(2022, 1, 1)
+
+
+def timed(function, *args, **kwargs):
+    """ Runs `function` with its stdout chatter swallowed and returns (result, seconds). """
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def book_with_gaps(rows, gaps, seed):
+    """
+    The synthetic book of `rows` 100ms snapshots with `gaps` two-minute holes cut out at even intervals.
+
+    Returns:
+        tuple: (frame, [(first missing, first present after) datetime per hole]).
+    """
+    frame = order_book_frame(rows, start=START, seed=seed)
+    hole = 1200
+    keep = np.ones(rows, dtype=bool)
+    holes = []
+    for i in range(1, gaps + 1):
+        first = i * rows // (gaps + 1)
+        keep[first:first + hole] = False
+        holes.append((frame['received_time'].iloc[first], frame['received_time'].iloc[first + hole]))
+    return frame[keep].reset_index(drop=True), holes
+
+
+def bench_ingest(args, tmp, frame):
+    rows = min(len(frame), args.save_rows)
+    legacy = AssetPairDbManager(Exchange.BINANCE, "ETH-USDT", db_path=f"{tmp}/save")
+    db = AssetPairDbManager(Exchange.BINANCE, "ETH-USDT", db_path=tmp)
+    _, save_seconds = timed(legacy.save, frame.iloc[:rows])
+    _, bulk_seconds = timed(db.bulk_save, frame)
+    return db, {
+        'save_rows_per_sec': rows / save_seconds,
+        'bulk_save_rows_per_sec': len(frame) / bulk_seconds,
+    }
+
+
+def bench_read(db, end):
+    (timestamps, _), read_seconds = timed(db.read_range, START, end)
+    streamed, iter_seconds = timed(lambda: sum(len(t) for t, _ in db.iter_range(START, end)))
+    retrieved, retrieve_seconds = timed(db.retrieve, START, end)
+    return {
+        'read_range_rows_per_sec': len(timestamps) / read_seconds,
+        'iter_range_rows_per_sec': streamed / iter_seconds,
+        'retrieve_rows_per_sec': len(retrieved) / retrieve_seconds,
+    }
+
+
+def bench_gaps(db, end, holes):
+    scanned, scan_seconds = timed(db.find_gaps, START, end, datetime.timedelta(seconds=1))
+    summarized, cold_seconds = timed(db.find_gaps, START, end)
+    _, warm_seconds = timed(db.find_gaps, START, end)
+    if len(scanned) != len(holes) or len(summarized) != len(holes):
+        raise AssertionError(f"Expected {len(holes)} gaps, found {len(scanned)} scanning and {len(summarized)} from coverage")
+    return scanned, {
+        'gaps': len(holes),
+        'scan_seconds': scan_seconds,
+        'coverage_cold_seconds': cold_seconds,
+        'coverage_warm_seconds': warm_seconds,
+    }
+
+
+def bench_impute(db, gaps):
+    rows, seconds = timed(Imputer(db).fill, gaps)
+    return {'rows': rows, 'rows_per_sec': rows / seconds}
+
+
+def bench_fft(db, end, frame):
+    columns = [column for column in LEVEL_COLUMNS if column.endswith('_price')]
+    analyzer = SpectralAnalyzer(db, columns, cache_dir=None)
+    (_, _, segments), seconds = timed(analyzer.welch, START, end)
+    return {
+        'segments': segments,
+        'columns': len(columns),
+        'welch_samples_per_sec': len(frame) / seconds,
+    }
+
+
+def bench_fanout(args, frame):
+    received = to_nanoseconds(frame['received_time'])
+    origin = to_nanoseconds(frame['origin_time'])
+    sequence = frame['sequence_number'].to_numpy()
+    levels = frame[LEVEL_COLUMNS].to_numpy()
+    count = min(len(frame), args.fanout_messages)
+
+    loop = asyncio.new_event_loop()
+    server = AsyncSocketServer(port=0, max_queue=count + 1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        loop.run_until_complete(server.start())
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        clients = [SockClient(port=server.port, topics=[topic('BINANCE', 'ETH-USDT')]) for _ in range(args.clients)]
+        for client in clients:
+            client.connect()
+        while len(server.sessions) < args.clients:
+            time.sleep(0.01)
+        time.sleep(0.1)  # Let the subscriptions arrive.
+
+        started = time.perf_counter()
+        BookPublisher(server, Exchange.BINANCE, "ETH-USDT").publish(received[:count], origin[:count],
+                                                                     sequence[:count], levels[:count])
+        delivered = 0
+        while delivered < count * args.clients and time.perf_counter() - started < 60:
+            delivered += sum(len(client.receive_batch()) for client in clients)
+        elapsed = time.perf_counter() - started
+        for client in clients:
+            client.close()
+        asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+    return {
+        'clients': args.clients,
+        'messages': count,
+        'delivered': delivered,
+        'msgs_per_sec': delivered / elapsed,
+    }
+
+
+def bench_cnn_preprocess(db, end, frame):
+    try:
+        from src.training.cnn import CNNModel
+        from src.training.pipeline import OrderBookDataset
+    except ImportError as e:
+        return {'skipped': str(e)}
+    cnn = CNNModel(db)
+    stats, stats_seconds = timed(cnn.fit_stats, START, end)
+    _, preprocess_seconds = timed(cnn.preprocess_data, frame)
+    # No shard cache, so every shard is read and preprocessed rather than loaded from an earlier run.
+    dataset = OrderBookDataset(db, START, end, window=cnn.window, levels=cnn.levels, horizon=cnn.horizon, stats=stats,
+                               cache_dir=None)
+    rows, shard_seconds = timed(lambda: sum(len(dataset.load_shard(i)[0]) for i in range(len(dataset.shards))))
+    return {
+        'fit_stats_rows_per_sec': len(frame) / stats_seconds,
+        'preprocess_rows_per_sec': len(frame) / preprocess_seconds,
+        'load_shard_rows_per_sec': rows / shard_seconds,
+    }
+
+
+def run(args):
+    """ Runs the selected stages on one synthetic book and returns the report. """
+    frame, holes = book_with_gaps(args.rows, args.gaps, args.seed)
+    end = frame['received_time'].iloc[-1].to_pydatetime()
+    results = {}
+
+    def stage(name, function, *stage_args):
+        if name not in args.stages:
+            return None
+        print(f"{name}...", file=sys.stderr)
+        output = function(*stage_args)
+        metrics = output[-1] if isinstance(output, tuple) else output
+        results[name] = metrics
+        return output
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Every later stage reads the database written here, so ingest always runs.
+        db, metrics = bench_ingest(args, tmp, frame)
+        if 'ingest' in args.stages:
+            results['ingest'] = metrics
+        stage('read', bench_read, db, end)
+        found = stage('gaps', bench_gaps, db, end, holes)
+        gaps = found[0] if found else db.find_gaps(START, end, datetime.timedelta(seconds=1))
+        stage('fft', bench_fft, db, end, frame)
+        stage('cnn_preprocess', bench_cnn_preprocess, db, end, frame)
+        # Imputing adds rows, so it runs after the stages that read the book as generated.
+        stage('impute', bench_impute, db, gaps)
+        db.close()
+    stage('fanout', bench_fanout, args, frame)
+
+    return {'meta': meta(args), 'results': results}
+
+
+def meta(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'rows': args.rows,
+        'gaps': args.gaps,
+        'seed': args.seed,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """
+    Prints every throughput metric against a baseline report.
+
+    Returns:
+        list: (stage, metric, ratio) of the metrics slower than `tolerance` times the baseline.
+    """
+    regressions = []
+    for name, metrics in report['results'].items():
+        for metric, value in metrics.items():
+            before = baseline['results'].get(name, {}).get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(before, (int, float)) or not before:
+                continue
+            # Rates are better higher, durations better lower; counts are only checked for equality.
+            if metric.endswith('_per_sec'):
+                ratio = value / before
+            elif metric.endswith('_seconds'):
+                ratio = before / value if value else float('inf')
+            else:
+                if value != before:
+                    print(f"{name}.{metric}: {before} -> {value} (inputs differ)")
+                continue
+            flag = "  REGRESSION" if ratio < tolerance else ""
+            print(f"{name}.{metric}: {before:,.4g} -> {value:,.4g} ({ratio:.2f}x){flag}")
+            if flag:
+                regressions.append((name, metric, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmarks on a synthetic order book, as JSON.")
+    parser.add_argument('--rows', type=int, default=300000, help="Synthetic 100ms snapshots before the gaps are cut.")
+    parser.add_argument('--gaps', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save-rows', type=int, default=20000, help="Rows written with the slow per-row `save`.")
+    parser.add_argument('--clients', type=int, default=10)
+    parser.add_argument('--fanout-messages', type=int, default=50000)
+    parser.add_argument('--stages', nargs='+', default=list(STAGES), choices=STAGES)
+    parser.add_argument('--output', help="Write the report here instead of stdout.")
+    parser.add_argument('--compare', help="Baseline report to compare against.")
+    parser.add_argument('--tolerance', type=float, default=0.8,
+                        help="Flag metrics below this fraction of the baseline.")
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        with contextlib.redirect_stdout(sys.stderr):
+            regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import argparse
+import datetime
+import tempfile
+import time
+from src.api.fetch import Exchange
+from src.api.synthetic import order_book_frame
+from src.db.asset import AssetPairDbManager
+from src.training.cnn import CNNModel
+
+
+def iterate(dataset):
+    """ Drains one epoch of the input pipeline alone and returns (steps, steps/sec). """
+    started = time.perf_counter()
+    steps = sum(1 for _ in dataset)
+    return steps, steps / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU steps/sec of the CNN input pipeline and training loop.")
+    parser.add_argument('--rows', type=int, default=200000, help="Synthetic snapshots, 100ms apart.")
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--stride', type=int, default=4)
+    parser.add_argument('--epochs', type=int, default=2)
+    args = parser.parse_args()
+
+    frame = order_book_frame(args.rows)
+    start = frame['received_time'].iloc[0].to_pydatetime()
+    end = frame['received_time'].iloc[-1].to_pydatetime() + datetime.timedelta(seconds=1)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = AssetPairDbManager(Exchange.BINANCE, "ETH-USDT", db_path=tmp)
+        db.bulk_save(frame)
+
+        model = CNNModel(db)
+        source = model.dataset(start, end, stride=args.stride, cache_dir=f"{tmp}/tensors")
+        dataset = source.dataset(args.batch_size)
+        steps, cold = iterate(dataset)
+        print(f"pipeline, first epoch (SQLite): {cold:,.1f} steps/sec over {steps} steps, {source.reads} shard reads")
+        _, warm = iterate(dataset)
+        print(f"pipeline, cached epoch:         {warm:,.1f} steps/sec ({warm / cold:.1f}x)")
+
+        print(f"training {args.epochs} epochs on CPU:")
+        model.train(start, end, args.epochs, args.batch_size, stride=args.stride, cache_dir=f"{tmp}/tensors")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import time
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+from mplfinance.original_flavor import candlestick_ohlc
+from src.ui.render import CandleRenderer
+
+BAR_SECONDS = 60
+
+
+def random_bars(count, seed=0):
+    """ (count, 5) rows of time, open, high, low, close from a random walk. """
+    rng = np.random.default_rng(seed)
+    closes = 3000 + np.cumsum(rng.normal(0, 2, count))
+    opens = np.concatenate([[3000], closes[:-1]])
+    spread = np.abs(rng.normal(0, 1, (count, 2)))
+    times = 1.64e9 + BAR_SECONDS * np.arange(count)
+    return np.column_stack([times, opens, np.maximum(opens, closes) + spread[:, 0],
+                            np.minimum(opens, closes) - spread[:, 1], closes])
+
+
+def legacy_frame(fig, ax, bars):
+    """ The original MarketUI.update_plot: clear, rebuild every candle, lay out and draw. """
+    ax.clear()
+    candlestick_ohlc(ax, bars.tolist(), width=0.6, colorup='g', colordown='r')
+    plt.tight_layout()
+    fig.canvas.draw()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless frame times of the legacy and incremental chart renderers.")
+    parser.add_argument('--bars', type=int, default=10000)
+    parser.add_argument('--frames', type=int, default=20, help="Frames timed per session length.")
+    args = parser.parse_args()
+
+    bars = random_bars(args.bars)
+    checkpoints = [n for n in (100, 1000, 10000, 100000) if n < args.bars] + [args.bars]
+
+    fig, ax = plt.subplots(figsize=(12, 6), dpi=100)
+    renderer = CandleRenderer(ax, bar_seconds=BAR_SECONDS, capacity=args.bars)
+    frame_times = []
+    for i, bar in enumerate(bars):
+        renderer.update_candle(*bar)
+        if i % 10 == 0:
+            renderer.add_execution(bar[0], 'buy' if i % 20 else 'sell', bar[4])
+        started = time.perf_counter()
+        renderer.draw()
+        frame_times.append(time.perf_counter() - started)
+    frame_times = np.array(frame_times) * 1000
+    plt.close(fig)
+
+    print(f"{'bars':>8} {'legacy ms':>10} {'incremental ms':>15} {'p99 ms':>8}")
+    for count in checkpoints:
+        fig, ax = plt.subplots(figsize=(12, 6), dpi=100)
+        started = time.perf_counter()
+        repeats = max(1, min(args.frames, 10000 // count))
+        for _ in range(repeats):
+            legacy_frame(fig, ax, bars[:count])
+        legacy = (time.perf_counter() - started) / repeats * 1000
+        plt.close(fig)
+        recent = frame_times[max(0, count - args.frames * 10):count]
+        print(f"{count:>8} {legacy:>10.1f} {recent.mean():>15.2f} {np.percentile(recent, 99):>8.2f}")
+    print(f"incremental full redraws: {renderer.full_draws} of {len(bars)} frames")
+
+
+if __name__ == "__main__":
+    main()
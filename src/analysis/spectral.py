@@ -0,0 +1,149 @@
+import datetime
+import hashlib
+import os
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class UniformResampler:
+    """
+    Resamples an unevenly timed stream onto a uniform grid, one chunk at a time.
+
+    Each grid point takes the last observation at or before it (sample and hold), and the last
+    observation of a chunk is carried into the next one, so chunk boundaries leave no seams.
+    """
+
+    def __init__(self, step_ns):
+        self.step_ns = step_ns
+        self.next_ns = None
+        self.carry = None
+
+    def push(self, timestamps, values):
+        """
+        Args:
+            timestamps (np.ndarray): Sorted int64 nanoseconds, shape (n,).
+            values (np.ndarray): float64 values, shape (n, columns).
+
+        Returns:
+            tuple: (grid, samples) for the grid points up to the last timestamp of this chunk.
+        """
+        if len(timestamps) == 0:
+            return np.empty(0, dtype=np.int64), np.empty((0, values.shape[1]))
+        if self.next_ns is None:
+            # Start on the first grid point at or after the first observation.
+            self.next_ns = -(-int(timestamps[0]) // self.step_ns) * self.step_ns
+        grid = np.arange(self.next_ns, int(timestamps[-1]) + 1, self.step_ns, dtype=np.int64)
+        index = np.searchsorted(timestamps, grid, side='right') - 1
+        samples = values[np.maximum(index, 0)]
+        if self.carry is not None:
+            samples[index < 0] = self.carry
+        if len(grid):
+            self.next_ns = int(grid[-1]) + self.step_ns
+        self.carry = values[-1]
+        return grid, samples
+
+
+class SpectralAnalyzer:
+    """
+    Spectral analysis of order book columns over arbitrarily long windows in bounded memory.
+
+    The book is streamed out of the database with `iter_range`, resampled onto a uniform grid and
+    cut into overlapping, windowed segments. All segments available in a chunk are transformed by a
+    single batched `rfft` over (segments, columns, samples). Welch estimates are persisted under
+    `cache_dir` with the signatures of the days they cover (`AssetPairDbManager.day_signatures`),
+    so analysing the same window again is a file read until one of those days receives rows.
+    """
+
+    def __init__(self, db, columns, step=datetime.timedelta(milliseconds=100), nperseg=4096, noverlap=2048,
+                 cache_dir="data/spectra"):
+        """
+        Args:
+            db (AssetPairDbManager): Source of the order book.
+            columns (list): Level columns to analyse, e.g. the 40 bid/ask price columns.
+            step (datetime.timedelta): Spacing of the uniform grid.
+            nperseg (int): Samples per segment.
+            noverlap (int): Samples shared by consecutive segments.
+            cache_dir (str): Directory for persisted Welch estimates. None disables persistence.
+        """
+        if not 0 <= noverlap < nperseg:
+            raise ValueError("noverlap must be in [0, nperseg)")
+        self.db = db
+        self.columns = list(columns)
+        self.step_ns = int(step / datetime.timedelta(microseconds=1)) * 1000
+        self.nperseg = nperseg
+        self.noverlap = noverlap
+        self.cache_dir = cache_dir
+        self.window = np.hanning(nperseg + 1)[:-1]  # Periodic Hann, as scipy uses for spectral analysis.
+        self.freqs = np.fft.rfftfreq(nperseg, d=self.step_ns / 1e9)
+
+    def iter_stft(self, start, end):
+        """
+        Yields the windowed spectra of consecutive segments over [start, end].
+
+        Yields:
+            tuple: (segment_starts, spectra) where segment_starts is int64 ns of shape (m,) and
+                spectra is complex of shape (m, nperseg // 2 + 1, columns).
+        """
+        resampler = UniformResampler(self.step_ns)
+        hop = self.nperseg - self.noverlap
+        buffer = np.empty((0, len(self.columns)))
+        buffer_grid = np.empty(0, dtype=np.int64)
+        for timestamps, values in self.db.iter_range(start, end, self.columns):
+            grid, samples = resampler.push(timestamps, values)
+            buffer = np.concatenate([buffer, samples])
+            buffer_grid = np.concatenate([buffer_grid, grid])
+            if len(buffer) < self.nperseg:
+                continue
+            # Zero-copy (segments, columns, nperseg) view of every full segment in the buffer.
+            segments = sliding_window_view(buffer, self.nperseg, axis=0)[::hop]
+            segments = segments - segments.mean(axis=2, keepdims=True)
+            spectra = np.fft.rfft(segments * self.window, axis=2).transpose(0, 2, 1)
+            consumed = len(segments) * hop
+            yield buffer_grid[:consumed:hop], spectra
+            buffer, buffer_grid = buffer[consumed:], buffer_grid[consumed:]
+
+    def welch(self, start, end, refresh=False):
+        """
+        Welch power spectral density of every column over [start, end].
+
+        Args:
+            refresh (bool): Recompute even if an up-to-date persisted estimate exists.
+
+        Returns:
+            tuple: (freqs, psd, segments) with psd of shape (nperseg // 2 + 1, columns) in units² / Hz.
+                psd is None if the window holds less than one segment.
+        """
+        path = self._cache_path(start, end)
+        signature = None
+        if path is not None:
+            # Backfills, gap fills and imputation change the days' signatures and so invalidate the estimate.
+            signature = repr(list(self.db.day_signatures(start.date(), end.date())))
+            if not refresh and os.path.exists(path):
+                cached = np.load(path)
+                if 'signature' in cached.files and str(cached['signature']) == signature:
+                    return cached['freqs'], cached['psd'], int(cached['segments'])
+
+        total = np.zeros((len(self.freqs), len(self.columns)))
+        segments = 0
+        for _, spectra in self.iter_stft(start, end):
+            total += (np.abs(spectra) ** 2).sum(axis=0)
+            segments += len(spectra)
+        if segments == 0:
+            return self.freqs, None, 0
+
+        # One-sided density scaling, as scipy.signal.welch(scaling='density').
+        psd = total / segments / ((1e9 / self.step_ns) * (self.window ** 2).sum())
+        psd[1:-1 if self.nperseg % 2 == 0 else None] *= 2
+        if path is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.savez(path, freqs=self.freqs, psd=psd, segments=segments, signature=signature)
+        return self.freqs, psd, segments
+
+    def _cache_path(self, start, end):
+        if self.cache_dir is None:
+            return None
+        key = "|".join([
+            self.db.db_file, getattr(self.db, 'backend', 'sqlite'), ",".join(self.columns),
+            start.isoformat(), end.isoformat(), str(self.step_ns), str(self.nperseg), str(self.noverlap)
+        ])
+        return os.path.join(self.cache_dir, f"{hashlib.sha1(key.encode()).hexdigest()}.npz")
@@ -0,0 +1,199 @@
+import collections
+import datetime
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from .fetch import MarketDataFetcher
+
+DayResult = collections.namedtuple('DayResult', ['day', 'rows', 'fetch_seconds', 'save_seconds', 'attempts', 'error'])
+
+
+def fetch_day(exchange, asset_pair, start, end, max_retries=3, backoff=2.0, cache=None, source=None):
+    """
+    Fetches one window, retrying with exponential backoff.
+
+    Module level so it can be shipped to a process pool.
+
+    Returns:
+        tuple: (data, fetch_seconds, attempts)
+    """
+    fetcher = MarketDataFetcher(exchange, asset_pair, source=source, cache=cache)
+    started = time.perf_counter()
+    for attempt in range(1, max_retries + 2):
+        try:
+            data = fetcher.fetch(start, end)
+            return data, time.perf_counter() - started, attempt
+        except Exception:
+            if attempt > max_retries:
+                raise
+            time.sleep(backoff * 2 ** (attempt - 1))
+
+
+class BackfillCheckpoint:
+    """
+    Records completed days in a small JSON file so an interrupted backfill resumes where it stopped.
+
+    Days that fetched no rows are recorded apart from the completed ones and fetched again by the
+    next run, since an empty day is more often a source outage than a day without a book.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = set()
+        self.empty = set()
+        self.through = None  # Every day up to and including this one is complete.
+        self.exists = os.path.exists(path)
+        if self.exists:
+            with open(path) as f:
+                state = json.load(f)
+            self.completed = {datetime.date.fromisoformat(day) for day in state['completed']}
+            self.empty = {datetime.date.fromisoformat(day) for day in state.get('empty', [])}
+            if state.get('through'):
+                self.through = datetime.date.fromisoformat(state['through'])
+
+    def __contains__(self, day):
+        return day in self.completed or (self.through is not None and day <= self.through)
+
+    def seed(self, db):
+        """
+        Starts a new checkpoint from the rows already in `db`: the days before its latest snapshot
+        count as complete, so a database filled before checkpoints existed resumes from its last
+        day instead of fetching everything again. Does nothing once the checkpoint has been saved.
+        """
+        if self.exists:
+            return
+        latest = db.get_latest_timestamp()
+        if latest is None:
+            return
+        # The latest day may have been cut short, so it is fetched again; rows already stored are ignored on save.
+        self.through = latest.date() - datetime.timedelta(days=1)
+        self._write()
+
+    def mark(self, day):
+        """ Marks a day complete and persists the checkpoint atomically. """
+        self.completed.add(day)
+        self.empty.discard(day)
+        self._write()
+
+    def mark_empty(self, day):
+        """ Records a day that fetched no rows. It isn't complete, so the next run fetches it again. """
+        self.empty.add(day)
+        self._write()
+
+    def _write(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'completed': sorted(d.isoformat() for d in self.completed),
+                'empty': sorted(d.isoformat() for d in self.empty),
+                'through': self.through.isoformat() if self.through is not None else None,
+            }, f)
+        os.replace(tmp_path, self.path)
+        self.exists = True
+
+
+class BackfillScheduler:
+    """
+    Fetches many day windows concurrently and saves them through a single writer.
+
+    Fetches run on a thread or process pool while the calling thread saves finished days to
+    the database as they arrive, so fetching and writing overlap. Each saved day is checkpointed,
+    and days that still fail after their retries or fetch no rows are reported and left for the
+    next run. Without a checkpoint file, the run resumes from the latest snapshot in the database.
+    """
+
+    def __init__(self, exchange, asset_pair, db, concurrency=4, executor='thread',
+                 max_retries=3, backoff=2.0, checkpoint_path=None, cache=None):
+        """
+        Args:
+            exchange (Exchange): Exchange to fetch from.
+            asset_pair (str): Asset pair, e.g. "ETH-USDT".
+            db (AssetPairDbManager): Destination database. Only this scheduler's thread writes to it.
+            concurrency (int): Number of fetches in flight.
+            executor (str): 'thread' or 'process'.
+            max_retries (int): Retries per day after the first failed attempt.
+            backoff (float): Seconds before the first retry, doubled on each further retry.
+            checkpoint_path (str): Checkpoint file. Defaults to `<db file>.backfill.json`.
+            cache (FetchCache): Optional on-disk cache shared by the fetch workers.
+        """
+        if executor not in ('thread', 'process'):
+            raise ValueError(f"Unknown executor '{executor}', expected 'thread' or 'process'")
+        self.exchange = exchange
+        self.asset_pair = asset_pair
+        self.db = db
+        self.concurrency = concurrency
+        self.executor = executor
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache = cache
+        self.checkpoint = BackfillCheckpoint(checkpoint_path or f"{os.path.splitext(db.db_file)[0]}.backfill.json")
+        self.checkpoint.seed(db)
+
+    def pending_days(self, start_date, end_date):
+        """ Lists the days in [start_date, end_date] that are not checkpointed yet. """
+        days = []
+        current = start_date.date() if isinstance(start_date, datetime.datetime) else start_date
+        last = end_date.date() if isinstance(end_date, datetime.datetime) else end_date
+        while current <= last:
+            if current not in self.checkpoint:
+                days.append(current)
+            current += datetime.timedelta(days=1)
+        return days
+
+    def run(self, start_date, end_date):
+        """
+        Backfills every pending day in [start_date, end_date].
+
+        Returns:
+            list: One DayResult per attempted day, in completion order.
+        """
+        days = collections.deque(self.pending_days(start_date, end_date))
+        print(f"Backfilling {len(days)} days for {self.exchange.value} {self.asset_pair}...")
+        pool_class = ThreadPoolExecutor if self.executor == 'thread' else ProcessPoolExecutor
+        results = []
+        with pool_class(max_workers=self.concurrency) as pool:
+            in_flight = {}
+
+            def submit():
+                # Keep a bounded number of fetched-but-unsaved days in memory.
+                while days and len(in_flight) < self.concurrency * 2:
+                    day = days.popleft()
+                    start = datetime.datetime.combine(day, datetime.time())
+                    future = pool.submit(fetch_day, self.exchange, self.asset_pair, start,
+                                         start + datetime.timedelta(days=1), self.max_retries, self.backoff, self.cache)
+                    in_flight[future] = day
+
+            submit()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    day = in_flight.pop(future)
+                    results.append(self._save(day, future))
+                submit()
+        failed = [r for r in results if r.error is not None]
+        empty = [r for r in results if r.error is None and not r.rows]
+        print(f"Backfill finished: {len(results) - len(failed) - len(empty)} days saved, {len(empty)} empty, "
+              f"{len(failed)} failed.")
+        return results
+
+    def _save(self, day, future):
+        try:
+            data, fetch_seconds, attempts = future.result()
+        except Exception as e:
+            print(f"{day}: fetch failed after {self.max_retries + 1} attempts: {e}")
+            return DayResult(day, 0, None, None, self.max_retries + 1, e)
+
+        started = time.perf_counter()
+        try:
+            if data.empty:
+                self.checkpoint.mark_empty(day)
+            else:
+                self.db.bulk_save(data)
+                self.checkpoint.mark(day)
+        except Exception as e:
+            print(f"{day}: save failed: {e}")
+            return DayResult(day, 0, fetch_seconds, None, attempts, e)
+        save_seconds = time.perf_counter() - started
+        print(f"{day}: {len(data)} rows, fetch {fetch_seconds:.2f}s ({attempts} attempts), save {save_seconds:.2f}s")
+        return DayResult(day, len(data), fetch_seconds, save_seconds, attempts, None)
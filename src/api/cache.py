@@ -0,0 +1,135 @@
+import datetime
+import hashlib
+import os
+import uuid
+import pandas as pd
+from pyarrow.lib import ArrowInvalid
+
+
+class FetchCache:
+    """
+    Size-bounded, content-addressed on-disk cache of fetched market data.
+
+    Requests are split into aligned partitions (one hour by default). Each partition is stored
+    as a zstd-compressed Parquet file named by the hash of (table, exchange, symbol, start, end),
+    so overlapping and sub-range requests are answered from whichever partitions already exist,
+    and only the missing spans go back to the data source. Partitions that came back empty are not
+    cached, so they are asked for again. Once the cache grows past `max_bytes` the least recently
+    used partitions are evicted.
+    """
+
+    def __init__(self, root="data/cache", max_bytes=10 * 1024 ** 3, partition=datetime.timedelta(hours=1)):
+        """
+        Args:
+            root (str): Directory holding the cached partitions.
+            max_bytes (int): Upper bound on the total size of the cache.
+            partition (datetime.timedelta): Partition length. Requests are widened to partition boundaries.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.partition = partition
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, table, exchange, symbol, start, end):
+        key = f"{table}|{exchange}|{symbol}|{start.isoformat()}|{end.isoformat()}"
+        return os.path.join(self.root, f"{hashlib.sha1(key.encode()).hexdigest()}.parquet")
+
+    def _partitions(self, start, end):
+        """ Lists the aligned (start, end) partitions covering [start, end). """
+        epoch = datetime.datetime(1970, 1, 1)
+        current = epoch + ((start - epoch) // self.partition) * self.partition
+        partitions = []
+        while current < end:
+            partitions.append((current, current + self.partition))
+            current += self.partition
+        return partitions
+
+    def load(self, loader, table, exchange, symbol, start, end):
+        """
+        Returns the rows in [start, end), fetching only the partitions that are not cached.
+
+        Args:
+            loader (callable): `loader(start, end)` returning a DataFrame with a `received_time`
+                column, called once per contiguous run of missing partitions.
+            table (str): Source table, e.g. "book".
+            exchange (str): Exchange name.
+            symbol (str): Asset pair.
+            start (datetime.datetime): Inclusive start of the window.
+            end (datetime.datetime): Exclusive end of the window.
+        """
+        partitions = self._partitions(start, end)
+        frames = {}
+        missing = []
+        for partition in partitions:
+            path = self._path(table, exchange, symbol, *partition)
+            try:
+                frames[partition] = pd.read_parquet(path)
+                os.utime(path)  # mtime doubles as the LRU access time.
+            except FileNotFoundError:
+                missing.append(partition)
+            except (ArrowInvalid, OSError) as e:
+                # A corrupt or truncated entry is dropped and fetched again rather than failing every load.
+                print(f"Discarding unreadable cache entry {path}: {e}")
+                self._remove(path)
+                missing.append(partition)
+
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)  # Partitions are naive UTC.
+        for span_start, span_end in self._coalesce(missing):
+            data = loader(span_start, span_end)
+            for partition in self._partitions(span_start, span_end):
+                rows = data[(data['received_time'] >= partition[0]) & (data['received_time'] < partition[1])] \
+                    if not data.empty else data
+                frames[partition] = rows
+                # Don't cache partitions that may still be receiving data upstream, nor empty ones: an
+                # empty response is more often a source outage than an hour without a book.
+                if partition[1] <= now and not rows.empty:
+                    self._write(self._path(table, exchange, symbol, *partition), rows)
+        if missing:
+            self.evict()
+
+        non_empty = [frames[p] for p in partitions if not frames[p].empty]
+        if not non_empty:
+            return pd.DataFrame()
+        data = pd.concat(non_empty, ignore_index=True)
+        return data[(data['received_time'] >= start) & (data['received_time'] < end)].reset_index(drop=True)
+
+    @staticmethod
+    def _coalesce(partitions):
+        """ Merges adjacent partitions so each missing run costs one request. """
+        spans = []
+        for partition_start, partition_end in partitions:
+            if spans and spans[-1][1] == partition_start:
+                spans[-1] = (spans[-1][0], partition_end)
+            else:
+                spans.append((partition_start, partition_end))
+        return spans
+
+    def _write(self, path, dataframe):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        dataframe.to_parquet(tmp_path, compression='zstd', index=False)
+        os.replace(tmp_path, path)
+
+    def size(self):
+        """ Total size of the cached partitions in bytes. """
+        return sum(entry.stat().st_size for entry in os.scandir(self.root) if entry.name.endswith('.parquet'))
+
+    def evict(self):
+        """ Removes least recently used partitions until the cache fits in `max_bytes`. """
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith('.parquet'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # Removed concurrently by another fetcher.
@@ -2,6 +2,7 @@ import enum
 from lakeapi import load_data
 import pandas as pd
 from tabulate import tabulate
+from ..common import metrics
 
 class Exchange(enum.Enum):
     """Supported exchanges enumeration."""
@@ -20,11 +21,22 @@ class Exchange(enum.Enum):
     COINMATE = "COINMATE"
 
 class MarketDataFetcher:
-    def __init__(self, exchange, asset_pair):
+    def __init__(self, exchange, asset_pair, source=None, cache=None):
+        """
+        Args:
+            exchange (Exchange): The exchange to fetch from.
+            asset_pair (str): The asset pair, e.g. "ETH-USDT".
+            source (callable): Data source with the `lakeapi.load_data` signature. Defaults to lakeapi;
+                pass e.g. a SyntheticSource to work offline.
+            cache (FetchCache): Optional on-disk cache consulted before the source.
+        """
         self.exchange = exchange
         self.asset_pair = asset_pair
+        self.source = source or load_data
+        self.cache = cache
         self.data = pd.DataFrame()  # Initialize an empty DataFrame
 
+    @metrics.timed('fetch')
     def fetch(self, start, end):
         """
         Fetches data from the API and stores it in self.data.
@@ -33,7 +45,15 @@ class MarketDataFetcher:
             start (datetime.datetime): The start datetime for the data.
             end (datetime.datetime): The end datetime for the data.
         """
-        self.data = load_data(
+        if self.cache is not None:
+            self.data = self.cache.load(self._load, "book", self.exchange.value, self.asset_pair, start, end)
+        else:
+            self.data = self._load(start, end)
+        metrics.inc('fetch.rows', len(self.data))
+        return self.data
+
+    def _load(self, start, end):
+        return self.source(
             table="book",
             start=start,
             end=end,
@@ -42,7 +62,6 @@ class MarketDataFetcher:
             use_threads=True,
             drop_partition_cols=True
         )
-        return self.data
 
     def print(self):
         """
@@ -0,0 +1,351 @@
+import collections
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from .backfill import BackfillCheckpoint, DayResult, fetch_day
+from .fetch import Exchange
+from ..db.asset import AssetPairDbManager
+
+CollectionJob = collections.namedtuple('CollectionJob', ['name', 'exchange', 'asset_pair', 'start', 'end'])
+
+
+def load_jobs(path, today=None):
+    """
+    Reads a collection config.
+
+    The file is JSON with a list of jobs and optional orchestrator settings, e.g.
+
+        {
+            "concurrency": 8,
+            "rate_limits": {"BINANCE": 4, "KUCOIN": 1},
+            "jobs": [
+                {"exchange": "BINANCE", "pair": "ETH-USDT", "start": "2020-10-10", "end": "2023-10-10"},
+                {"exchange": "KUCOIN", "pair": "BTC-USDT", "days": 2}
+            ]
+        }
+
+    A job covers [start, end], both inclusive, or with "days" the last N complete UTC days, which
+    is how daily incrementals are listed. "end" defaults to yesterday.
+
+    Args:
+        path (str): Path of the config file.
+        today (datetime.date): Reference day for "days" and the default end. Defaults to today (UTC).
+
+    Returns:
+        tuple: (list of CollectionJob, dict of the remaining settings).
+    """
+    with open(path) as f:
+        config = json.load(f)
+    today = today or datetime.datetime.now(datetime.timezone.utc).date()
+    yesterday = today - datetime.timedelta(days=1)
+    jobs = []
+    for entry in config.pop('jobs'):
+        exchange = Exchange[entry['exchange']]
+        end = datetime.date.fromisoformat(entry['end']) if 'end' in entry else yesterday
+        if 'days' in entry:
+            start = end - datetime.timedelta(days=entry['days'] - 1)
+        else:
+            start = datetime.date.fromisoformat(entry['start'])
+        name = entry.get('name', f"{exchange.value} {entry['pair']} {start}..{end}")
+        jobs.append(CollectionJob(name, exchange, entry['pair'], start, end))
+    return jobs, config
+
+
+class RateLimiter:
+    """ Token bucket allowing `rate` requests per second on average and bursts of up to `burst`. """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """ Takes a token if one is available, without waiting. """
+        with self.lock:
+            self._refill()
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def wait_time(self):
+        """ Seconds until a token is available. """
+        with self.lock:
+            self._refill()
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class DbWriter:
+    """
+    The only thread saving into one database file.
+
+    Fetched days are queued and saved in order with `bulk_save`, and each saved day is marked in
+    the file's checkpoint, which is shared by every job writing to the file. Days that fetched no
+    rows are recorded as empty and fetched again by the next run.
+    """
+
+    def __init__(self, db, checkpoint, on_result):
+        """
+        Args:
+            db (AssetPairDbManager): Destination database.
+            checkpoint (BackfillCheckpoint): Checkpoint of the database file.
+            on_result (callable): Called with (job, DayResult) from the writer thread after every day.
+        """
+        self.db = db
+        self.checkpoint = checkpoint
+        self.on_result = on_result
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, job, day, data, fetch_seconds, attempts):
+        self.queue.put((job, day, data, fetch_seconds, attempts))
+
+    def pending(self):
+        """ Days queued or being saved. """
+        return self.queue.unfinished_tasks
+
+    def close(self):
+        """ Saves what is queued and stops the thread. """
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            job, day, data, fetch_seconds, attempts = item
+            started = time.perf_counter()
+            try:
+                if data.empty:
+                    self.checkpoint.mark_empty(day)
+                else:
+                    self.db.bulk_save(data)
+                    self.checkpoint.mark(day)
+                result = DayResult(day, len(data), fetch_seconds, time.perf_counter() - started, attempts, None)
+            except Exception as e:
+                print(f"{job.name} {day}: save failed: {e}")
+                result = DayResult(day, 0, fetch_seconds, None, attempts, e)
+            self.on_result(job, result)
+            self.queue.task_done()
+
+
+class _JobState:
+    """ Scheduling state of one job: days not yet fetched, failed days waiting to be retried, and fetches in flight. """
+
+    def __init__(self, job, days):
+        self.job = job
+        self.days = collections.deque(days)
+        self.retries = []  # (not_before, day, attempts)
+        self.in_flight = 0
+        self.served = 0
+
+    def next_ready(self, now):
+        """ Returns (wake-up time, index of a due retry or None) for the next day this job could fetch. """
+        due = [(not_before, i) for i, (not_before, _, _) in enumerate(self.retries)]
+        if due:
+            not_before, i = min(due)
+            if not_before <= now:
+                return now, i
+            if not self.days:
+                return not_before, None
+        return (now, None) if self.days else (None, None)
+
+    def done(self):
+        return not self.days and not self.retries and not self.in_flight
+
+
+class CollectionOrchestrator:
+    """
+    Collects many (exchange, pair, date range) jobs over one shared, bounded fetch pool.
+
+    Fetches are throttled by a token bucket per exchange (`rate_limits`, in requests per second),
+    so jobs on different exchanges don't slow each other down, and a rate-limited exchange waits in
+    the scheduler rather than holding pool threads. Every database file gets its own DbWriter
+    thread, so saving one pair never blocks another and the connection pool's single-writer model
+    holds per file.
+
+    Scheduling is fair across jobs: each free slot goes to the runnable job with the fewest fetches
+    in flight, ties broken by whichever was served longest ago. A three-year backfill and a two-day
+    incremental therefore share the pool evenly while both have work, and the incremental finishes
+    after about two of its own turns instead of queueing behind the backfill. Failed days are
+    retried with exponential backoff through the same scheduler, each retry costing a rate-limit
+    token. Days in a database's checkpoint are skipped, so reruns and overlapping jobs fetch each
+    day once; a database without a checkpoint resumes from its latest snapshot.
+    """
+
+    def __init__(self, jobs, concurrency=8, rate_limits=None, default_rate=2.0, burst=2, max_pending=None,
+                 max_retries=3, backoff=2.0, db_path="data", source=None, cache=None):
+        """
+        Args:
+            jobs (list): CollectionJobs, e.g. from `load_jobs`.
+            concurrency (int): Fetches in flight across all jobs.
+            rate_limits (dict): Requests per second per exchange name, e.g. {"BINANCE": 4}.
+            default_rate (float): Requests per second for exchanges not in `rate_limits`.
+            burst (int): Requests an idle exchange may send at once.
+            max_pending (int): Fetched-but-unsaved days per database before its fetches pause.
+                Defaults to `concurrency`.
+            max_retries (int): Retries per day after the first failed attempt.
+            backoff (float): Seconds before the first retry, doubled on each further retry.
+            db_path (str): Directory holding the database files.
+            source (callable): Data source passed to MarketDataFetcher. Defaults to lakeapi.
+            cache (FetchCache): Optional on-disk cache shared by the fetches.
+        """
+        self.jobs = list(jobs)
+        self.concurrency = concurrency
+        self.max_pending = max_pending or concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.source = source
+        self.cache = cache
+        rate_limits = rate_limits or {}
+        self.limiters = {job.exchange: RateLimiter(rate_limits.get(job.exchange.value, default_rate), burst)
+                         for job in self.jobs}
+
+        self.dbs = {}
+        for job in self.jobs:
+            if (job.exchange, job.asset_pair) not in self.dbs:
+                self.dbs[job.exchange, job.asset_pair] = AssetPairDbManager(job.exchange, job.asset_pair,
+                                                                            db_path=db_path)
+        self.checkpoints = {key: BackfillCheckpoint(f"{os.path.splitext(db.db_file)[0]}.backfill.json")
+                            for key, db in self.dbs.items()}
+        for key, checkpoint in self.checkpoints.items():
+            checkpoint.seed(self.dbs[key])
+        self.results = {job.name: [] for job in self.jobs}
+        self.results_lock = threading.Lock()
+
+    def _record(self, job, result):
+        with self.results_lock:
+            self.results[job.name].append(result)
+        if result.error is None:
+            print(f"{job.name} {result.day}: {result.rows} rows, fetch {result.fetch_seconds:.2f}s "
+                  f"({result.attempts} attempts), save {result.save_seconds:.2f}s")
+
+    def _states(self):
+        """ Builds the job states, giving each pending day to the first job that lists it. """
+        claimed = collections.defaultdict(set)
+        states = []
+        for job in self.jobs:
+            key = job.exchange, job.asset_pair
+            days = []
+            current = job.start
+            while current <= job.end:
+                if current not in self.checkpoints[key] and current not in claimed[key]:
+                    days.append(current)
+                    claimed[key].add(current)
+                current += datetime.timedelta(days=1)
+            states.append(_JobState(job, days))
+        return states
+
+    def run(self):
+        """
+        Runs every job to completion.
+
+        Returns:
+            dict: Job name to the list of DayResults of its attempted days, in completion order.
+        """
+        states = self._states()
+        print(f"Collecting {sum(len(s.days) for s in states)} days across {len(states)} jobs...")
+        writers = {key: DbWriter(db, self.checkpoints[key], self._record) for key, db in self.dbs.items()}
+        in_flight = {}
+        turn = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                while not all(state.done() for state in states):
+                    now = time.monotonic()
+                    wake = None
+                    while len(in_flight) < self.concurrency:
+                        state, retry, wake = self._pick(states, writers, now)
+                        if state is None:
+                            break
+                        turn += 1
+                        state.served = turn
+                        if retry is None:
+                            day, attempts = state.days.popleft(), 1
+                        else:
+                            _, day, attempts = state.retries.pop(retry)
+                        start = datetime.datetime.combine(day, datetime.time())
+                        job = state.job
+                        future = pool.submit(fetch_day, job.exchange, job.asset_pair, start,
+                                             start + datetime.timedelta(days=1), 0, 0, self.cache, self.source)
+                        in_flight[future] = (state, day, attempts)
+                        state.in_flight += 1
+
+                    # Sleep until a fetch finishes, a token or retry comes due, or a writer catches up.
+                    timeout = 0.05 if wake is None else max(0.0, min(wake - time.monotonic(), 1.0))
+                    if not in_flight:
+                        time.sleep(timeout)
+                        continue
+                    done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._finish(future, *in_flight.pop(future), writers)
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        failed = sum(r.error is not None for results in self.results.values() for r in results)
+        empty = sum(r.error is None and not r.rows for results in self.results.values() for r in results)
+        saved = sum(len(results) for results in self.results.values()) - failed - empty
+        print(f"Collection finished: {saved} days saved, {empty} empty, {failed} failed.")
+        return self.results
+
+    def _pick(self, states, writers, now):
+        """
+        Chooses the job to fetch for next.
+
+        Returns:
+            tuple: (state, retry index or None, earliest wake-up time). The state is None when no job
+                can fetch now.
+        """
+        best, best_retry, wake = None, None, None
+        for state in states:
+            ready, retry = state.next_ready(now)
+            if ready is None:
+                continue
+            key = state.job.exchange, state.job.asset_pair
+            if writers[key].pending() + self._in_flight(states, key) >= self.max_pending:
+                continue
+            if ready > now:
+                wake = ready if wake is None else min(wake, ready)
+                continue
+            wait_time = self.limiters[state.job.exchange].wait_time()
+            if wait_time > 0:
+                wake = now + wait_time if wake is None else min(wake, now + wait_time)
+                continue
+            if best is None or (state.in_flight, state.served) < (best.in_flight, best.served):
+                best, best_retry = state, retry
+        if best is not None and not self.limiters[best.job.exchange].try_acquire():
+            best = None
+        return best, best_retry, wake
+
+    @staticmethod
+    def _in_flight(states, key):
+        return sum(state.in_flight for state in states if (state.job.exchange, state.job.asset_pair) == key)
+
+    def _finish(self, future, state, day, attempts, writers):
+        state.in_flight -= 1
+        job = state.job
+        try:
+            data, fetch_seconds, _ = future.result()
+        except Exception as e:
+            if attempts > self.max_retries:
+                print(f"{job.name} {day}: fetch failed after {attempts} attempts: {e}")
+                self._record(job, DayResult(day, 0, None, None, attempts, e))
+            else:
+                not_before = time.monotonic() + self.backoff * 2 ** (attempts - 1)
+                state.retries.append((not_before, day, attempts + 1))
+            return
+        writers[job.exchange, job.asset_pair].put(job, day, data, fetch_seconds, attempts)
@@ -0,0 +1,216 @@
+import datetime
+import threading
+import time
+import numpy as np
+from ..common import metrics
+from ..common.codec import BOOK, BOOK_DTYPE, BookEncoder, topic
+from ..common.sock import encode_frame
+from ..db.asset import LEVEL_COLUMNS
+from ..db.columnar import NULL_INT, to_nanoseconds
+
+# A length-prefixed BOOK frame, so a whole chunk of snapshots is framed in one vectorized pass.
+BOOK_FRAME_DTYPE = np.dtype([('length', '>u4'), ('book', BOOK_DTYPE)])
+
+
+def book_frames(received_times, origin_times, sequence_numbers, levels):
+    """
+    Encodes and frames many snapshots at once.
+
+    Returns:
+        list: One length-prefixed BOOK frame per snapshot, as memoryview slices of a single buffer.
+    """
+    records = np.zeros(len(received_times), dtype=BOOK_FRAME_DTYPE)
+    records['length'] = BOOK_DTYPE.itemsize
+    book = records['book']
+    book['type'] = BOOK
+    book['received_time'] = received_times
+    book['origin_time'] = origin_times
+    book['sequence_number'] = sequence_numbers
+    book['levels'] = levels
+    view = memoryview(records.tobytes())
+    size = BOOK_FRAME_DTYPE.itemsize
+    return [view[i:i + size] for i in range(0, len(view), size)]
+
+
+class BookPublisher:
+    """
+    Streams the order book of one exchange and pair into an AsyncSocketServer.
+
+    Snapshots come from a live polling loop around MarketDataFetcher (`live`) or from a replay of
+    the stored book (`replay`). Each one is encoded and framed exactly once, a chunk at a time, and
+    the same frames are handed to every subscriber's queue, so the cost of a message doesn't grow
+    with the number of clients. Frames are broadcast under the topic 'EXCHANGE:PAIR' (codec.topic),
+    so clients that subscribed to other pairs never receive them.
+
+    Publishing is paced either at a fixed `rate` in messages per second or at `speed` times the
+    recorded pace; with neither, snapshots are sent as fast as they are read. Run the publisher on
+    its own thread, e.g. with `start_replay`/`start_live`, next to the server's event loop.
+    """
+
+    def __init__(self, server, exchange, asset_pair, rate=None, speed=None, deltas=False, keyframe_interval=100,
+                 batch=256):
+        """
+        Args:
+            server (AsyncSocketServer): A started server.
+            exchange (Exchange): Exchange of the book.
+            asset_pair (str): Asset pair, e.g. "ETH-USDT".
+            rate (float): Messages per second. Takes precedence over `speed`.
+            speed (float): Recorded seconds per wall-clock second, e.g. 1 for real time.
+            deltas (bool): Send BookEncoder deltas with periodic keyframes instead of full snapshots.
+                Smaller on the wire, but encoded one snapshot at a time. A subscriber whose queue
+                overflows loses the deltas up to the next keyframe (see BookDecoder), and with the
+                server's 'coalesce' policy every overflow leaves a lone delta, so that policy always
+                gets full snapshots.
+            keyframe_interval (int): Messages between full snapshots when sending deltas.
+            batch (int): Most frames handed to the server's event loop per wake-up.
+        """
+        self.server = server
+        self.exchange = exchange
+        self.asset_pair = asset_pair
+        self.topic = topic(exchange.value, asset_pair)
+        self.rate = rate
+        self.speed = speed
+        self.encoder = BookEncoder(keyframe_interval) if deltas and server.policy != 'coalesce' else None
+        self.batch = batch
+        self.stopping = threading.Event()
+        self.thread = None
+        self.anchor_wall = None
+        self.anchor_ns = None
+        self.anchor_count = 0
+        self.published = 0
+        self.last_received = None
+
+    def encode(self, received_times, origin_times, sequence_numbers, levels):
+        """ Returns the frames of a chunk of snapshots. """
+        if self.encoder is None:
+            return book_frames(received_times, origin_times, sequence_numbers, levels)
+        return [encode_frame(self.encoder.encode(r, o, s, l))
+                for r, o, s, l in zip(received_times.tolist(), origin_times.tolist(), sequence_numbers.tolist(), levels)]
+
+    def publish(self, received_times, origin_times, sequence_numbers, levels):
+        """
+        Encodes snapshots and broadcasts them at the configured pace. Blocks until they are all sent
+        or the publisher is stopped.
+
+        Args:
+            received_times (np.ndarray): Ascending int64 nanosecond received times.
+            origin_times (np.ndarray): int64 nanosecond origin times, NULL_INT if unknown.
+            sequence_numbers (np.ndarray): int64 sequence numbers, -1 if unknown.
+            levels (np.ndarray): (n, 80) level values in schema order.
+
+        Returns:
+            int: Number of snapshots sent.
+        """
+        if not len(received_times):
+            return 0
+        frames = self.encode(received_times, origin_times, sequence_numbers, levels)
+        if self.anchor_wall is None:
+            self.anchor_wall, self.anchor_ns, self.anchor_count = time.monotonic(), int(received_times[0]), self.published
+        sent = 0
+        while sent < len(frames) and not self.stopping.is_set():
+            due, wait = self._due(received_times, sent)
+            if due == sent:
+                self.stopping.wait(wait)
+                continue
+            end = min(due, sent + self.batch)
+            self.server.broadcast_frames_threadsafe(frames[sent:end], self.topic)
+            self.published += end - sent
+            sent = end
+        self.last_received = int(received_times[sent - 1]) if sent else self.last_received
+        metrics.inc('publish.snapshots', sent)
+        return sent
+
+    def _due(self, received_times, sent):
+        """ Returns (one past the last frame due now, seconds until the next one is due). """
+        if self.rate is None and self.speed is None:
+            return len(received_times), 0.0
+        elapsed = time.monotonic() - self.anchor_wall
+        if self.rate is not None:
+            allowed = int(elapsed * self.rate) + 1 - (self.published - self.anchor_count)
+            return min(len(received_times), sent + max(allowed, 0)), 1 / self.rate
+        now_ns = self.anchor_ns + int(elapsed * self.speed * 1e9)
+        due = int(np.searchsorted(received_times, now_ns, side='right'))
+        if due > sent:
+            return due, 0.0
+        return sent, (received_times[sent] - now_ns) / (self.speed * 1e9)
+
+    def replay(self, book_db, start, end, chunk=datetime.timedelta(minutes=5)):
+        """
+        Publishes the stored snapshots in [start, end), one `chunk` window at a time.
+
+        Returns:
+            int: Number of snapshots sent.
+        """
+        total = 0
+        window_start = start
+        while window_start < end and not self.stopping.is_set():
+            window_end = min(window_start + chunk, end)
+            # read_range is inclusive; the window is half-open so a snapshot on a boundary is sent once.
+            times, values = book_db.read_range(window_start, window_end, ['sequence_number'] + LEVEL_COLUMNS)
+            count = np.searchsorted(times, to_nanoseconds([window_end])[0], side='left')
+            sequence = values[:count, 0]
+            # origin_time is not part of the numeric read path; NULL_INT marks it as unknown.
+            total += self.publish(times[:count], np.full(count, NULL_INT, dtype=np.int64),
+                                  np.where(np.isnan(sequence), -1, sequence).astype(np.int64), values[:count, 1:])
+            window_start = window_end
+        print(f"Published {total} snapshots of {self.topic} from {start} to {end}.")
+        return total
+
+    def live(self, fetcher, interval=datetime.timedelta(seconds=1), lookback=datetime.timedelta(minutes=1)):
+        """
+        Polls `fetcher` every `interval` and publishes the snapshots it hasn't published yet, until stopped.
+
+        Args:
+            fetcher (MarketDataFetcher): Fetcher of this exchange and pair.
+            interval (datetime.timedelta): Time between polls.
+            lookback (datetime.timedelta): Window fetched by the first poll.
+        """
+        since = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - lookback
+        while not self.stopping.is_set():
+            polled = time.monotonic()
+            now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)  # Fetchers take naive UTC.
+            try:
+                data = fetcher.fetch(since, now)
+            except Exception as e:
+                print(f"Failed to fetch {self.topic}: {e}")
+                data = None
+            if data is not None and not data.empty:
+                data = data.sort_values('received_time')
+                received = to_nanoseconds(data['received_time'])
+                new = received > (self.last_received if self.last_received is not None else NULL_INT)
+                if new.any():
+                    data = data[new]
+                    sequence = data['sequence_number'].fillna(-1).to_numpy(dtype=np.int64)
+                    self.publish(received[new], to_nanoseconds(data['origin_time']), sequence,
+                                 data[LEVEL_COLUMNS].to_numpy(dtype=np.float64))
+                    # Refetch a little overlap; already published snapshots are filtered out above.
+                    since = datetime.datetime.fromtimestamp(self.last_received / 1e9, datetime.timezone.utc).replace(tzinfo=None) - interval
+            self.stopping.wait(max(0.0, interval.total_seconds() - (time.monotonic() - polled)))
+
+    def start_replay(self, book_db, start, end, **kwargs):
+        """ Runs `replay` on a background thread. """
+        return self._start(self.replay, book_db, start, end, **kwargs)
+
+    def start_live(self, fetcher, **kwargs):
+        """ Runs `live` on a background thread. """
+        return self._start(self.live, fetcher, **kwargs)
+
+    def _start(self, target, *args, **kwargs):
+        self.stop()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=target, args=args, kwargs=kwargs, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+
+    def stats(self):
+        return {
+            'topic': self.topic,
+            'published': self.published,
+            'last_received': self.last_received,
+        }
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+from ..db.asset import ORDER_BOOK_COLUMNS
+
+
+def order_book_frame(rows, start='2022-01-01', seed=0):
+    """
+    Builds a DataFrame shaped like a lakeapi `book` response: 100ms snapshots with 20 bid and
+    20 ask levels around a random-walk mid price.
+
+    Args:
+        rows (int): Number of snapshots.
+        start (str): Timestamp of the first snapshot.
+        seed (int): Seed for the random generator, so runs are reproducible.
+    """
+    rng = np.random.default_rng(seed)
+    received = pd.date_range(start, periods=rows, freq='100ms')
+    mid = 1500.0 + np.cumsum(rng.normal(0, 0.05, rows))
+    data = {
+        'received_time': received,
+        'sequence_number': np.arange(rows, dtype=np.int64),
+        'origin_time': received - pd.Timedelta(milliseconds=5),
+    }
+    for side, sign in (('bid', -1), ('ask', 1)):
+        for level in range(20):
+            data[f'{side}_{level}_price'] = mid + sign * (0.01 + 0.01 * level)
+            data[f'{side}_{level}_size'] = rng.exponential(2.0, rows)
+    return pd.DataFrame(data, columns=ORDER_BOOK_COLUMNS)
+
+
+class SyntheticSource:
+    """
+    Offline stand-in for `lakeapi.load_data`, for exercising fetchers and caches without network access.
+
+    Each hour is generated from its own seed, so any window returns the same rows no matter how
+    the requests are split. `calls` records every (start, end) requested.
+    """
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.calls = []
+
+    def __call__(self, table, start, end, symbols=None, exchanges=None, **kwargs):
+        self.calls.append((start, end))
+        frames = []
+        hour = pd.Timestamp(start).floor('h')
+        while hour < pd.Timestamp(end):
+            frame = order_book_frame(60 * 60 * 10, start=hour, seed=self.seed + int(hour.timestamp()) // 3600)
+            frames.append(frame[(frame['received_time'] >= start) & (frame['received_time'] < end)])
+            hour += pd.Timedelta(hours=1)
+        return pd.concat(frames, ignore_index=True)
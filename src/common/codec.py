@@ -0,0 +1,218 @@
+import collections
+import struct
+import numpy as np
+
+# Message types, the first byte of every payload.
+BOOK = 1
+BOOK_DELTA = 2
+EXECUTION = 3
+CANDLE = 4
+ACCOUNT = 5
+SIGNAL = 6
+# Sent by clients to choose the topics (see `topic`) they receive. The payload after the type byte
+# is the UTF-8 topic names separated by newlines.
+SUBSCRIBE = 7
+UNSUBSCRIBE = 8
+
+LEVELS = 20
+# Level values per snapshot in schema order: bid_0_price, bid_0_size, ..., ask_19_price, ask_19_size.
+LEVEL_VALUES = LEVELS * 4
+
+SIDES = ('none', 'buy', 'sell')
+
+# Every layout starts with (type, flags) padded to 8 bytes so the int64/float64 fields stay aligned.
+BOOK_STRUCT = struct.Struct(f'<BB6xqqq{LEVEL_VALUES}d')
+BOOK_HEADER = struct.Struct('<BB6xqqq')
+# The fourth int64 is the received_time of the snapshot the delta applies to; the 10 bytes are one
+# changed-bit per level value.
+BOOK_DELTA_HEADER = struct.Struct('<BB6xqqqq10s6x')
+EXECUTION_STRUCT = struct.Struct('<BB6xqddd')
+CANDLE_STRUCT = struct.Struct('<BB6xqddddd')
+ACCOUNT_STRUCT = struct.Struct('<BB6xqdd')
+SIGNAL_STRUCT = struct.Struct('<BB6xqd')
+
+# The same layout as BOOK_STRUCT, for encoding or viewing many snapshots at once.
+BOOK_DTYPE = np.dtype([
+    ('type', 'u1'), ('flags', 'u1'), ('pad', 'V6'),
+    ('received_time', '<i8'), ('origin_time', '<i8'), ('sequence_number', '<i8'),
+    ('levels', '<f8', (LEVEL_VALUES,)),
+])
+
+Book = collections.namedtuple('Book', ['received_time', 'origin_time', 'sequence_number', 'levels'])
+Execution = collections.namedtuple('Execution', ['time', 'side', 'quantity', 'price', 'total_position'])
+Candle = collections.namedtuple('Candle', ['time', 'open', 'high', 'low', 'close', 'volume'])
+Account = collections.namedtuple('Account', ['time', 'base', 'quote'])
+# A model output for the snapshot received at `time`, e.g. the probability of an up move.
+Signal = collections.namedtuple('Signal', ['time', 'value'])
+
+
+def encode_book(received_time, origin_time, sequence_number, levels):
+    """
+    Encodes one 20-level snapshot.
+
+    Args:
+        received_time (int): Nanoseconds since the epoch.
+        origin_time (int): Nanoseconds since the epoch.
+        sequence_number (int): Exchange sequence number, -1 if unknown.
+        levels (np.ndarray): The 80 level values in schema order.
+    """
+    return BOOK_STRUCT.pack(BOOK, 0, received_time, origin_time, sequence_number, *levels)
+
+
+def encode_books(received_times, origin_times, sequence_numbers, levels):
+    """
+    Encodes many snapshots in one vectorized pass.
+
+    Returns:
+        bytes: Back-to-back BOOK payloads of BOOK_DTYPE.itemsize bytes each.
+    """
+    records = np.zeros(len(received_times), dtype=BOOK_DTYPE)
+    records['type'] = BOOK
+    records['received_time'] = received_times
+    records['origin_time'] = origin_times
+    records['sequence_number'] = sequence_numbers
+    records['levels'] = levels
+    return records.tobytes()
+
+
+def decode_books(buffer):
+    """ Zero-copy structured view of back-to-back BOOK payloads, e.g. from `encode_books`. """
+    return np.frombuffer(buffer, dtype=BOOK_DTYPE)
+
+
+def encode_execution(time, side, quantity, price, total_position):
+    return EXECUTION_STRUCT.pack(EXECUTION, SIDES.index(side), time, quantity, price, total_position)
+
+
+def encode_candle(time, open, high, low, close, volume=0.0):
+    return CANDLE_STRUCT.pack(CANDLE, 0, time, open, high, low, close, volume)
+
+
+def encode_account(time, base, quote):
+    return ACCOUNT_STRUCT.pack(ACCOUNT, 0, time, base, quote)
+
+
+def encode_signal(time, value):
+    return SIGNAL_STRUCT.pack(SIGNAL, 0, time, value)
+
+
+def topic(exchange, asset_pair):
+    """ Name of the feed of one exchange and pair, e.g. 'BINANCE:ETH-USDT'. """
+    return f"{exchange}:{asset_pair}"
+
+
+def encode_subscription(topics, unsubscribe=False):
+    return bytes([UNSUBSCRIBE if unsubscribe else SUBSCRIBE]) + '\n'.join(topics).encode()
+
+
+def decode_subscription(payload):
+    """ Returns the topics of a SUBSCRIBE or UNSUBSCRIBE payload. """
+    text = bytes(payload[1:]).decode()
+    return text.split('\n') if text else []
+
+
+def decode(payload):
+    """
+    Decodes a single BOOK, EXECUTION, CANDLE, ACCOUNT or SIGNAL payload.
+
+    BOOK_DELTA payloads depend on the previous snapshot and must go through a BookDecoder.
+    """
+    kind = payload[0]
+    if kind == BOOK:
+        _, _, received_time, origin_time, sequence_number = BOOK_HEADER.unpack_from(payload)
+        levels = np.frombuffer(payload, dtype='<f8', count=LEVEL_VALUES, offset=BOOK_HEADER.size)
+        return Book(received_time, origin_time, sequence_number, levels)
+    if kind == EXECUTION:
+        _, side, time, quantity, price, total_position = EXECUTION_STRUCT.unpack(payload)
+        return Execution(time, SIDES[side], quantity, price, total_position)
+    if kind == CANDLE:
+        return Candle(*CANDLE_STRUCT.unpack(payload)[2:])
+    if kind == ACCOUNT:
+        return Account(*ACCOUNT_STRUCT.unpack(payload)[2:])
+    if kind == SIGNAL:
+        return Signal(*SIGNAL_STRUCT.unpack(payload)[2:])
+    if kind == BOOK_DELTA:
+        raise ValueError("BOOK_DELTA payloads must be decoded with a BookDecoder")
+    raise ValueError(f"Unknown message type {kind}")
+
+
+def coalesce_key(payload):
+    """
+    Key for SockClient coalescing: a newer BOOK or ACCOUNT message supersedes an older one, while
+    deltas, executions and candles must all be delivered. The key doesn't include the topic, which
+    is why SockClient only coalesces a single-topic subscription.
+    """
+    kind = payload[0]
+    return kind if kind in (BOOK, ACCOUNT) else None
+
+
+class BookEncoder:
+    """
+    Encodes a stream of snapshots as deltas against the previous one.
+
+    A delta carries a bitmask of the level values that changed followed by only those values, so a
+    tick that moves a handful of levels costs tens of bytes instead of 672. A full snapshot is sent
+    first and then every `keyframe_interval` messages, so late joiners can resynchronize. Each delta
+    also names the received_time of the snapshot it was taken against, so a decoder that missed a
+    message, e.g. one dropped by a slow subscriber's queue, knows to wait for the next keyframe.
+    """
+
+    def __init__(self, keyframe_interval=100):
+        self.keyframe_interval = keyframe_interval
+        self.previous = None
+        self.previous_time = None
+        self.since_keyframe = 0
+
+    def encode(self, received_time, origin_time, sequence_number, levels):
+        levels = np.asarray(levels, dtype=np.float64)
+        base_time = self.previous_time
+        self.previous_time = received_time
+        if self.previous is None or self.since_keyframe >= self.keyframe_interval:
+            self.previous = levels.copy()
+            self.since_keyframe = 1
+            return encode_book(received_time, origin_time, sequence_number, levels)
+        # NaN != NaN, so compare bit patterns to keep empty levels from counting as changes.
+        changed = levels.view(np.int64) != self.previous.view(np.int64)
+        self.previous = levels.copy()
+        self.since_keyframe += 1
+        header = BOOK_DELTA_HEADER.pack(BOOK_DELTA, 0, received_time, origin_time, sequence_number, base_time,
+                                        np.packbits(changed).tobytes())
+        return header + levels[changed].tobytes()
+
+
+class BookDecoder:
+    """
+    Decodes the output of a BookEncoder, tracking the current snapshot.
+
+    A delta that wasn't taken against the current snapshot means messages were lost in between, so
+    it and every delta after it are dropped until the next keyframe instead of corrupting the book.
+    Decode each stream, e.g. each topic, with its own BookDecoder.
+    """
+
+    def __init__(self):
+        self.levels = None
+        self.received_time = None
+        self.dropped = 0
+
+    def decode(self, payload):
+        """
+        Returns:
+            Book: The full snapshot after applying the payload, or None for a delta that can't be
+                applied: one received before the first keyframe or after a lost message.
+        """
+        if payload[0] == BOOK:
+            book = decode(payload)
+            self.levels = book.levels.copy()
+            self.received_time = book.received_time
+            return book._replace(levels=self.levels.copy())
+        if payload[0] != BOOK_DELTA:
+            return decode(payload)
+        _, _, received_time, origin_time, sequence_number, base_time, mask = BOOK_DELTA_HEADER.unpack_from(payload)
+        if self.levels is None or base_time != self.received_time:
+            self.levels = None
+            self.dropped += 1
+            return None
+        changed = np.unpackbits(np.frombuffer(mask, dtype=np.uint8))[:LEVEL_VALUES].astype(bool)
+        self.levels[changed] = np.frombuffer(payload, dtype='<f8', offset=BOOK_DELTA_HEADER.size)
+        self.received_time = received_time
+        return Book(received_time, origin_time, sequence_number, self.levels.copy())
@@ -0,0 +1,327 @@
+import bisect
+import collections
+import contextlib
+import functools
+import http.server
+import json
+import os
+import sys
+import threading
+import time
+
+# Upper bounds of the latency histogram buckets, in seconds.
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+           30.0, 60.0, 300.0)
+PREFIX = 'tome'
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class Histogram:
+    """ Bucketed distribution of observed values, with exact count, sum and max. """
+
+    def __init__(self, buckets=BUCKETS, unit=None):
+        self.buckets = buckets
+        self.unit = unit
+        self.counts = [0] * (len(buckets) + 1)  # The last bucket is +Inf.
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """ Upper bound of the bucket holding the q-quantile, or the max for the last bucket. """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'unit': self.unit,
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.counts)),
+        }
+
+
+def _collapse(frame):
+    """ Folds a stack into one 'outer;...;inner' line, the input format of flame graph tools. """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the threads inside a span every `interval` seconds.
+
+    The sampler thread only runs while at least one thread is inside the span, so an idle span
+    costs nothing. Samples are aggregated as collapsed stacks (see `write`).
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.active = collections.Counter()  # Thread ident to nesting depth.
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def enter(self, ident):
+        with self.lock:
+            self.active[ident] += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._sample, daemon=True)
+                self.thread.start()
+
+    def exit(self, ident):
+        with self.lock:
+            self.active[ident] -= 1
+            if not self.active[ident]:
+                del self.active[ident]
+
+    def _sample(self):
+        while True:
+            with self.lock:
+                if not self.active:
+                    self.thread = None
+                    return
+                idents = list(self.active)
+            frames = sys._current_frames()
+            stacks = [_collapse(frames[ident]) for ident in idents if ident in frames]
+            del frames
+            with self.lock:
+                self.stacks.update(stacks)
+                self.samples += len(stacks)
+            time.sleep(self.interval)
+
+    def top(self, count=10):
+        """ Returns the `count` most sampled stacks as (stack, fraction of samples). """
+        with self.lock:
+            samples = self.samples
+            common = self.stacks.most_common(count)
+        if not samples:
+            return []
+        return [(stack, n / samples) for stack, n in common]
+
+    def write(self, path):
+        """ Writes 'stack count' lines, e.g. for flamegraph.pl or speedscope. """
+        with self.lock:
+            common = self.stacks.most_common()
+        with open(path, 'w') as f:
+            for stack, n in common:
+                f.write(f"{stack} {n}\n")
+
+
+class _Span:
+    __slots__ = ('registry', 'name', 'started')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        profiler = self.registry.profilers.get(self.name)
+        if profiler is not None:
+            profiler.enter(threading.get_ident())
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        elapsed = time.perf_counter() - self.started
+        registry = self.registry
+        registry.observe(self.name, elapsed, unit='seconds')
+        if kind is not None:
+            registry.inc(f"{self.name}.errors")
+        profiler = registry.profilers.get(self.name)
+        if profiler is not None:
+            profiler.exit(threading.get_ident())
+        return False
+
+
+class Registry:
+    """
+    Counters, histograms and timing spans for the hot paths, disabled by default.
+
+    While disabled, `inc`, `observe` and `span` return after a single attribute check, so
+    instrumented code runs at full speed. Enable it with `enable()` or by setting the TOME_METRICS
+    environment variable, e.g. to 1; '0', 'false' and 'no' leave it disabled. `snapshot` returns
+    everything as a dict, `prometheus` renders it in the Prometheus text format, `write` saves
+    either to a file and `serve` exposes the latter over HTTP.
+    Any span can additionally be profiled with `profile`.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = collections.defaultdict(float)
+        self.histograms = {}
+        self.profilers = {}
+        self.started = time.time()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+    def inc(self, name, value=1):
+        """ Adds `value` to a counter, e.g. inc('db.rows_saved', len(dataframe)). """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, name, value, unit=None):
+        """ Records one value in a histogram, e.g. a batch size or a duration. """
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(unit=unit)
+            histogram.observe(value)
+
+    def span(self, name):
+        """
+        Times a block into the histogram `name`, and counts `name.errors` when it raises.
+
+            with metrics.span('db.bulk_save'):
+                ...
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def timed(self, name):
+        """ Decorator running every call of a function in a span. """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with _Span(self, name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def profile(self, name, interval=0.005):
+        """
+        Samples the stacks of every thread while it is inside span `name`.
+
+        Returns:
+            SamplingProfiler: Collects the samples, see `SamplingProfiler.top` and `write`.
+        """
+        profiler = self.profilers.get(name)
+        if profiler is None:
+            profiler = self.profilers[name] = SamplingProfiler(interval)
+        return profiler
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'time': time.time(),
+                'uptime_seconds': time.time() - self.started,
+                'counters': dict(self.counters),
+                'histograms': {name: h.snapshot() for name, h in self.histograms.items()},
+            }
+
+    def prometheus(self):
+        """ Renders the counters and histograms in the Prometheus text exposition format. """
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{_metric_name(name)}_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {value:g}"]
+            for name, histogram in sorted(self.histograms.items()):
+                metric = _metric_name(name) + (f"_{histogram.unit}" if histogram.unit else "")
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound:g}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+                lines += [f"{metric}_sum {histogram.sum:g}", f"{metric}_count {histogram.count}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """ Saves a snapshot atomically: Prometheus text for '.prom' files, JSON otherwise. """
+        text = self.prometheus() if path.endswith('.prom') else json.dumps(self.snapshot(), indent=2)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def serve(self, port=9108, host='localhost'):
+        """
+        Serves `prometheus()` over HTTP from a daemon thread, for a Prometheus scraper.
+
+        Returns:
+            http.server.ThreadingHTTPServer: Call `shutdown()` to stop it.
+        """
+        registry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+        return server
+
+
+def _metric_name(name):
+    return f"{PREFIX}_" + ''.join(c if c.isalnum() else '_' for c in name)
+
+
+# The registry the instrumented modules report to.
+REGISTRY = Registry(enabled=os.environ.get('TOME_METRICS', '').lower() not in ('', '0', 'false', 'no'))
+enable = REGISTRY.enable
+disable = REGISTRY.disable
+reset = REGISTRY.reset
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+span = REGISTRY.span
+timed = REGISTRY.timed
+profile = REGISTRY.profile
+snapshot = REGISTRY.snapshot
+prometheus = REGISTRY.prometheus
+write = REGISTRY.write
+serve = REGISTRY.serve
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+class RollingBuffer:
+    """
+    The latest `capacity` rows of a numeric table, appended in amortized O(1).
+
+    Rows live in a preallocated array twice the capacity; when it fills up the live rows are moved
+    back to the front in one copy, so `view` is always a contiguous slice and never reallocated.
+    """
+
+    def __init__(self, capacity, columns, dtype=np.float64):
+        self.capacity = capacity
+        self.data = np.empty((2 * capacity, columns), dtype=dtype)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def view(self):
+        return self.data[self.start:self.end]
+
+    def append(self, row):
+        if self.end == len(self.data):
+            live = self.end - self.start
+            self.data[:live] = self.data[self.start:self.end]
+            self.start, self.end = 0, live
+        self.data[self.end] = row
+        self.end += 1
+        if self.end - self.start > self.capacity:
+            self.start += 1
+
+    def replace_last(self, row):
+        self.data[self.end - 1] = row
+
+    def extend(self, rows):
+        """ Appends many rows at once; only the last `capacity` of them are kept if there are more. """
+        rows = rows[-self.capacity:]
+        keep = min(len(self), self.capacity - len(rows))
+        if self.end + len(rows) > len(self.data):
+            self.data[:keep] = self.data[self.end - keep:self.end]
+            self.end = keep
+        self.start = self.end - keep
+        self.data[self.end:self.end + len(rows)] = rows
+        self.end += len(rows)
@@ -1,65 +1,520 @@
+import asyncio
+import collections
+import select
 import socket
-import threading
+import struct
+import time
+from . import metrics
+from .codec import SIGNAL, SUBSCRIBE, UNSUBSCRIBE, decode_subscription, encode_subscription
 
-class SocketServer:
-    def __init__(self, host='localhost', port=65432):
+# Frames are a 4-byte big-endian payload length followed by the payload.
+FRAME_HEADER = struct.Struct('>I')
+
+def encode_frame(payload):
+    """ Prefixes a payload with its length. """
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+async def read_frame(reader):
+    """ Reads one length-prefixed frame from an asyncio StreamReader. Raises IncompleteReadError on EOF. """
+    header = await reader.readexactly(FRAME_HEADER.size)
+    return await reader.readexactly(FRAME_HEADER.unpack(header)[0])
+
+class ClientSession:
+    """
+    One subscriber of an AsyncSocketServer, with a bounded outbound queue.
+
+    When the queue is full the overflow policy decides what a slow consumer loses:
+    'drop_oldest' evicts the oldest queued frame, 'drop_newest' discards the incoming frame and
+    'coalesce' collapses the whole backlog into the incoming frame, for feeds where each message
+    supersedes the previous ones (e.g. book snapshots).
+
+    A session receives every topic until it subscribes to some (see codec.SUBSCRIBE); from then on
+    it only receives those topics and broadcasts without a topic.
+    """
+    POLICIES = ('drop_oldest', 'drop_newest', 'coalesce')
+
+    def __init__(self, writer, max_queue, policy):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown policy '{policy}', expected one of {self.POLICIES}")
+        self.writer = writer
+        self.address = writer.get_extra_info('peername')
+        self.max_queue = max_queue
+        self.policy = policy
+        self.queue = collections.deque()  # (frame, enqueued_at) pairs.
+        self.topics = None  # None receives every topic.
+        self.ready = asyncio.Event()
+        self.connected_at = time.monotonic()
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.messages_received = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def offer(self, frame):
+        """ Queues a frame without blocking, applying the overflow policy if the queue is full. """
+        if len(self.queue) >= self.max_queue:
+            if self.policy == 'drop_newest':
+                self.dropped += 1
+                metrics.inc('sock.dropped')
+                return
+            if self.policy == 'drop_oldest':
+                self.queue.popleft()
+                self.dropped += 1
+                metrics.inc('sock.dropped')
+            else:
+                self.coalesced += len(self.queue)
+                metrics.inc('sock.coalesced', len(self.queue))
+                self.queue.clear()
+        self.queue.append((frame, time.monotonic()))
+        self.ready.set()
+
+    def offer_many(self, frames):
+        """ Queues several frames, taking the fast path when they all fit. """
+        if len(self.queue) + len(frames) > self.max_queue:
+            for frame in frames:
+                self.offer(frame)
+            return
+        now = time.monotonic()
+        self.queue.extend((frame, now) for frame in frames)
+        self.ready.set()
+
+    def wants(self, topic):
+        return topic is None or self.topics is None or topic in self.topics
+
+    def subscribe(self, topics):
+        self.topics = (self.topics or set()) | set(topics)
+
+    def unsubscribe(self, topics):
+        self.topics = (self.topics or set()) - set(topics)
+
+    async def send_loop(self):
+        """ Writes queued frames in batches, waiting for the socket to drain between batches. """
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                frames = [frame for frame, _ in self.queue]
+                self.queue.clear()
+                self.writer.writelines(frames)
+                await self.writer.drain()
+                self.messages_sent += len(frames)
+                self.bytes_sent += sum(len(frame) for frame in frames)
+        except ConnectionError:
+            pass  # The reader side notices the disconnect and cleans up.
+
+    def stats(self):
+        """ Returns counters for this client, including its current lag. """
+        now = time.monotonic()
+        elapsed = max(now - self.connected_at, 1e-9)
+        return {
+            'address': self.address,
+            'queued': len(self.queue),
+            'lag_seconds': now - self.queue[0][1] if self.queue else 0.0,
+            'messages_sent': self.messages_sent,
+            'bytes_sent': self.bytes_sent,
+            'messages_received': self.messages_received,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'topics': None if self.topics is None else sorted(self.topics),
+            'messages_per_second': self.messages_sent / elapsed,
+            'bytes_per_second': self.bytes_sent / elapsed,
+        }
+
+
+class AsyncSocketServer:
+    """
+    Market data server running every subscriber on a single asyncio event loop.
+
+    Messages are length-prefixed frames. `broadcast` frames a payload once and hands it to each
+    client's bounded queue without waiting on any socket, so one slow consumer only ever costs
+    itself messages (see ClientSession) and never delays the others. A broadcast may name a topic,
+    e.g. codec.topic('BINANCE', 'ETH-USDT'), and then only reaches the clients that want it.
+
+    Clients can publish too: frames of a `relay` type, e.g. the SIGNAL frames of an InferenceService,
+    are forwarded to the other clients that want a topic the sender subscribed to.
+    """
+
+    def __init__(self, host='localhost', port=65432, max_queue=1024, policy='drop_oldest', on_message=None,
+                 backlog=4096, relay=(SIGNAL,)):
+        """
+        Args:
+            host (str): Interface to bind.
+            port (int): Port to bind. 0 picks a free port, see `port` after `start`.
+            max_queue (int): Frames queued per client before the overflow policy applies.
+            policy (str): Overflow policy, one of ClientSession.POLICIES.
+            on_message (callable): Called as `on_message(session, payload)` for every frame a client
+                sends, after it is relayed.
+            backlog (int): Listen backlog, large enough for thousands of subscribers connecting at once.
+            relay (tuple): Message types forwarded from one client to the others. A sender with no
+                subscriptions reaches every other client.
+        """
         self.host = host
         self.port = port
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.connections = []
-        self.active = True
+        self.max_queue = max_queue
+        self.policy = policy
+        self.on_message = on_message
+        self.backlog = backlog
+        self.relay = relay
+        self.sessions = set()
+        self.handlers = set()
+        self.server = None
+        self.loop = None
 
-    def start_server(self):
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port, backlog=self.backlog)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"Server started on {self.host}:{self.port}")
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def _handle_client(self, reader, writer):
+        session = ClientSession(writer, self.max_queue, self.policy)
+        self.sessions.add(session)
+        self.handlers.add(asyncio.current_task())
+        sender = asyncio.create_task(session.send_loop())
         try:
-            self.socket.bind((self.host, self.port))
-            self.socket.listen()
-            print(f"Server started on {self.host}:{self.port}")
-            self.accept_connections()
-        except Exception as e:
-            print(f"Failed to start server: {e}")
-            self.socket.close()
+            while True:
+                payload = await read_frame(reader)
+                session.messages_received += 1
+                kind = payload[0] if payload else None
+                if kind == SUBSCRIBE:
+                    session.subscribe(decode_subscription(payload))
+                elif kind == UNSUBSCRIBE:
+                    session.unsubscribe(decode_subscription(payload))
+                else:
+                    if kind in self.relay:
+                        self._relay(session, payload)
+                    if self.on_message is not None:
+                        self.on_message(session, payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            self.handlers.discard(asyncio.current_task())
+            sender.cancel()
+            writer.close()
+
+    def broadcast(self, payload, topic=None):
+        """
+        Queues a payload for every connected client that wants `topic`. Must be called on the
+        server's event loop.
+
+        Args:
+            payload (bytes): Message to send.
+            topic (str): Topic of the message. None reaches every client.
+        """
+        frame = encode_frame(payload)
+        with metrics.span('sock.broadcast'):
+            queued = 0
+            for session in list(self.sessions):
+                if session.wants(topic):
+                    session.offer(frame)
+                    queued += 1
+        metrics.inc('sock.broadcasts')
+        metrics.inc('sock.frames_queued', queued)
+
+    def broadcast_many(self, payloads, topic=None):
+        """ Queues several payloads of one topic, framing each once for all clients. """
+        self.broadcast_frames([encode_frame(payload) for payload in payloads], topic)
+
+    def broadcast_frames(self, frames, topic=None):
+        """ Queues frames that are already length-prefixed, e.g. encoded in bulk by a BookPublisher. """
+        with metrics.span('sock.broadcast'):
+            queued = 0
+            for session in list(self.sessions):
+                if session.wants(topic):
+                    session.offer_many(frames)
+                    queued += len(frames)
+        metrics.inc('sock.broadcasts', len(frames))
+        metrics.inc('sock.frames_queued', queued)
+
+    def _relay(self, sender, payload):
+        """ Forwards a client's frame to the other clients that want any topic the sender subscribed to. """
+        frame = encode_frame(payload)
+        queued = 0
+        for session in list(self.sessions):
+            if session is not sender and (not sender.topics or any(session.wants(t) for t in sender.topics)):
+                session.offer(frame)
+                queued += 1
+        metrics.inc('sock.relayed')
+        metrics.inc('sock.frames_queued', queued)
+
+    def broadcast_threadsafe(self, payload, topic=None):
+        """ Same as `broadcast`, callable from any thread. """
+        self.loop.call_soon_threadsafe(self.broadcast, payload, topic)
+
+    def broadcast_many_threadsafe(self, payloads, topic=None):
+        """ Same as `broadcast_many`, callable from any thread, with a single wake-up of the event loop. """
+        self.loop.call_soon_threadsafe(self.broadcast_many, payloads, topic)
+
+    def broadcast_frames_threadsafe(self, frames, topic=None):
+        """ Same as `broadcast_frames`, callable from any thread. """
+        self.loop.call_soon_threadsafe(self.broadcast_frames, frames, topic)
 
-    def accept_connections(self):
-        while self.active:
-            client, address = self.socket.accept()
-            print(f"Connected to {address}")
-            self.connections.append(client)
-            thread = threading.Thread(target=self.handle_client, args=(client,))
-            thread.start()
+    def stats(self):
+        """ Returns per-client counters, see ClientSession.stats. """
+        return [session.stats() for session in list(self.sessions)]
 
-    def handle_client(self, client):
-        while self.active:
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+        # Aborting the transports ends each handler's read loop, so they finish instead of being cancelled.
+        # abort() rather than close(): close() would wait for slow consumers to drain their buffers.
+        for session in list(self.sessions):
+            session.writer.transport.abort()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        if self.server is not None:
+            await self.server.wait_closed()
+        print("Server stopped.")
+
+class SockClient:
+    """
+    Subscriber for an AsyncSocketServer feed.
+
+    Incoming bytes are read with `recv_into` straight into one preallocated buffer, and frames are
+    handed out as memoryview slices of it, so receiving never allocates or copies per message. Each
+    `receive_batch` call delivers every frame that has arrived since the previous call; the slices
+    stay valid until the next call, after which the unread tail is moved back to the front of the
+    buffer. Use `bytes(payload)` to keep a payload longer.
+
+    The socket is non-blocking, and a dropped connection is re-established on later calls with
+    exponential backoff, so a UI can poll it from its render loop without ever stalling. Topic
+    subscriptions are re-sent on every reconnect.
+    """
+
+    def __init__(self, host='localhost', port=65432, buffer_size=1 << 20, max_buffer_size=64 << 20, max_batch=None,
+                 coalesce_key=None, reconnect_delay=0.5, max_reconnect_delay=30.0, topics=None):
+        """
+        Args:
+            host (str): Server host.
+            port (int): Server port.
+            buffer_size (int): Initial receive buffer size. Grown when a backlog or a single frame does
+                not fit.
+            max_buffer_size (int): Size beyond which the buffer only grows for a single oversized
+                frame; any further backlog stays in the socket until the next call.
+            max_batch (int): Most frames delivered per call; older frames beyond it are dropped. None
+                delivers everything.
+            coalesce_key (callable): Called with each payload. Frames returning the same non-None key
+                within a batch supersede each other and only the latest is delivered, e.g.
+                `codec.coalesce_key` for book and account snapshots. Frames don't name their topic, so
+                coalescing requires exactly one topic, or one pair's keyframe would supersede another's.
+            reconnect_delay (float): Seconds before the first reconnect attempt, doubled per failure.
+            max_reconnect_delay (float): Upper bound on the reconnect delay.
+            topics (list): Topics to subscribe to, e.g. ['BINANCE:ETH-USDT']. None receives everything.
+        """
+        if coalesce_key is not None and (topics is None or len(set(topics)) != 1):
+            raise ValueError("Coalescing requires subscribing to exactly one topic")
+        self.host = host
+        self.port = port
+        self.max_buffer_size = max_buffer_size
+        self.max_batch = max_batch
+        self.coalesce_key = coalesce_key
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.topics = None if topics is None else set(topics)
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # First unread byte.
+        self.end = 0  # One past the last received byte.
+        self.socket = None
+        self.next_attempt = 0.0
+        self.delay = reconnect_delay
+        self.messages_received = 0
+        self.messages_delivered = 0
+        self.bytes_received = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self.connected_once = False
+
+    def connect(self):
+        """ Connects if not connected and a reconnect is due. Returns whether the client is connected. """
+        if self.socket is not None:
+            return True
+        if time.monotonic() < self.next_attempt:
+            return False
+        try:
+            self.socket = socket.create_connection((self.host, self.port), timeout=self.delay)
+        except OSError as e:
+            print(f"Failed to connect to {self.host}:{self.port}: {e}. Retrying in {self.delay:.1f}s.")
+            self.next_attempt = time.monotonic() + self.delay
+            self.delay = min(self.delay * 2, self.max_reconnect_delay)
+            return False
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.topics is not None:
             try:
-                data = client.recv(1024)
-                if not data:
+                self.socket.sendall(encode_frame(encode_subscription(sorted(self.topics))))
+            except OSError as e:
+                self._disconnect(e)
+                return False
+        self.socket.setblocking(False)
+        self.delay = self.reconnect_delay
+        if self.connected_once:
+            self.reconnects += 1
+        self.connected_once = True
+        print(f"Connected to {self.host}:{self.port}")
+        return True
+
+    def receive_batch(self, timeout=0.0):
+        """
+        Returns every complete frame received since the last call.
+
+        Args:
+            timeout (float): Seconds to wait for data if none is pending. 0 never blocks.
+
+        Returns:
+            list: memoryview payloads, valid until the next call. Empty if disconnected.
+        """
+        # The previous batch has been consumed, so its bytes can be overwritten.
+        if self.start:
+            pending = self.end - self.start
+            self.view[:pending] = self.view[self.start:self.end]
+            self.start, self.end = 0, pending
+        if not self.connect():
+            return []
+        if timeout and self.end == 0:
+            select.select([self.socket], [], [], timeout)
+
+        frames = []
+        while True:
+            self._fill()
+            while self.end - self.start >= FRAME_HEADER.size:
+                length = FRAME_HEADER.unpack_from(self.buffer, self.start)[0]
+                frame_end = self.start + FRAME_HEADER.size + length
+                if frame_end > self.end:
                     break
-                # Handle received data or send responses
-                print(f"Received data: {data.decode()}")
-                self.broadcast(data)
-            except Exception as e:
-                print(f"Error handling data from client: {e}")
+                frames.append(self.view[self.start + FRAME_HEADER.size:frame_end])
+                self.start = frame_end
+            # A full buffer means more may be waiting in the socket: grow it to take the whole backlog,
+            # up to max_buffer_size unless a single frame is larger.
+            if self.socket is None or self.end < len(self.buffer):
+                break
+            needed = self.end - self.start + FRAME_HEADER.size
+            if self.end - self.start >= FRAME_HEADER.size:
+                needed = FRAME_HEADER.size + FRAME_HEADER.unpack_from(self.buffer, self.start)[0]
+            if frames and len(self.buffer) >= self.max_buffer_size:
                 break
-        client.close()
+            self._grow(max(2 * len(self.buffer), needed))
+
+        self.messages_received += len(frames)
+        frames = self._reduce(frames)
+        self.messages_delivered += len(frames)
+        return frames
 
-    def broadcast(self, message):
-        for conn in self.connections:
+    def receive_data(self, timeout=0.0):
+        """ Returns the latest frame as bytes, or None if nothing arrived. Earlier frames count as coalesced. """
+        frames = self.receive_batch(timeout)
+        if not frames:
+            return None
+        self.coalesced += len(frames) - 1
+        return bytes(frames[-1])
+
+    def send(self, payload):
+        """ Sends one length-prefixed frame. Returns False if not connected. """
+        return self.send_many([payload])
+
+    def send_many(self, payloads):
+        """ Sends several frames with a single sendall. Returns False if not connected. """
+        if not self.connect():
+            return False
+        try:
+            self.socket.setblocking(True)
+            self.socket.sendall(b''.join(encode_frame(bytes(payload)) for payload in payloads))
+            return True
+        except OSError as e:
+            self._disconnect(e)
+            return False
+        finally:
+            if self.socket is not None:
+                self.socket.setblocking(False)
+
+    def subscribe(self, topics):
+        """ Adds topics to receive. Returns False if not connected; they are sent on the next connect. """
+        if self.coalesce_key is not None and len((self.topics or set()) | set(topics)) != 1:
+            raise ValueError("Coalescing requires subscribing to exactly one topic")
+        self.topics = (self.topics or set()) | set(topics)
+        return self.send(encode_subscription(topics))
+
+    def unsubscribe(self, topics):
+        self.topics = (self.topics or set()) - set(topics)
+        return self.send(encode_subscription(topics, unsubscribe=True))
+
+    def stats(self):
+        return {
+            'connected': self.socket is not None,
+            'messages_received': self.messages_received,
+            'messages_delivered': self.messages_delivered,
+            'bytes_received': self.bytes_received,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'reconnects': self.reconnects,
+            'buffer_size': len(self.buffer),
+        }
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def _fill(self):
+        """ Reads whatever the socket has into the free space at the end of the buffer. """
+        while self.end < len(self.buffer):
             try:
-                conn.sendall(message)
-            except Exception as e:
-                print(f"Failed to send message to {conn}: {e}")
-                self.connections.remove(conn)
-
-    def stop_server(self):
-        self.active = False
-        self.socket.close()
-        for conn in self.connections:
-            conn.close()
-        print("Server stopped.")
+                received = self.socket.recv_into(self.view[self.end:])
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                self._disconnect(e)
+                return
+            if received == 0:
+                self._disconnect("connection closed by server")
+                return
+            self.end += received
+            self.bytes_received += received
+
+    def _grow(self, size):
+        # Earlier slices keep the old buffer alive, so they stay valid.
+        buffer = bytearray(size)
+        pending = self.end - self.start
+        buffer[:pending] = self.view[self.start:self.end]
+        self.buffer, self.view = buffer, memoryview(buffer)
+        self.start, self.end = 0, pending
+
+    def _reduce(self, frames):
+        """ Applies coalescing and the batch limit. """
+        if self.coalesce_key is not None and len(frames) > 1:
+            seen = set()
+            kept = []
+            for frame in reversed(frames):
+                key = self.coalesce_key(frame)
+                if key is not None:
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                kept.append(frame)
+            self.coalesced += len(frames) - len(kept)
+            frames = kept[::-1]
+        if self.max_batch is not None and len(frames) > self.max_batch:
+            self.dropped += len(frames) - self.max_batch
+            frames = frames[-self.max_batch:]
+        return frames
+
+    def _disconnect(self, reason):
+        print(f"Disconnected from {self.host}:{self.port}: {reason}")
+        self.close()
+        # A partial frame cannot be completed by the next connection.
+        self.end = self.start
+        self.next_attempt = time.monotonic() + self.delay
 
 # Example usage
 if __name__ == "__main__":
-    server = SocketServer()
+    server = AsyncSocketServer()
     try:
-        server.start_server()
+        asyncio.run(server.serve_forever())
     except KeyboardInterrupt:
-        server.stop_server()
+        print("Server stopped.")
@@ -1,15 +1,143 @@
+from ..common import metrics
 from .manager import DbManager
-import sqlite3
+from .columnar import ColumnarStore, NULL_INT, to_nanoseconds
+import os
+import json
 import datetime
+import numpy as np
+import pandas as pd
+
+ORDER_BOOK_COLUMNS = [
+    'received_time', 'sequence_number', 'origin_time',
+    'bid_0_price', 'bid_0_size',
+    'bid_1_price', 'bid_1_size',
+    'bid_2_price', 'bid_2_size',
+    'bid_3_price', 'bid_3_size',
+    'bid_4_price', 'bid_4_size',
+    'bid_5_price', 'bid_5_size',
+    'bid_6_price', 'bid_6_size',
+    'bid_7_price', 'bid_7_size',
+    'bid_8_price', 'bid_8_size',
+    'bid_9_price', 'bid_9_size',
+    'bid_10_price', 'bid_10_size',
+    'bid_11_price', 'bid_11_size',
+    'bid_12_price', 'bid_12_size',
+    'bid_13_price', 'bid_13_size',
+    'bid_14_price', 'bid_14_size',
+    'bid_15_price', 'bid_15_size',
+    'bid_16_price', 'bid_16_size',
+    'bid_17_price', 'bid_17_size',
+    'bid_18_price', 'bid_18_size',
+    'bid_19_price', 'bid_19_size',
+    'ask_0_price', 'ask_0_size',
+    'ask_1_price', 'ask_1_size',
+    'ask_2_price', 'ask_2_size',
+    'ask_3_price', 'ask_3_size',
+    'ask_4_price', 'ask_4_size',
+    'ask_5_price', 'ask_5_size',
+    'ask_6_price', 'ask_6_size',
+    'ask_7_price', 'ask_7_size',
+    'ask_8_price', 'ask_8_size',
+    'ask_9_price', 'ask_9_size',
+    'ask_10_price', 'ask_10_size',
+    'ask_11_price', 'ask_11_size',
+    'ask_12_price', 'ask_12_size',
+    'ask_13_price', 'ask_13_size',
+    'ask_14_price', 'ask_14_size',
+    'ask_15_price', 'ask_15_size',
+    'ask_16_price', 'ask_16_size',
+    'ask_17_price', 'ask_17_size',
+    'ask_18_price', 'ask_18_size',
+    'ask_19_price', 'ask_19_size'
+]
+
+# Set to 1 on rows synthesized by the imputation engine rather than fetched.
+IMPUTED_COLUMN = 'imputed'
+
+# Every price/size level column, in schema order.
+LEVEL_COLUMNS = ORDER_BOOK_COLUMNS[3:]
+
+# Smallest gap recorded in the per-day coverage summary. Gap checks with a smaller
+# threshold can't be answered from the summary and scan the timestamps instead.
+COVERAGE_GAP = datetime.timedelta(minutes=1)
+
+# Version 1 stores timestamps as ISO strings in a rowid table. Version 2 stores int64 nanoseconds in a
+# WITHOUT ROWID table clustered on its primary key, with an index on origin_time.
+SCHEMA_VERSION = 2
+
+COMMON_TABLES = """
+    CREATE TABLE IF NOT EXISTS coverage (
+        day TEXT PRIMARY KEY,
+        rows INTEGER NOT NULL,
+        first_time INTEGER,
+        last_time INTEGER,
+        gaps TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER NOT NULL,
+        applied TEXT NOT NULL
+    );
+"""
+
+
+def order_book_v2_query(table='order_book'):
+    """
+    Returns the version 2 DDL of the order book under `table`. The origin_time index keeps its
+    final name, so a table built under another name (e.g. by the migration) can be renamed into place.
+    Since the table has no rowid, the index also carries the primary key and covers origin_time to
+    received_time lookups on its own.
+    """
+    levels = ",\n".join(f"        {column} REAL" for column in LEVEL_COLUMNS)
+    return f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        received_time INTEGER NOT NULL,
+        sequence_number INTEGER NOT NULL,
+        origin_time INTEGER NOT NULL,
+{levels},
+        {IMPUTED_COLUMN} INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (received_time, sequence_number)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS order_book_origin_time ON {table} (origin_time);
+"""
+
+
+def read_schema_version(conn):
+    """ Returns the order book schema version of a database, or None if it has no order book yet. """
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if 'schema_version' in tables:
+        version = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+        if version is not None:
+            return version
+    # Files from before the version table always hold version 1.
+    return 1 if 'order_book' in tables else None
 
 class AssetPairDbManager(DbManager):
-    def __init__(self, exchange, asset_pair):
-        super().__init__(f"{exchange.value}_{asset_pair.replace('-', '_')}.db")
+    BACKENDS = ('sqlite', 'columnar')
+
+    def __init__(self, exchange, asset_pair, backend='sqlite', db_path="data"):
+        """
+        Args:
+            exchange (Exchange): The exchange the order book belongs to.
+            asset_pair (str): The asset pair, e.g. "ETH-USDT".
+            backend (str): 'sqlite' for the order_book table, or 'columnar' for per-day memory-mappable
+                partitions under `{db_path}/columnar/`.
+            db_path (str): Directory holding the database files.
+        """
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {self.BACKENDS}")
+        name = f"{exchange.value}_{asset_pair.replace('-', '_')}"
+        store = ColumnarStore(os.path.join(db_path, 'columnar', name), ORDER_BOOK_COLUMNS + [IMPUTED_COLUMN]) \
+            if backend == 'columnar' else None
+        self._schema_version, self._schema_cookie = None, None
+        super().__init__(f"{name}.db", db_path=db_path, store=store)
         self.exchange = exchange
         self.asset_pair = asset_pair
+        self.backend = backend
 
     @property
     def create_query(self):
+        if self._schema_version != 1:
+            return order_book_v2_query() + COMMON_TABLES
         return """
             CREATE TABLE IF NOT EXISTS order_book (
                 received_time TEXT NOT NULL,
@@ -55,9 +183,45 @@ class AssetPairDbManager(DbManager):
                 ask_17_price REAL, ask_17_size REAL,
                 ask_18_price REAL, ask_18_size REAL,
                 ask_19_price REAL, ask_19_size REAL,
+                imputed INTEGER NOT NULL DEFAULT 0,
                 PRIMARY KEY (received_time, sequence_number)
-            )
+            );
+        """ + COMMON_TABLES
+
+    def _ensure_db(self):
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+        # Existing files keep their version until migrated; new ones start at the latest.
+        self._schema_version = read_schema_version(self.pool.connection()) or SCHEMA_VERSION
+        super()._ensure_db()
+        with self.pool.write() as conn:
+            if conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == 0:
+                conn.execute("INSERT INTO schema_version VALUES (?, ?)",
+                             (self._schema_version, datetime.datetime.now(datetime.timezone.utc).isoformat()))
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(order_book)")}
+            if IMPUTED_COLUMN not in columns:
+                # Databases created before imputed rows were flagged.
+                conn.execute(f"ALTER TABLE order_book ADD COLUMN {IMPUTED_COLUMN} INTEGER NOT NULL DEFAULT 0")
+
+    @property
+    def schema_version(self):
         """
+        The order book schema version. It is re-read whenever SQLite's schema cookie changes, so a
+        migration finished by another process or thread is picked up by the next query.
+        """
+        conn = self.pool.connection()
+        cookie = conn.execute("PRAGMA schema_version").fetchone()[0]
+        if cookie != self._schema_cookie:
+            self._schema_version = read_schema_version(conn) or SCHEMA_VERSION
+            self._schema_cookie = cookie
+        return self._schema_version
+
+    @property
+    def integer_times(self):
+        return self.store is None and self.schema_version >= 2
+
+    @property
+    def table_name(self):
+        return "order_book"
 
     @property
     def retrieve_query(self):
@@ -69,60 +233,307 @@ class AssetPairDbManager(DbManager):
 
     @property
     def desired_columns(self):
-        return [
-            'received_time', 'sequence_number', 'origin_time',
-            'bid_0_price', 'bid_0_size',
-            'bid_1_price', 'bid_1_size',
-            'bid_2_price', 'bid_2_size',
-            'bid_3_price', 'bid_3_size',
-            'bid_4_price', 'bid_4_size',
-            'bid_5_price', 'bid_5_size',
-            'bid_6_price', 'bid_6_size',
-            'bid_7_price', 'bid_7_size',
-            'bid_8_price', 'bid_8_size',
-            'bid_9_price', 'bid_9_size',
-            'bid_10_price', 'bid_10_size',
-            'bid_11_price', 'bid_11_size',
-            'bid_12_price', 'bid_12_size',
-            'bid_13_price', 'bid_13_size',
-            'bid_14_price', 'bid_14_size',
-            'bid_15_price', 'bid_15_size',
-            'bid_16_price', 'bid_16_size',
-            'bid_17_price', 'bid_17_size',
-            'bid_18_price', 'bid_18_size',
-            'bid_19_price', 'bid_19_size',
-            'ask_0_price', 'ask_0_size',
-            'ask_1_price', 'ask_1_size',
-            'ask_2_price', 'ask_2_size',
-            'ask_3_price', 'ask_3_size',
-            'ask_4_price', 'ask_4_size',
-            'ask_5_price', 'ask_5_size',
-            'ask_6_price', 'ask_6_size',
-            'ask_7_price', 'ask_7_size',
-            'ask_8_price', 'ask_8_size',
-            'ask_9_price', 'ask_9_size',
-            'ask_10_price', 'ask_10_size',
-            'ask_11_price', 'ask_11_size',
-            'ask_12_price', 'ask_12_size',
-            'ask_13_price', 'ask_13_size',
-            'ask_14_price', 'ask_14_size',
-            'ask_15_price', 'ask_15_size',
-            'ask_16_price', 'ask_16_size',
-            'ask_17_price', 'ask_17_size',
-            'ask_18_price', 'ask_18_size',
-            'ask_19_price', 'ask_19_size'
-        ]
+        return ORDER_BOOK_COLUMNS
+
+    def save(self, dataframe):
+        days = self._days_of(dataframe)
+        super().save(dataframe)
+        self._invalidate_coverage(days)
+
+    def bulk_save(self, dataframe, chunk_size=50000, rebuild_indexes=False):
+        rows = super().bulk_save(dataframe, chunk_size, rebuild_indexes)
+        self._invalidate_coverage(self._days_of(dataframe))
+        return rows
 
     def get_latest_timestamp(self):
         """
         Retrieves the latest timestamp from the order_book table.
         Returns None if no data has been gathered yet.
         """
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT MAX(received_time) FROM order_book")
-            latest_timestamp = cursor.fetchone()[0]  # This will be None if no rows are returned
-            if latest_timestamp is not None:
-                # Assuming the timestamp is stored in ISO format (e.g., '2020-10-10T14:00:00')
-                return datetime.datetime.fromisoformat(latest_timestamp)
+        if self.store is not None:
+            return self.store.get_latest_timestamp()
+        conn = self.pool.connection()
+        latest_timestamp = conn.execute("SELECT MAX(received_time) FROM order_book").fetchone()[0]
+        if latest_timestamp is None:
             return None
+        if self.integer_times:
+            return pd.Timestamp(latest_timestamp).to_pydatetime()
+        # Assuming the timestamp is stored in ISO format (e.g., '2020-10-10T14:00:00')
+        return datetime.datetime.fromisoformat(latest_timestamp)
+
+    def _check_columns(self, columns, time_column):
+        columns = LEVEL_COLUMNS if columns is None else list(columns)
+        unknown = [c for c in columns + [time_column] if c not in ORDER_BOOK_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown order_book columns: {unknown}")
+        if self.store is not None and time_column != 'received_time':
+            raise ValueError("The columnar backend is only ordered by received_time")
+        return columns
+
+    @metrics.timed('db.read_range')
+    def read_range(self, start, end, columns=None, time_column='received_time', chunk_size=10000):
+        """
+        Reads a time window of snapshots into typed NumPy arrays.
+
+        The result is counted first and preallocated, then filled chunk by chunk straight from
+        the cursor, so no intermediate DataFrames are built.
+
+        Args:
+            start (datetime.datetime): Inclusive start of the window.
+            end (datetime.datetime): Inclusive end of the window.
+            columns (list): Level columns to read, e.g. ['bid_0_price', 'ask_0_price'].
+                Defaults to every price/size column.
+            time_column (str): Timestamp column to filter and order on, 'received_time' or 'origin_time'.
+            chunk_size (int): Rows fetched from SQLite per round trip.
+
+        Returns:
+            tuple: (timestamps, values) where timestamps is an int64 nanosecond array of shape (n,)
+                and values is a C-contiguous float64 array of shape (n, len(columns)).
+        """
+        columns = self._check_columns(columns, time_column)
+        if self.store is not None:
+            return self._read_store(self.store.read_range(start, end, columns), columns)
+
+        # Count and fill from the same read transaction so a concurrent writer can't change n.
+        with self.pool.read() as conn:
+            where = f"FROM order_book WHERE {time_column} BETWEEN ? AND ?"
+            params = (self._time_param(start), self._time_param(end))
+            count = conn.execute(f"SELECT COUNT(*) {where}", params).fetchone()[0]
+            timestamps = np.empty(count, dtype=np.int64)
+            values = np.empty((count, len(columns)), dtype=np.float64)
+
+            cursor = conn.execute(f"SELECT {', '.join([time_column] + columns)} {where} ORDER BY {time_column}", params)
+            position = 0
+            while True:
+                records = cursor.fetchmany(chunk_size)
+                if not records:
+                    break
+                end_position = position + len(records)
+                timestamps[position:end_position] = self._parse_times([r[0] for r in records])
+                values[position:end_position] = [r[1:] for r in records]
+                position = end_position
+        return timestamps, values
+
+    def iter_range(self, start, end, columns=None, time_column='received_time', chunk_size=100000):
+        """
+        Streaming variant of `read_range` for windows too large to hold in memory.
+
+        Yields:
+            tuple: (timestamps, values) arrays as in `read_range`, at most `chunk_size` rows each
+                (one day partition at a time for the columnar backend).
+        """
+        columns = self._check_columns(columns, time_column)
+        if self.store is not None:
+            for partition in self.store.scan(start, end, columns):
+                yield self._read_store(partition, columns)
+            return
+
+        cursor = self.pool.connection().execute(
+            f"SELECT {', '.join([time_column] + columns)} FROM order_book "
+            f"WHERE {time_column} BETWEEN ? AND ? ORDER BY {time_column}",
+            (self._time_param(start), self._time_param(end))
+        )
+        try:
+            while True:
+                records = cursor.fetchmany(chunk_size)
+                if not records:
+                    break
+                timestamps = self._parse_times([r[0] for r in records])
+                values = np.array([r[1:] for r in records], dtype=np.float64)
+                yield timestamps, values
+        finally:
+            # An abandoned iteration must not keep its snapshot open on the pooled connection.
+            cursor.close()
+
+    @staticmethod
+    def _read_store(partition, columns):
+        """ Packs columnar store arrays into the (timestamps, values) layout of `read_range`. """
+        timestamps = np.ascontiguousarray(partition['received_time'])
+        values = np.empty((len(timestamps), len(columns)), dtype=np.float64)
+        for i, column in enumerate(columns):
+            values[:, i] = partition[column]
+        return timestamps, values
+
+    @staticmethod
+    def _days_of(dataframe):
+        if dataframe.empty or 'received_time' not in dataframe.columns:
+            return []
+        return pd.to_datetime(dataframe['received_time']).dt.strftime('%Y-%m-%d').unique().tolist()
+
+    def _invalidate_coverage(self, days):
+        """ Drops the coverage summaries of days that just received new rows. """
+        if self.store is not None or not days:
+            return
+        with self.pool.write() as conn:
+            conn.executemany("DELETE FROM coverage WHERE day = ?", [(day,) for day in days])
+
+    def has_data(self, start, end):
+        """ Returns True if any snapshot was received within [start, end]. """
+        if self.store is not None:
+            return any(True for _ in self.store.scan(start, end, []))
+        row = self.pool.connection().execute(
+            "SELECT 1 FROM order_book WHERE received_time BETWEEN ? AND ? LIMIT 1",
+            (self._time_param(start), self._time_param(end))
+        ).fetchone()
+        return row is not None
+
+    def _scan_gaps(self, start, end, threshold_ns):
+        """
+        Scans received_time over [start, end] with a vectorized diff, one chunk at a time.
+
+        Returns:
+            tuple: (gaps, rows, first, last) where gaps is a list of [before_ns, after_ns] pairs
+                whose distance exceeds threshold_ns, and first/last are int64 ns or None.
+        """
+        gaps, rows, first, last = [], 0, None, None
+        for timestamps, _ in self.iter_range(start, end, columns=[]):
+            if len(timestamps) == 0:
+                continue
+            if last is not None:
+                timestamps = np.concatenate([[last], timestamps])
+            else:
+                first = int(timestamps[0])
+            rows += len(timestamps) - (1 if last is not None else 0)
+            breaks = np.flatnonzero(np.diff(timestamps) > threshold_ns)
+            gaps.extend([int(timestamps[i]), int(timestamps[i + 1])] for i in breaks)
+            last = int(timestamps[-1])
+        return gaps, rows, first, last
+
+    def refresh_coverage(self, start, end):
+        """
+        Ensures every day in [start, end] has a coverage summary and returns them.
+
+        A summary records the row count, first/last received_time and every internal gap longer than
+        COVERAGE_GAP. Saving rows into a day discards its summary, so only new or changed days are scanned.
+
+        Args:
+            start (datetime.date): First day.
+            end (datetime.date): Last day.
+
+        Returns:
+            list: (day, rows, first_ns, last_ns, gaps) tuples in day order.
+        """
+        days = []
+        current = start
+        while current <= end:
+            days.append(current.isoformat())
+            current += datetime.timedelta(days=1)
+
+        placeholders = ', '.join(['?'] * len(days))
+        known = {row[0]: row for row in self.pool.connection().execute(
+            f"SELECT day, rows, first_time, last_time, gaps FROM coverage WHERE day IN ({placeholders})", days
+        )}
+        threshold_ns = int(COVERAGE_GAP / datetime.timedelta(microseconds=1)) * 1000
+        summaries = []
+        for day in days:
+            if day not in known:
+                day_start = datetime.datetime.fromisoformat(day)
+                day_end = day_start + datetime.timedelta(days=1) - datetime.timedelta(microseconds=1)
+                gaps, rows, first, last = self._scan_gaps(day_start, day_end, threshold_ns)
+                known[day] = (day, rows, first, last, json.dumps(gaps))
+                with self.pool.write() as conn:
+                    conn.execute("INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?)", known[day])
+            day, rows, first, last, gaps = known[day]
+            summaries.append((day, rows, first, last, json.loads(gaps)))
+        return summaries
+
+    def day_signatures(self, start, end):
+        """
+        Cheap per-day fingerprints for keeping derived data (features, bars) in sync with the book.
+
+        SQLite days come from the coverage summaries, which are dropped whenever a day receives
+        rows; columnar days from their received_time partitions.
+
+        Args:
+            start (datetime.date): First day.
+            end (datetime.date): Last day.
+
+        Yields:
+            tuple: (day, [rows, first_ns, last_ns]) for every day in range, with first/last None for empty days.
+        """
+        if self.store is None:
+            for day, rows, first, last, _ in self.refresh_coverage(start, end):
+                yield datetime.date.fromisoformat(day), [rows, first, last]
+            return
+        day = start
+        while day <= end:
+            partition = self.store.load_day(day, ['received_time'])
+            received = partition['received_time'] if partition is not None else []
+            yield day, [len(received), int(received[0]) if len(received) else None,
+                        int(received[-1]) if len(received) else None]
+            day += datetime.timedelta(days=1)
+
+    @metrics.timed('db.find_gaps')
+    def find_gaps(self, start, end, threshold=COVERAGE_GAP):
+        """
+        Finds every pair of consecutive snapshots within [start, end] that are more than `threshold` apart.
+
+        With the SQLite backend and threshold >= COVERAGE_GAP the answer comes from the per-day
+        coverage summaries, so repeated checks cost O(days). Otherwise the timestamps are scanned
+        in chunks with np.diff.
+
+        Returns:
+            list: Sorted, non-overlapping (before, after) datetime tuples, where `before` is the last
+                snapshot ahead of the gap and `after` the first one following it.
+        """
+        threshold_ns = int(threshold / datetime.timedelta(microseconds=1)) * 1000
+        if self.store is not None or threshold < COVERAGE_GAP:
+            gaps = self._scan_gaps(start, end, threshold_ns)[0]
+        else:
+            gaps, previous_last = [], None
+            for _, rows, first, last, day_gaps in self.refresh_coverage(start.date(), end.date()):
+                if rows == 0:
+                    continue
+                if previous_last is not None and first - previous_last > threshold_ns:
+                    gaps.append([previous_last, first])
+                gaps.extend(gap for gap in day_gaps if gap[1] - gap[0] > threshold_ns)
+                previous_last = last
+            # Only gaps whose both ends fall inside the window, as a scan of the window would report.
+            start_ns, end_ns = to_nanoseconds([start])[0], to_nanoseconds([end])[0]
+            gaps = [gap for gap in gaps if gap[0] >= start_ns and gap[1] <= end_ns]
+        return [(pd.Timestamp(before).to_pydatetime(), pd.Timestamp(after).to_pydatetime()) for before, after in gaps]
+
+    def boundary_snapshots(self, times, side, columns=None, within=datetime.timedelta(days=1)):
+        """
+        Looks up the nearest snapshot on one side of each timestamp, e.g. the edges of a gap.
+
+        Each lookup is a single indexed `LIMIT 1` query, so only the boundary rows are read.
+
+        Args:
+            times (list): datetimes to look around.
+            side (str): 'before' for the last snapshot at or before each time, 'after' for the first
+                at or after it.
+            columns (list): Level columns to return. Defaults to every price/size column.
+            within (datetime.timedelta): How far from each time to look.
+
+        Returns:
+            tuple: (timestamps, values) as in `read_range`, one row per entry of `times`. Times with
+                no snapshot within range get NULL_INT and a row of NaN.
+        """
+        if side not in ('before', 'after'):
+            raise ValueError(f"Unknown side '{side}', expected 'before' or 'after'")
+        columns = self._check_columns(columns, 'received_time')
+        timestamps = np.full(len(times), NULL_INT, dtype=np.int64)
+        values = np.full((len(times), len(columns)), np.nan)
+        windows = [(time - within, time) if side == 'before' else (time, time + within) for time in times]
+
+        if self.store is not None:
+            for i, (start, end) in enumerate(windows):
+                slices = list(self.store.scan(start, end, columns))
+                if slices:
+                    partition = slices[-1] if side == 'before' else slices[0]
+                    row = -1 if side == 'before' else 0
+                    timestamps[i] = partition['received_time'][row]
+                    values[i] = [partition[column][row] for column in columns]
+            return timestamps, values
+
+        order = 'DESC' if side == 'before' else 'ASC'
+        sql = (f"SELECT {', '.join(['received_time'] + columns)} FROM order_book "
+               f"WHERE received_time BETWEEN ? AND ? ORDER BY received_time {order} LIMIT 1")
+        conn = self.pool.connection()
+        for i, (start, end) in enumerate(windows):
+            row = conn.execute(sql, (self._time_param(start), self._time_param(end))).fetchone()
+            if row is not None:
+                timestamps[i] = self._parse_times([row[0]])[0]
+                values[i] = row[1:]
+        return timestamps, values
@@ -0,0 +1,231 @@
+import datetime
+import json
+import os
+import re
+import shutil
+import numpy as np
+from .columnar import to_nanoseconds
+
+# Resolutions materialized per day. Each is rolled up from the one before it, never from raw rows.
+STORED_RESOLUTIONS = (('1s', 1), ('1m', 60), ('1h', 3600))
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+EPOCH = datetime.date(1970, 1, 1)
+DAY_NS = 86400 * 1000000000
+
+# One bar. Prices are of the mid; microprice, spread, depths and imbalance are means over the
+# snapshots in the bar, and depths sum the sizes of the top `depth` levels of each side.
+BAR_DTYPE = np.dtype([
+    ('time', '<i8'), ('count', '<i8'),
+    ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+    ('microprice', '<f8'), ('spread', '<f8'), ('max_spread', '<f8'),
+    ('bid_depth', '<f8'), ('ask_depth', '<f8'), ('imbalance', '<f8'),
+])
+MEAN_FIELDS = ('microprice', 'spread', 'bid_depth', 'ask_depth', 'imbalance')
+
+
+def parse_resolution(resolution):
+    """ Converts '1s', '5m', '4h', '1d' or a number of seconds into whole seconds. """
+    if isinstance(resolution, (int, np.integer)):
+        return int(resolution)
+    match = re.fullmatch(r'(\d+)([smhd])', resolution)
+    if match is None:
+        raise ValueError(f"Unknown resolution '{resolution}', expected e.g. '1s', '5m', '1h' or '1d'")
+    return int(match.group(1)) * UNITS[match.group(2)]
+
+
+def book_columns(depth):
+    """ Columns `book_bars` reads: price and size of both sides, level by level. """
+    return [f'{side}_{i}_{field}' for i in range(depth) for side in ('bid', 'ask') for field in ('price', 'size')]
+
+
+def _buckets(times, seconds):
+    """ Returns (bucket start times, first row of each bucket) of sorted nanosecond times. """
+    buckets = times // (seconds * 1000000000)
+    starts = np.flatnonzero(np.diff(buckets, prepend=buckets[:1] - 1))
+    return buckets[starts] * seconds * 1000000000, starts
+
+
+def book_bars(timestamps, values, seconds, depth):
+    """
+    Aggregates raw snapshots into bars.
+
+    Args:
+        timestamps (np.ndarray): Sorted int64 nanosecond received times.
+        values (np.ndarray): (rows, depth * 4) values in the order of `book_columns(depth)`.
+        seconds (int): Bar duration.
+        depth (int): Levels per side summed into the depths.
+
+    Returns:
+        np.ndarray: BAR_DTYPE array, one bar per interval holding snapshots. Snapshots without a
+            best bid and ask are skipped.
+    """
+    levels = values.reshape(len(values), depth, 2, 2)  # (row, level, bid/ask, price/size)
+    bid, bid_size = levels[:, 0, 0, 0], levels[:, 0, 0, 1]
+    ask, ask_size = levels[:, 0, 1, 0], levels[:, 0, 1, 1]
+    valid = ~(np.isnan(bid) | np.isnan(ask))
+    if not valid.all():
+        timestamps, levels = timestamps[valid], levels[valid]
+        bid, bid_size, ask, ask_size = bid[valid], bid_size[valid], ask[valid], ask_size[valid]
+    if not len(timestamps):
+        return np.zeros(0, dtype=BAR_DTYPE)
+
+    mid = (bid + ask) / 2
+    spread = ask - bid
+    bid_depth = np.nansum(levels[:, :, 0, 1], axis=1)
+    ask_depth = np.nansum(levels[:, :, 1, 1], axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        microprice = np.where(bid_size + ask_size > 0, (bid * ask_size + ask * bid_size) / (bid_size + ask_size), mid)
+        imbalance = np.where(bid_depth + ask_depth > 0, (bid_depth - ask_depth) / (bid_depth + ask_depth), 0.0)
+
+    times, starts = _buckets(timestamps, seconds)
+    ends = np.append(starts[1:], len(timestamps))
+    count = ends - starts
+    bars = np.empty(len(starts), dtype=BAR_DTYPE)
+    bars['time'], bars['count'] = times, count
+    bars['open'], bars['close'] = mid[starts], mid[ends - 1]
+    bars['high'], bars['low'] = np.maximum.reduceat(mid, starts), np.minimum.reduceat(mid, starts)
+    bars['max_spread'] = np.maximum.reduceat(spread, starts)
+    for field, series in zip(MEAN_FIELDS, (microprice, spread, bid_depth, ask_depth, imbalance)):
+        bars[field] = np.add.reduceat(series, starts) / count
+    return bars
+
+
+def rollup(bars, seconds):
+    """ Aggregates bars into coarser bars of `seconds`, weighting the means by snapshot count. """
+    if not len(bars):
+        return bars
+    times, starts = _buckets(bars['time'], seconds)
+    ends = np.append(starts[1:], len(bars))
+    count = np.add.reduceat(bars['count'], starts)
+    rolled = np.empty(len(starts), dtype=BAR_DTYPE)
+    rolled['time'], rolled['count'] = times, count
+    rolled['open'], rolled['close'] = bars['open'][starts], bars['close'][ends - 1]
+    rolled['high'] = np.maximum.reduceat(bars['high'], starts)
+    rolled['low'] = np.minimum.reduceat(bars['low'], starts)
+    rolled['max_spread'] = np.maximum.reduceat(bars['max_spread'], starts)
+    for field in MEAN_FIELDS:
+        rolled[field] = np.add.reduceat(bars[field] * bars['count'], starts) / count
+    return rolled
+
+
+class BarStore:
+    """
+    Multi-resolution bars of an AssetPairDbManager, materialized one day at a time.
+
+    Each day is read from the book once and aggregated into 1s bars, which are rolled up into 1m
+    and those into 1h bars; every resolution is saved as a structured .npy file. A manifest records
+    the (rows, first, last) signature of each source day (`AssetPairDbManager.day_signatures`), so
+    `update` only rebuilds days that collect.py ingested or backfilled since the last update.
+
+    `bars` serves any resolution without touching raw rows: stored resolutions are memory-mapped
+    and sliced, others are rolled up from the coarsest stored resolution that divides them, so a
+    request costs O(bars) rather than O(snapshots).
+    """
+
+    def __init__(self, db, depth=5, root="data/bars"):
+        """
+        Args:
+            db (AssetPairDbManager): Source of the order book.
+            depth (int): Levels per side summed into the depth and imbalance fields.
+            root (str): Directory holding the stores.
+        """
+        self.db = db
+        self.depth = depth
+        self.columns = book_columns(depth)
+        name = os.path.splitext(os.path.basename(db.db_file))[0]
+        self.root = os.path.join(root, f"{name}_{getattr(db, 'backend', 'sqlite')}_depth{depth}")
+        self.manifest_path = os.path.join(self.root, "manifest.json")
+        os.makedirs(self.root, exist_ok=True)
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def days(self):
+        """ Returns the sorted days (datetime.date) with bars. """
+        return sorted(datetime.date.fromisoformat(day) for day, signature in self.manifest.items() if signature[0])
+
+    def update(self, start_date, end_date):
+        """
+        Builds the bars of every day in [start_date, end_date] that is new or changed in the database.
+
+        Returns:
+            list: The days (datetime.date) that were (re)built.
+        """
+        rebuilt = []
+        for day, signature in self.db.day_signatures(start_date, end_date):
+            key = day.isoformat()
+            if self.manifest.get(key) == signature:
+                continue
+            if signature[0] == 0:
+                shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            else:
+                self._build_day(day)
+            self.manifest[key] = signature
+            rebuilt.append(day)
+            self._write_manifest()
+        if rebuilt:
+            print(f"Bar store: rebuilt {len(rebuilt)} days up to {rebuilt[-1]}.")
+        return rebuilt
+
+    def _build_day(self, day):
+        start = datetime.datetime.combine(day, datetime.time())
+        end = start + datetime.timedelta(days=1) - datetime.timedelta(microseconds=1)
+        timestamps, values = self.db.read_range(start, end, self.columns)
+        path = os.path.join(self.root, day.isoformat())
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        bars = None
+        for name, seconds in STORED_RESOLUTIONS:
+            bars = book_bars(timestamps, values, seconds, self.depth) if bars is None else rollup(bars, seconds)
+            np.save(os.path.join(tmp_path, f"{name}.npy"), bars)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    def _write_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def load_day(self, day, resolution='1m'):
+        """
+        Returns:
+            np.ndarray: The memory-mapped BAR_DTYPE bars of one day at a stored resolution, or None.
+        """
+        if not self.manifest.get(day.isoformat(), [0])[0]:
+            return None
+        return np.load(os.path.join(self.root, day.isoformat(), f"{resolution}.npy"), mmap_mode='r')
+
+    def bars(self, start, end, resolution='1m'):
+        """
+        Bars starting within [start, end).
+
+        Args:
+            start (datetime.datetime): Start of the range.
+            end (datetime.datetime): End of the range, exclusive.
+            resolution (str): Bar duration, e.g. '1s', '1m', '5m', '1h', '1d', or seconds.
+
+        Returns:
+            np.ndarray: BAR_DTYPE bars in time order. Intervals without snapshots have no bar.
+        """
+        seconds = parse_resolution(resolution)
+        stored, stored_seconds = next((name, s) for name, s in reversed(STORED_RESOLUTIONS) if seconds % s == 0)
+        # Bars starting in [start, end) are exactly those starting in [lo, hi), both rounded up to whole bars,
+        # and they are built from the stored bars in the same window.
+        step = seconds * 1000000000
+        start_ns, end_ns = to_nanoseconds([start, end])
+        lo, hi = -(-start_ns // step) * step, -(-end_ns // step) * step
+
+        chunks = []
+        for day in self.days():
+            day_ns = (day - EPOCH).days * DAY_NS
+            if day_ns + DAY_NS <= lo or day_ns >= hi:
+                continue
+            day_bars = self.load_day(day, stored)
+            times = day_bars['time']
+            chunks.append(day_bars[np.searchsorted(times, lo):np.searchsorted(times, hi)])
+        bars = np.concatenate(chunks) if chunks else np.zeros(0, dtype=BAR_DTYPE)
+        return bars if seconds == stored_seconds else rollup(bars, seconds)
@@ -0,0 +1,343 @@
+import io
+import os
+import shutil
+import sqlite3
+import datetime
+import numpy as np
+import pandas as pd
+
+# Sentinel stored in int64 columns for missing values. For the timestamp columns this is
+# the same bit pattern numpy uses for NaT, so a `.view('datetime64[ns]')` round trips.
+NULL_INT = np.iinfo(np.int64).min
+
+TIME_COLUMNS = ('received_time', 'origin_time')
+INT_COLUMNS = TIME_COLUMNS + ('sequence_number', 'imputed')
+
+# Value used for a missing int column, or for a column an older partition was written without.
+INT_DEFAULTS = {'imputed': 0}
+
+
+def to_nanoseconds(values):
+    """
+    Converts datetimes, ISO strings or datetime64 values into an int64 nanosecond array.
+
+    Args:
+        values: A pandas Series, numpy array or list of timestamps. Missing values become NULL_INT.
+
+    Returns:
+        np.ndarray: int64 nanoseconds since the epoch.
+    """
+    if isinstance(values, pd.Series) and isinstance(values.dtype, pd.DatetimeTZDtype):
+        values = values.dt.tz_convert('UTC').dt.tz_localize(None)
+    array = np.asarray(values)
+    if array.dtype.kind != 'M':
+        array = np.array([None if pd.isnull(v) else v for v in array], dtype='datetime64[ns]')
+    return array.astype('datetime64[ns]').view(np.int64)
+
+
+def day_of(nanoseconds):
+    """ Returns the UTC calendar day (datetime.date) containing an int64 nanosecond timestamp. """
+    return np.datetime64(int(nanoseconds), 'ns').astype('datetime64[D]').item()
+
+
+class ColumnarStore:
+    """
+    Per-day partitioned, column-oriented store for order book snapshots.
+
+    Each day lives in its own directory holding one `.npy` file per column: int64 nanoseconds
+    for the timestamp columns, int64 for `sequence_number` and float64 for every price/size level.
+    Rows inside a partition are sorted by (received_time, sequence_number), so readers can
+    memory-map a partition and binary search it for zero-copy range slices. Rows that sort after
+    everything in their partition, as live and forward backfill writes do, are appended to the
+    column files in place; only rows landing inside a partition's range rewrite it.
+    """
+
+    def __init__(self, root, columns):
+        """
+        Args:
+            root (str): Directory holding the day partitions.
+            columns (list): Full list of columns stored per row, e.g. AssetPairDbManager.desired_columns.
+        """
+        self.root = root
+        self.columns = list(columns)
+        os.makedirs(self.root, exist_ok=True)
+
+    def days(self):
+        """ Returns the sorted list of days (datetime.date) that have a partition on disk. """
+        days = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path) or '.' in name:
+                continue
+            days.append(datetime.date.fromisoformat(name))
+        return sorted(days)
+
+    def _day_path(self, day):
+        return os.path.join(self.root, day.isoformat())
+
+    def load_day(self, day, columns=None, mmap_mode='r'):
+        """
+        Opens a day partition.
+
+        Args:
+            day (datetime.date): The partition to open.
+            columns (list): Subset of columns to open. Defaults to all stored columns.
+            mmap_mode (str): Passed to np.load; 'r' memory-maps the files, None reads them into memory.
+
+        Returns:
+            dict: Column name to array, or None if the partition does not exist.
+        """
+        path = self._day_path(day)
+        if not os.path.isdir(path):
+            return None
+        columns = self.columns if columns is None else columns
+        # received_time is the length of the partition; an interrupted append can leave other columns longer.
+        length = len(np.load(os.path.join(path, "received_time.npy"), mmap_mode='r'))
+        partition = {}
+        for column in columns:
+            file = os.path.join(path, f"{column}.npy")
+            if os.path.exists(file):
+                partition[column] = np.load(file, mmap_mode=mmap_mode)[:length]
+            else:
+                # Written before the column existed.
+                partition[column] = np.full(length, *self._null(column))
+        return partition
+
+    @staticmethod
+    def _null(column):
+        """ Returns the (fill value, dtype) used for missing values of a column. """
+        if column in INT_COLUMNS:
+            return INT_DEFAULTS.get(column, NULL_INT), np.int64
+        return np.nan, np.float64
+
+    def _columns_from_frame(self, dataframe):
+        """ Converts a DataFrame into the typed column arrays used on disk. """
+        length = len(dataframe)
+        arrays = {}
+        for column in self.columns:
+            if column not in dataframe.columns:
+                arrays[column] = np.full(length, *self._null(column))
+            elif column in TIME_COLUMNS:
+                arrays[column] = to_nanoseconds(dataframe[column])
+            elif column in INT_COLUMNS:
+                values = pd.to_numeric(dataframe[column], errors='coerce')
+                arrays[column] = values.fillna(self._null(column)[0]).to_numpy(dtype=np.int64)
+            else:
+                arrays[column] = pd.to_numeric(dataframe[column], errors='coerce').to_numpy(dtype=np.float64)
+        return arrays
+
+    def save(self, dataframe: pd.DataFrame):
+        """
+        Saves snapshots into their day partitions.
+
+        Rows are merged with whatever the partition already holds, keeping the existing row when
+        (received_time, sequence_number) collides, mirroring the `INSERT OR IGNORE` semantics
+        of the SQLite backend.
+        """
+        if dataframe.empty:
+            return
+        arrays = self._columns_from_frame(dataframe)
+        received = arrays['received_time']
+        days = received.astype('datetime64[ns]').astype('datetime64[D]')
+        for day in np.unique(days):
+            mask = days == day
+            self._merge_day(day.item(), {column: values[mask] for column, values in arrays.items()})
+
+    @staticmethod
+    def _sort_unique(arrays):
+        """ Sorts rows by (received_time, sequence_number), keeping the first of each duplicate key. """
+        # lexsort is stable, so earlier rows stay ahead of later duplicates and win below.
+        order = np.lexsort((arrays['sequence_number'], arrays['received_time']))
+        arrays = {column: values[order] for column, values in arrays.items()}
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = (np.diff(arrays['received_time']) != 0) | (np.diff(arrays['sequence_number']) != 0)
+        return {column: np.ascontiguousarray(values[keep]) for column, values in arrays.items()}
+
+    def _merge_day(self, day, arrays):
+        arrays = self._sort_unique(arrays)
+        existing = self.load_day(day, ['received_time', 'sequence_number'])
+        if existing is None or not len(existing['received_time']):
+            self._write_day(day, arrays)
+            return
+        last = (existing['received_time'][-1], existing['sequence_number'][-1])
+        if (arrays['received_time'][0], arrays['sequence_number'][0]) > last and self._append_day(day, arrays):
+            return
+
+        existing = self.load_day(day, mmap_mode=None)
+        self._write_day(day, self._sort_unique(
+            {column: np.concatenate([existing[column], arrays[column]]) for column in self.columns}))
+
+    def _append_day(self, day, arrays):
+        """
+        Appends rows that sort after the whole partition to its column files in place.
+
+        Returns:
+            bool: False, with nothing written, if a column file is missing or its header can't
+                hold the new length; the partition is then rewritten instead.
+        """
+        path = self._day_path(day)
+        length = len(np.load(os.path.join(path, "received_time.npy"), mmap_mode='r'))
+        headers = {}
+        for column in self.columns:
+            file = os.path.join(path, f"{column}.npy")
+            if not os.path.exists(file):
+                return False
+            with open(file, 'rb') as f:
+                version = np.lib.format.read_magic(f)
+                if version not in ((1, 0), (2, 0)):
+                    return False
+                read, write = ((np.lib.format.read_array_header_1_0, np.lib.format.write_array_header_1_0)
+                               if version == (1, 0) else
+                               (np.lib.format.read_array_header_2_0, np.lib.format.write_array_header_2_0))
+                _, fortran_order, dtype = read(f)
+                offset = f.tell()
+            header = io.BytesIO()
+            write(header, {'shape': (length + len(arrays[column]),), 'fortran_order': fortran_order,
+                           'descr': np.lib.format.dtype_to_descr(dtype)})
+            # np.save pads headers so the length can grow without moving the data.
+            if header.tell() != offset or dtype != arrays[column].dtype:
+                return False
+            headers[column] = (offset + length * dtype.itemsize, header.getvalue())
+
+        # received_time goes last: until its header grows, readers see the partition as it was.
+        for column in sorted(self.columns, key=lambda column: column == 'received_time'):
+            end, header = headers[column]
+            with open(os.path.join(path, f"{column}.npy"), 'r+b') as f:
+                f.seek(end)
+                f.write(arrays[column].tobytes())
+                f.truncate()
+                f.seek(0)
+                f.write(header)
+        return True
+
+    def _write_day(self, day, arrays):
+        """ Writes a partition to a temporary directory, then swaps it into place. """
+        path = self._day_path(day)
+        tmp_path, old_path = f"{path}.tmp", f"{path}.old"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for column, values in arrays.items():
+            np.save(os.path.join(tmp_path, f"{column}.npy"), values)
+        if os.path.isdir(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    def scan(self, start, end, columns=None):
+        """
+        Yields zero-copy slices of the partitions overlapping [start, end].
+
+        Args:
+            start (datetime.datetime): Inclusive start of the window (received_time).
+            end (datetime.datetime): Inclusive end of the window (received_time).
+            columns (list): Columns to include. `received_time` is always included.
+
+        Yields:
+            dict: Column name to a memory-mapped view, one dict per day partition.
+        """
+        columns = self.columns if columns is None else columns
+        if 'received_time' not in columns:
+            columns = ['received_time'] + list(columns)
+        start_ns, end_ns = to_nanoseconds([start])[0], to_nanoseconds([end])[0]
+        first, last = day_of(start_ns), day_of(end_ns)
+        for day in self.days():
+            if day < first or day > last:
+                continue
+            partition = self.load_day(day, columns)
+            received = partition['received_time']
+            lo = np.searchsorted(received, start_ns, side='left')
+            hi = np.searchsorted(received, end_ns, side='right')
+            if hi > lo:
+                yield {column: values[lo:hi] for column, values in partition.items()}
+
+    def read_range(self, start, end, columns=None):
+        """
+        Reads [start, end] into contiguous in-memory arrays, concatenating across day partitions.
+
+        Returns:
+            dict: Column name to array. Empty arrays if nothing is stored in the window.
+        """
+        slices = list(self.scan(start, end, columns))
+        if not slices:
+            columns = self.columns if columns is None else ['received_time'] + [c for c in columns if c != 'received_time']
+            return {column: np.empty(0, dtype=np.int64 if column in INT_COLUMNS else np.float64) for column in columns}
+        return {column: np.concatenate([s[column] for s in slices]) for column in slices[0]}
+
+    def retrieve(self, start, end):
+        """ Same contract as DbManager.retrieve: a list of received_time datetimes within the window. """
+        received = self.read_range(start, end, ['received_time'])['received_time']
+        return pd.to_datetime(received).tolist()
+
+    def get_latest_timestamp(self):
+        """ Returns the latest received_time stored, or None if the store is empty. """
+        days = self.days()
+        if not days:
+            return None
+        received = self.load_day(days[-1], ['received_time'])['received_time']
+        return pd.Timestamp(int(received[-1])).to_pydatetime()
+
+
+def convert_sqlite(db_file, store, chunk_size=100000):
+    """
+    Converts an existing SQLite `order_book` table into a ColumnarStore.
+
+    Rows are streamed in received_time order and buffered one day at a time, so each
+    partition is written once. Both schema versions are read: ISO string timestamps (version 1)
+    and int64 nanoseconds (version 2).
+
+    Args:
+        db_file (str): Path to the SQLite database, e.g. 'data/BINANCE_ETH_USDT.db'.
+        store (ColumnarStore): Destination store.
+        chunk_size (int): Rows fetched from SQLite per round trip.
+
+    Returns:
+        int: Number of rows converted.
+    """
+    total = 0
+    pending = []
+    pending_day = None
+    with sqlite3.connect(db_file) as conn:
+        # Older files may predate some columns; the store fills those with their defaults.
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(order_book)")}
+        columns = [column for column in store.columns if column in existing]
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(columns)} FROM order_book ORDER BY received_time, sequence_number")
+        while True:
+            records = cursor.fetchmany(chunk_size)
+            if not records:
+                break
+            chunk = pd.DataFrame(records, columns=columns)
+            if chunk['received_time'].dtype.kind == 'i':
+                for column in TIME_COLUMNS:
+                    if column in chunk:
+                        chunk[column] = chunk[column].to_numpy(dtype=np.int64).view('datetime64[ns]')
+                chunk_days = chunk['received_time'].dt.strftime('%Y-%m-%d')
+            else:
+                chunk_days = chunk['received_time'].str.slice(0, 10)
+            for day, rows in chunk.groupby(chunk_days, sort=True):
+                if pending_day is not None and day != pending_day:
+                    store.save(pd.concat(pending))
+                    pending = []
+                pending_day = day
+                pending.append(rows)
+            total += len(records)
+            print(f"Converted {total} rows...")
+    if pending:
+        store.save(pd.concat(pending))
+    return total
+
+
+if __name__ == "__main__":
+    import argparse
+    from .asset import ORDER_BOOK_COLUMNS, IMPUTED_COLUMN
+
+    parser = argparse.ArgumentParser(description="Convert SQLite order_book databases into columnar day partitions.")
+    parser.add_argument('db_files', nargs='+', help="SQLite files to convert, e.g. data/BINANCE_ETH_USDT.db")
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    args = parser.parse_args()
+
+    for db_file in args.db_files:
+        root = os.path.join(os.path.dirname(db_file), 'columnar', os.path.splitext(os.path.basename(db_file))[0])
+        store = ColumnarStore(root, ORDER_BOOK_COLUMNS + [IMPUTED_COLUMN])
+        rows = convert_sqlite(db_file, store, args.chunk_size)
+        print(f"Converted {rows} rows from {db_file} into {root}")
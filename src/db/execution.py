@@ -1,9 +1,14 @@
+from ..common import metrics
 from .manager import DbManager
-import sqlite3
+from .columnar import to_nanoseconds
+import numpy as np
+import pandas as pd
 
 class ExecutionDbManager(DbManager):
-    def __init__(self):
-        super().__init__(f"{exchange.value}_{asset_pair.replace('-', '_')}_executions.db")
+    def __init__(self, exchange, asset_pair, db_path="data"):
+        self.exchange = exchange
+        self.asset_pair = asset_pair
+        super().__init__(f"{exchange.value}_{asset_pair.replace('-', '_')}_executions.db", db_path=db_path)
 
     @property
     def create_query(self):
@@ -18,6 +23,10 @@ class ExecutionDbManager(DbManager):
             )
         """
 
+    @property
+    def table_name(self):
+        return "transactions"
+
     @property
     def retrieve_query(self):
         return """
@@ -33,21 +42,56 @@ class ExecutionDbManager(DbManager):
             'quantity', 'price', 'total_position'
         ]
 
+    def read_range(self, start, end):
+        """
+        Reads the executions in [start, end) into NumPy arrays.
+
+        The window is half-open so consecutive windows can be read without duplicates.
+
+        Returns:
+            tuple: (timestamps, sides, values) where timestamps is int64 nanoseconds of shape (n,),
+                sides is an object array of 'buy'/'sell'/'none' and values is float64 of shape (n, 3)
+                holding quantity, price and total_position.
+        """
+        rows = self.pool.connection().execute("""
+            SELECT timestamp, transaction_type, quantity, price, total_position FROM transactions
+            WHERE timestamp >= ? AND timestamp < ?
+            ORDER BY timestamp, transaction_id
+        """, (start.isoformat(), end.isoformat())).fetchall()
+        timestamps = to_nanoseconds([r[0] for r in rows])
+        sides = np.array([r[1] for r in rows], dtype=object)
+        values = np.array([r[2:] for r in rows], dtype=np.float64).reshape(len(rows), 3)
+        return timestamps, sides, values
+
     def record_transaction(self, timestamp, transaction_type, quantity, price, total_position):
         """Records a new transaction into the database."""
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
+        with self.pool.write() as conn:
+            conn.execute("""
                 INSERT INTO transactions (timestamp, transaction_type, quantity, price, total_position)
                 VALUES (?, ?, ?, ?, ?)
             """, (timestamp.isoformat(), transaction_type, quantity, price, total_position))
-            conn.commit()
-            print("Transaction recorded successfully.")
+        metrics.inc('execution.transactions')
 
-    def record_transaction(self, timestamp, transaction_type, quantity, price, total_position):
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            INSERT INTO transactions (timestamp, transaction_type, quantity, price, total_position)
-            VALUES (?, ?, ?, ?, ?)
-        """, (timestamp, transaction_type, quantity, price, total_position))
-        self.conn.commit()
+    def record_transactions(self, timestamps, transaction_types, quantities, prices, total_positions):
+        """
+        Records many transactions in a single transaction, e.g. the fills of a backtest.
+
+        Args:
+            timestamps (np.ndarray): int64 nanoseconds, one per transaction.
+            transaction_types (np.ndarray): 'buy', 'sell' or 'none'.
+            quantities (np.ndarray): Filled quantities.
+            prices (np.ndarray): Average fill prices.
+            total_positions (np.ndarray): Position after each transaction.
+
+        Returns:
+            int: Number of rows written.
+        """
+        dataframe = pd.DataFrame({
+            'timestamp': np.asarray(timestamps, dtype=np.int64).view('datetime64[ns]'),
+            'transaction_type': np.asarray(transaction_types, dtype=object),
+            'quantity': np.asarray(quantities, dtype=np.float64),
+            'price': np.asarray(prices, dtype=np.float64),
+            'total_position': np.asarray(total_positions, dtype=np.float64),
+        })
+        metrics.inc('execution.transactions', len(dataframe))
+        return self.bulk_save(dataframe)
@@ -0,0 +1,113 @@
+import datetime
+import numpy as np
+import pandas as pd
+from ..common import metrics
+from .asset import LEVEL_COLUMNS, IMPUTED_COLUMN
+from .columnar import NULL_INT
+
+
+class Imputer:
+    """
+    Fills gaps in an order book with synthetic snapshots, many gaps at a time.
+
+    Sizes are interpolated linearly between the snapshots on either side of a gap, and prices follow
+    the same line plus a gentle random walk, as the original `collect.interpolate` did. All gaps of a
+    batch are generated together as one (rows, levels) matrix, so the cost is a handful of NumPy
+    operations rather than a Python loop per column. Rows are written through `bulk_save` with
+    `imputed = 1` and `sequence_number = -1`, so re-imputing the same gap is a no-op.
+    """
+
+    def __init__(self, db, seed=0, step=datetime.timedelta(milliseconds=100), price_noise=0.01, max_rows=500000):
+        """
+        Args:
+            db (AssetPairDbManager): Database to read boundaries from and write synthetic rows to.
+            seed (int): Seed for the random walk, so repairs are reproducible.
+            step (datetime.timedelta): Spacing of the synthetic snapshots.
+            price_noise (float): Standard deviation of each random walk step on the prices.
+            max_rows (int): Upper bound on rows generated (and held in memory) per batch.
+        """
+        self.db = db
+        self.rng = np.random.default_rng(seed)
+        self.step_ns = int(step / datetime.timedelta(microseconds=1)) * 1000
+        self.price_noise = price_noise
+        self.max_rows = max_rows
+        self.price_mask = np.array(['price' in column for column in LEVEL_COLUMNS])
+
+    @metrics.timed('gaps.impute')
+    def fill(self, gaps):
+        """
+        Imputes every gap.
+
+        Args:
+            gaps (list): (start, end) datetime tuples, e.g. from `AssetPairDbManager.find_gaps`. The
+                boundaries are the last snapshot at or before `start` and the first at or after `end`,
+                looked up within a day of each.
+
+        Returns:
+            int: Number of synthetic rows generated. Gaps without data on both sides are skipped.
+        """
+        if not gaps:
+            return 0
+        before_ts, before = self.db.boundary_snapshots([start for start, _ in gaps], 'before')
+        after_ts, after = self.db.boundary_snapshots([end for _, end in gaps], 'after')
+        usable = (before_ts != NULL_INT) & (after_ts != NULL_INT) & (after_ts > before_ts)
+        metrics.inc('gaps.imputed', np.count_nonzero(usable))
+        metrics.inc('gaps.skipped', np.count_nonzero(~usable))
+        if not usable.all():
+            print(f"Not enough data to interpolate {np.count_nonzero(~usable)} of {len(gaps)} gaps. Skipping them.")
+        before_ts, before, after_ts, after = before_ts[usable], before[usable], after_ts[usable], after[usable]
+
+        # Synthetic rows sit strictly between the boundaries, one per step.
+        counts = (after_ts - before_ts - 1) // self.step_ns
+        walk = np.zeros_like(before)  # Random walk position carried across batches of the same gap.
+        written = 0
+        for segments in self._batches(counts):
+            written += self._fill_batch(segments, counts, before_ts, before, after, walk)
+        metrics.inc('gaps.imputed_rows', written)
+        return written
+
+    def _batches(self, counts):
+        """ Splits the rows of all gaps into batches of (gap, first, last) segments of at most max_rows rows. """
+        batch, size = [], 0
+        for gap, count in enumerate(counts):
+            position = 1
+            while position <= count:
+                take = min(count - position + 1, self.max_rows - size)
+                batch.append((gap, position, position + take))
+                size += take
+                position += take
+                if size == self.max_rows:
+                    yield batch
+                    batch, size = [], 0
+        if batch:
+            yield batch
+
+    def _fill_batch(self, segments, counts, before_ts, before, after, walk):
+        lengths = np.array([hi - lo for _, lo, hi in segments])
+        gap = np.repeat([g for g, _, _ in segments], lengths)
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        position = np.arange(lengths.sum()) - np.repeat(starts, lengths) + np.repeat([lo for _, lo, _ in segments], lengths)
+
+        # Linear path from the snapshot before each gap to the one after it.
+        fraction = position / (counts[gap] + 1)
+        values = before[gap] + fraction[:, None] * (after[gap] - before[gap])
+
+        # Random walk on the prices: one cumulative sum over the batch, rebased per segment.
+        steps = self.rng.normal(0, self.price_noise, (len(position), np.count_nonzero(self.price_mask)))
+        cumulative = np.cumsum(steps, axis=0)
+        offsets = np.vstack([np.zeros((1, steps.shape[1])), cumulative[starts[1:] - 1]])
+        segment = np.repeat(np.arange(len(segments)), lengths)
+        prices = cumulative - offsets[segment] + walk[gap][:, self.price_mask]
+        values[:, self.price_mask] += prices
+        ends = starts + lengths - 1
+        for i, (g, _, _) in enumerate(segments):
+            walk[g, self.price_mask] = prices[ends[i]]
+
+        received = (before_ts[gap] + position * self.step_ns).view('datetime64[ns]')
+        data = pd.DataFrame(values, columns=LEVEL_COLUMNS)
+        data.insert(0, 'received_time', received)
+        data.insert(1, 'sequence_number', -1)
+        data.insert(2, 'origin_time', received)
+        data[IMPUTED_COLUMN] = 1
+        self.db.bulk_save(data)
+        return len(data)
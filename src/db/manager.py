@@ -1,15 +1,40 @@
 import sqlite3
 import os
+import numpy as np
 import pandas as pd
+from ..common import metrics
+from .columnar import to_nanoseconds
+from .pool import ConnectionPool
+
+# PRAGMAs applied for the duration of a bulk load, on top of the pool's WAL setup.
+BULK_PRAGMAS = (
+    "PRAGMA cache_size=-262144",  # 256 MiB, negative values are KiB.
+    "PRAGMA temp_store=MEMORY",
+)
+# Restored afterwards, since pooled connections outlive the load.
+DEFAULT_PRAGMAS = (
+    "PRAGMA cache_size=-2000",
+    "PRAGMA temp_store=DEFAULT",
+)
 
 class DbManager:
-    def __init__(self, db_filename, db_path="data"):
+    def __init__(self, db_filename, db_path="data", store=None):
+        """
+        Args:
+            db_filename (str): Name of the SQLite file.
+            db_path (str): Directory holding the database files.
+            store: Optional alternative storage backend (e.g. ColumnarStore). When set, `save` and
+                `retrieve` are delegated to it instead of the SQLite table.
+        """
         self.db_file = f"{db_path}/{db_filename}"
-        self._ensure_db()
+        self.store = store
+        self.pool = ConnectionPool.for_file(self.db_file)
+        if self.store is None:
+            self._ensure_db()
 
     @property
     def create_query(self):
-        """ Property to get the SQL query for creating tables. Should be overridden by subclasses. """
+        """ Property to get the SQL script for creating tables. Should be overridden by subclasses. """
         pass
 
     @property
@@ -22,57 +47,150 @@ class DbManager:
         """ Property to get the list of desired columns for the database. Should be overridden by subclasses. """
         pass
 
+    @property
+    def table_name(self):
+        """ Property to get the name of the table written by `save`. Should be overridden by subclasses. """
+        pass
+
+    @property
+    def integer_times(self):
+        """ Whether timestamps are stored as int64 nanoseconds rather than ISO strings. """
+        return False
+
+    def _time_param(self, value):
+        """ Binds a datetime for comparison against the stored timestamp columns. """
+        return pd.Timestamp(value).value if self.integer_times else value.isoformat()
+
+    def _parse_times(self, values):
+        """ Converts stored timestamps into an int64 nanosecond array. """
+        return np.array(values, dtype=np.int64) if self.integer_times else to_nanoseconds(values)
+
     def _ensure_db(self):
         """Ensures that the database file exists and sets up necessary tables."""
         os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
-            cursor.execute(self.create_query)
-            print("Table created successfully")
-            conn.commit()
+        with self.pool.write_lock:
+            self.pool.connection().executescript(self.create_query)
 
+    @metrics.timed('db.save')
     def save(self, dataframe: pd.DataFrame):
         """Saves fetched data to the database."""
+        metrics.inc('db.rows_saved', len(dataframe))
+        if self.store is not None:
+            self.store.save(dataframe)
+            return
 
-        # Ensure all datetime columns are converted to ISO format strings
-        datetime_cols = dataframe.select_dtypes(include=['datetime64[ns]']).columns
-        for col in datetime_cols:
-            dataframe[col] = dataframe[col].dt.to_pydatetime()  # Convert to Python datetime objects
-            dataframe[col] = dataframe[col].apply(lambda x: x.isoformat() if pd.notnull(x) else None)
-
-        # Replace NaN with None for proper null handling in SQL
-        dataframe = dataframe.where(pd.notnull(dataframe), None)
-
-        with sqlite3.connect(self.db_file) as conn:
+        with self.pool.write() as conn:
             cursor = conn.cursor()
             # Prepare an SQL statement for insertion
             columns = ', '.join(dataframe.columns)
             placeholders = ', '.join(['?'] * len(dataframe.columns))
-            sql = f"INSERT OR IGNORE INTO order_book ({columns}) VALUES ({placeholders})"
-            
-            # Convert DataFrame to list of tuples
-            data_tuples = [tuple(x) for x in dataframe.to_numpy()]
+            sql = f"INSERT OR IGNORE INTO {self.table_name} ({columns}) VALUES ({placeholders})"
+
+            # Convert the columns to the stored format (ISO strings or nanoseconds, None for NaT/NaN)
+            # inside the transaction, so the format matches the table even if it was upgraded meanwhile.
+            data_tuples = list(zip(*[self._column_values(dataframe[column]) for column in dataframe.columns]))
 
             # Execute SQL for each row
             try:
                 cursor.executemany(sql, data_tuples)
-            except sqlite3.InterfaceError as e:
-                # Debugging output to identify the problematic data
+            except (sqlite3.InterfaceError, sqlite3.ProgrammingError):
+                # Retry row by row to name the problematic data in the error.
                 for dt in data_tuples:
                     try:
                         cursor.execute(sql, dt)
-                    except sqlite3.InterfaceError:
-                        print("Failed data tuple:", dt)  # Print problematic tuple
-                        raise
-            conn.commit()
-            print("Data saved successfully to the database.")
+                    except (sqlite3.InterfaceError, sqlite3.ProgrammingError) as e:
+                        raise type(e)(f"Failed to bind data tuple {dt}: {e}") from e
+
+    @metrics.timed('db.bulk_save')
+    def bulk_save(self, dataframe: pd.DataFrame, chunk_size=50000, rebuild_indexes=False):
+        """
+        Saves a large DataFrame in a single transaction, for loads like a full day of book data.
+
+        Unlike `save`, rows are streamed to `executemany` one chunk at a time instead of being
+        materialized as a list of tuples, and the table's indexes can be rebuilt after the load.
+
+        Args:
+            dataframe (pd.DataFrame): Rows to insert. Conflicting rows are ignored, as in `save`.
+            chunk_size (int): Number of rows converted to Python values at a time.
+            rebuild_indexes (bool): Drop the table's secondary indexes before the load and recreate
+                them afterwards, which is faster when inserting many rows into a populated table.
+
+        Returns:
+            int: Number of rows handed to SQLite.
+        """
+        metrics.inc('db.rows_saved', len(dataframe))
+        if self.store is not None:
+            self.store.save(dataframe)
+            return len(dataframe)
+        if dataframe.empty:
+            return 0
 
+        columns = list(dataframe.columns)
+        placeholders = ', '.join(['?'] * len(columns))
+        sql = f"INSERT OR IGNORE INTO {self.table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+
+        conn = self.pool.connection()
+        for pragma in BULK_PRAGMAS:
+            conn.execute(pragma)
+        try:
+            with self.pool.write() as conn:
+                indexes = self._drop_indexes(conn) if rebuild_indexes else []
+                for offset in range(0, len(dataframe), chunk_size):
+                    chunk = dataframe.iloc[offset:offset + chunk_size]
+                    conn.executemany(sql, zip(*[self._column_values(chunk[column]) for column in columns]))
+                for index_sql in indexes:
+                    conn.execute(index_sql)
+        finally:
+            for pragma in DEFAULT_PRAGMAS:
+                conn.execute(pragma)
+        return len(dataframe)
+
+    def _column_values(self, series):
+        """ Converts a column into a list of SQLite-bindable Python values. """
+        if series.dtype.kind == 'M':
+            values = series.to_numpy()
+            if isinstance(series.dtype, pd.DatetimeTZDtype):
+                values = series.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy()
+            if self.integer_times:
+                nanoseconds = values.astype('datetime64[ns]').view(np.int64).astype(object)
+                nanoseconds[np.isnat(values)] = None
+                return nanoseconds.tolist()
+            micros = values.astype('datetime64[us]')
+            strings = np.datetime_as_string(micros, unit='us').astype(object)
+            # Match datetime.isoformat(), which `save` uses and which omits a zero fraction.
+            whole = micros.view(np.int64) % 1000000 == 0
+            strings[whole] = np.datetime_as_string(micros[whole], unit='s')
+            strings[np.isnat(values)] = None
+            return strings.tolist()
+        if series.dtype.kind == 'f' or (series.dtype.kind in 'iub' and not series.hasnans):
+            # SQLite stores NaN as NULL, so numeric columns can be bound as-is. Nullable integers
+            # with missing values fall through to the object conversion below.
+            return series.to_numpy().tolist()
+        return series.astype(object).where(series.notnull(), None).tolist()
+
+    def _drop_indexes(self, conn):
+        """ Drops the secondary indexes on `table_name` and returns the SQL needed to recreate them. """
+        rows = conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (self.table_name,)
+        ).fetchall()
+        for name, _ in rows:
+            conn.execute(f"DROP INDEX {name}")
+        return [sql for _, sql in rows]
+
+    @metrics.timed('db.retrieve')
     def retrieve(self, start, end):
         """ Retrieves timestamps within a specific range to check for data gaps. """
-        with sqlite3.connect(self.db_file) as conn:
-            query = self.retrieve_query
-            df = pd.read_sql(query, conn, params=(start.isoformat(), end.isoformat()), parse_dates=['received_time'])
-        return df['received_time'].tolist()
+        if self.store is not None:
+            return self.store.retrieve(start, end)
+        conn = self.pool.connection()
+        rows = conn.execute(self.retrieve_query, (self._time_param(start), self._time_param(end))).fetchall()
+        # Parsed by numpy: stored strings mix 'HH:MM:SS' and 'HH:MM:SS.ffffff', which trips pandas' format inference.
+        return pd.to_datetime(self._parse_times([row[0] for row in rows])).tolist()
+
+    def close(self):
+        """ Closes the pooled connections to this database, in every thread. """
+        self.pool.close()
 
 # Example instantiation and use:
 # if __name__ == "__main__":
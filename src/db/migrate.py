@@ -0,0 +1,133 @@
+import datetime
+import os
+from .asset import (COMMON_TABLES, IMPUTED_COLUMN, ORDER_BOOK_COLUMNS, SCHEMA_VERSION, order_book_v2_query,
+                    read_schema_version)
+from .columnar import TIME_COLUMNS, to_nanoseconds
+from .pool import ConnectionPool
+
+STAGING_TABLE = 'order_book_v2'
+COLUMNS = ORDER_BOOK_COLUMNS + [IMPUTED_COLUMN]
+
+
+def _copy_chunk(conn, columns, after, chunk_size):
+    """
+    Copies the next `chunk_size` version 1 rows after rowid `after` into the staging table.
+
+    Args:
+        columns (list): Columns of the version 1 table to copy; the others get their defaults.
+
+    Returns:
+        tuple: (rows copied, last rowid copied).
+    """
+    records = conn.execute(
+        f"SELECT rowid, {', '.join(columns)} FROM order_book WHERE rowid > ? ORDER BY rowid LIMIT ?",
+        (after, chunk_size)
+    ).fetchall()
+    if not records:
+        return 0, after
+    values = [list(column) for column in zip(*records)]
+    for name in TIME_COLUMNS:
+        index = columns.index(name) + 1
+        values[index] = to_nanoseconds(values[index]).tolist()
+    placeholders = ', '.join(['?'] * len(columns))
+    sql = f"INSERT OR IGNORE INTO {STAGING_TABLE} ({', '.join(columns)}) VALUES ({placeholders})"
+    sequence = columns.index('sequence_number')
+    rows = list(zip(*values[1:]))
+    conn.executemany(sql, [row for row in rows if row[sequence] is not None])
+    # Version 2 keys need a sequence number; -1 marks it as unknown, as for imputed rows. Version 1
+    # keys treat every NULL as distinct, so a row whose (received_time, -1) is already taken gets
+    # the unique unknown sequence -1 - rowid instead of being dropped.
+    for rowid, row in zip(values[0], rows):
+        if row[sequence] is None:
+            row = list(row)
+            row[sequence] = -1
+            if conn.execute(sql, row).rowcount == 0:
+                row[sequence] = -1 - rowid
+                conn.execute(sql, row)
+    return len(records), records[-1][0]
+
+
+def migrate(db_file, chunk_size=100000, vacuum=False):
+    """
+    Migrates an order book database from schema version 1 to 2 while it stays in use.
+
+    Version 1 rows are copied into a staging table in rowid order, one short write transaction per
+    chunk, and the last copied rowid is committed with each chunk, so an interrupted migration
+    resumes where it stopped. Readers and writers keep using the version 1 table meanwhile; rows
+    they insert get higher rowids and are copied by later chunks. Once the copy has caught up, the
+    rest is copied and the tables are swapped in one final transaction, after which every
+    AssetPairDbManager switches to the new format on its next query.
+
+    Args:
+        db_file (str): Path to the SQLite database, e.g. 'data/BINANCE_ETH_USDT.db'.
+        chunk_size (int): Rows copied per transaction.
+        vacuum (bool): Reclaim the space of the version 1 table afterwards. This rewrites the file
+            and blocks writers while it runs.
+
+    Returns:
+        int: Number of rows copied.
+    """
+    pool = ConnectionPool.for_file(db_file)
+    conn = pool.connection()
+    version = read_schema_version(conn)
+    if version is None or version >= SCHEMA_VERSION:
+        print(f"{db_file} is already at schema version {version or SCHEMA_VERSION}.")
+        return 0
+
+    with pool.write_lock:
+        conn.executescript(order_book_v2_query(STAGING_TABLE) + COMMON_TABLES + """
+            CREATE TABLE IF NOT EXISTS migration (last_rowid INTEGER NOT NULL, rows INTEGER NOT NULL);
+        """)
+    with pool.write() as conn:
+        if conn.execute("SELECT COUNT(*) FROM migration").fetchone()[0] == 0:
+            conn.execute("INSERT INTO migration VALUES (0, 0)")
+    after, copied = conn.execute("SELECT last_rowid, rows FROM migration").fetchone()
+    # Older files may predate some columns.
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(order_book)")}
+    columns = [column for column in COLUMNS if column in existing]
+    total = conn.execute("SELECT MAX(rowid) FROM order_book").fetchone()[0] or 0
+    if after:
+        print(f"Resuming {db_file} after {copied} rows.")
+
+    while True:
+        with pool.write() as conn:
+            count, after = _copy_chunk(conn, columns, after, chunk_size)
+            copied += count
+            conn.execute("UPDATE migration SET last_rowid = ?, rows = ?", (after, copied))
+        if count < chunk_size:
+            break
+        print(f"Migrated {copied} rows ({min(after / max(total, 1), 1):.0%})...")
+
+    with pool.write() as conn:
+        # Rows written since the last chunk, then the swap, with no writer in between.
+        while True:
+            count, after = _copy_chunk(conn, columns, after, chunk_size)
+            copied += count
+            if count < chunk_size:
+                break
+        conn.execute("DROP TABLE order_book")
+        conn.execute(f"ALTER TABLE {STAGING_TABLE} RENAME TO order_book")
+        conn.execute("DROP TABLE migration")
+        conn.execute("INSERT INTO schema_version VALUES (?, ?)",
+                     (SCHEMA_VERSION, datetime.datetime.now(datetime.timezone.utc).isoformat()))
+    if vacuum:
+        with pool.write_lock:
+            conn.execute("VACUUM")
+    print(f"Migrated {copied} rows of {db_file} to schema version {SCHEMA_VERSION}.")
+    return copied
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description="Migrate order_book databases to the integer timestamp schema.")
+    parser.add_argument('db_files', nargs='*', help="SQLite files to migrate. Defaults to data/*.db")
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    parser.add_argument('--vacuum', action='store_true', help="Reclaim the space of the old table afterwards.")
+    args = parser.parse_args()
+
+    for db_file in args.db_files or sorted(glob.glob(os.path.join("data", "*.db"))):
+        if db_file.endswith("_executions.db"):
+            continue
+        migrate(db_file, args.chunk_size, args.vacuum)
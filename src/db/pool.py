@@ -0,0 +1,126 @@
+import atexit
+import contextlib
+import os
+import sqlite3
+import threading
+
+# Applied once to every pooled connection. WAL lets readers keep working while a writer commits,
+# synchronous=NORMAL only syncs at checkpoints under WAL, and busy_timeout makes a second writer
+# (e.g. another process) wait for the lock instead of failing.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=30000",
+)
+
+
+class ConnectionPool:
+    """
+    Persistent SQLite connections for one database file, shared by every DbManager on that file.
+
+    Each thread gets its own connection, opened on first use and kept until `close`, so repeated
+    calls skip the connect and reuse the connection's prepared statement cache (keyed by the SQL
+    text). Writes follow a single-writer/multi-reader model: `write` serializes writers within the
+    process with a lock and starts an immediate transaction, which serializes them across processes,
+    while `read` runs on a WAL snapshot and never waits for a writer.
+    """
+
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, db_file, cached_statements=256):
+        """
+        Args:
+            db_file (str): Path of the SQLite file.
+            cached_statements (int): Prepared statements kept per connection.
+        """
+        self.db_file = db_file
+        self.cached_statements = cached_statements
+        self.write_lock = threading.RLock()
+        self.lock = threading.Lock()
+        self._reset()
+
+    @classmethod
+    def for_file(cls, db_file):
+        """ Returns the pool shared by everything in this process that uses `db_file`. """
+        key = os.path.abspath(db_file)
+        with cls._pools_lock:
+            pool = cls._pools.get(key)
+            if pool is None:
+                pool = cls._pools[key] = cls(db_file)
+            return pool
+
+    @classmethod
+    def close_all(cls):
+        with cls._pools_lock:
+            pools = list(cls._pools.values())
+        for pool in pools:
+            pool.close()
+
+    def _reset(self):
+        self.local = threading.local()
+        self.connections = []
+        self.pid = os.getpid()
+
+    def connection(self):
+        """ Returns the calling thread's connection, in autocommit mode. """
+        if self.pid != os.getpid():
+            # Connections inherited through fork belong to the parent; open fresh ones.
+            with self.lock:
+                self._reset()
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, isolation_level=None, check_same_thread=False,
+                                   cached_statements=self.cached_statements)
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            self.local.conn = conn
+            with self.lock:
+                # Threads that have finished, e.g. a restarted playback reader, leave theirs behind.
+                finished = [c for thread, c in self.connections if not thread.is_alive()]
+                self.connections = [(thread, c) for thread, c in self.connections if thread.is_alive()]
+                self.connections.append((threading.current_thread(), conn))
+            for stale in finished:
+                stale.close()
+        return conn
+
+    @contextlib.contextmanager
+    def read(self):
+        """ Runs the block in one read transaction, so every query sees the same snapshot. """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    @contextlib.contextmanager
+    def write(self):
+        """ Runs the block as the only writer, in one transaction that is rolled back on error. """
+        with self.write_lock:
+            conn = self.connection()
+            if conn.in_transaction:
+                yield conn
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        """ Closes the connections of every thread. They are reopened if the pool is used again. """
+        with self.lock:
+            connections = self.connections
+            self._reset()
+        for _, conn in connections:
+            conn.close()
+
+
+atexit.register(ConnectionPool.close_all)
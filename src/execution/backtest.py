@@ -0,0 +1,324 @@
+import datetime
+import numpy as np
+import pandas as pd
+from ..db.asset import LEVEL_COLUMNS
+from ..db.bars import parse_resolution
+from ..db.columnar import NULL_INT, day_of
+
+LEVELS = 20
+
+
+def target_positions(signals, upper=0.55, lower=0.45, size=1.0, initial=0.0):
+    """
+    Turns model outputs into target positions: long `size` above `upper`, short `size` below
+    `lower`, and the previous target in between.
+
+    Args:
+        signals (np.ndarray): Model outputs, e.g. CNNModel up-probabilities.
+        initial (float): Target held before the first signal.
+
+    Returns:
+        np.ndarray: float64 target position per signal.
+    """
+    signals = np.asarray(signals, dtype=np.float64)
+    targets = np.where(signals > upper, size, np.where(signals < lower, -size, np.nan))
+    # Forward-fill the holds with the index of the last decisive signal.
+    decisive = ~np.isnan(targets)
+    last = np.maximum.accumulate(np.where(decisive, np.arange(len(targets)), -1))
+    return np.where(last >= 0, targets[np.maximum(last, 0)], initial)
+
+
+def walk_book(prices, sizes, quantities):
+    """
+    Fills market orders against the book depth, level by level, for many orders at once.
+
+    Args:
+        prices (np.ndarray): (orders, levels) prices of the side being taken, best first.
+        sizes (np.ndarray): (orders, levels) sizes at those prices. NaN levels are empty.
+        quantities (np.ndarray): (orders,) unsigned quantity of each order.
+
+    Returns:
+        tuple: (filled, average_price) per order. Orders larger than the visible depth fill only
+            what the book holds; orders that fill nothing get a NaN price.
+    """
+    sizes = np.nan_to_num(sizes, nan=0.0)
+    before = np.cumsum(sizes, axis=1) - sizes
+    taken = np.clip(quantities[:, np.newaxis] - before, 0, sizes)
+    filled = taken.sum(axis=1)
+    cost = np.where(taken > 0, taken * prices, 0.0).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return filled, np.where(filled > 0, cost / filled, np.nan)
+
+
+def _short(filled, quantities):
+    """ Whether orders filled less than their quantity, ignoring rounding in the depth walk. """
+    return filled < np.abs(quantities) * (1 - 1e-9)
+
+
+def equity_curve(fills, bars, resolution):
+    """
+    Marks the position held at the end of every bar at that bar's closing mid, e.g. with bars from
+    BarStore.bars, so an equity curve at any resolution never reads raw book rows.
+
+    Args:
+        fills (dict): Fills returned by `Backtester.run`/`execute`, or a list of them in time order.
+        bars (np.ndarray): BAR_DTYPE bars.
+        resolution (str): Duration of the bars, e.g. '1m'.
+
+    Returns:
+        tuple: (times, equity) with times the int64 nanosecond end of each bar.
+    """
+    if isinstance(fills, list):
+        fills = {key: np.concatenate([f[key] for f in fills]) for key in ('time', 'position', 'cash')}
+    ends = bars['time'] + parse_resolution(resolution) * 1000000000
+    if not len(fills['time']):
+        return ends, np.zeros(len(bars))
+    # The last fill before each bar's end; bars before the first fill hold nothing.
+    last = np.searchsorted(fills['time'], ends, side='left') - 1
+    held = last >= 0
+    last = np.maximum(last, 0)
+    position = np.where(held, fills['position'][last], 0.0)
+    cash = np.where(held, fills['cash'][last], 0.0)
+    return ends, cash + position * bars['close']
+
+
+class Backtester:
+    """
+    Replays signals against the stored 20-level books with vectorized fill simulation.
+
+    Signals become target positions (`target_positions`) and every change of target becomes a
+    market order. Each order is matched to the first snapshot at or after its time plus `latency`,
+    walks that snapshot's depth (`walk_book`) and pays `fee` on the notional plus `slippage` on the
+    price. An order larger than the visible depth fills partially, and the next order is sized from
+    the position actually reached, so the shortfall is re-sent with it. Only the snapshots that
+    orders hit are read: with the columnar backend they are gathered straight out of the
+    memory-mapped day partitions, with SQLite each is one indexed lookup. A year of 100ms books
+    therefore costs what its orders cost, not what its books cost.
+
+    Position, cash and equity are NumPy arrays per fill. State carries over between `run` calls, so
+    a long range can be replayed a day at a time, and the fills of every run are written to the
+    ExecutionDbManager in a single transaction.
+    """
+
+    def __init__(self, book_db, execution_db=None, fee=0.001, slippage=0.0, latency=datetime.timedelta(0),
+                 max_delay=datetime.timedelta(seconds=1), upper=0.55, lower=0.45, size=1.0):
+        """
+        Args:
+            book_db (AssetPairDbManager): Source of the order book.
+            execution_db (ExecutionDbManager): Where fills are recorded. None keeps them in memory only.
+            fee (float): Taker fee as a fraction of the notional.
+            slippage (float): Adverse price adjustment as a fraction of the fill price, on top of
+                the depth walked.
+            latency (datetime.timedelta): Delay between a signal and its order reaching the book.
+            max_delay (datetime.timedelta): Orders with no snapshot this soon after them are not filled.
+            upper (float): Signal above which the target is long.
+            lower (float): Signal below which the target is short.
+            size (float): Absolute target position.
+        """
+        self.book_db = book_db
+        self.execution_db = execution_db
+        self.fee = fee
+        self.slippage = slippage
+        self.latency_ns = latency // datetime.timedelta(microseconds=1) * 1000
+        self.max_delay = max_delay
+        self.max_delay_ns = max_delay // datetime.timedelta(microseconds=1) * 1000
+        self.upper = upper
+        self.lower = lower
+        self.size = size
+
+        self.target = 0.0
+        self.position = 0.0
+        self.cash = 0.0
+        self.fees = 0.0
+        self.volume = 0.0
+        self.last_mid = np.nan
+        self.peak = 0.0
+        self.max_drawdown = 0.0
+        self.orders = 0
+        self.trades = 0
+
+    def run(self, times, signals):
+        """
+        Backtests one batch of signals, continuing from the state left by the previous batch.
+
+        Every order is sized from the position actually held when it is sent, `target - position`,
+        so a partial fill or an order no snapshot reached is made up for by the next order instead
+        of leaving the position off its targets. Books are looked up and walked for the whole batch
+        at once; a short fill only changes the size of the order after it, so only those orders are
+        walked again, one at a time.
+
+        Args:
+            times (np.ndarray): Ascending int64 nanosecond times of the signals.
+            signals (np.ndarray): Model output per time.
+
+        Returns:
+            dict: The fills, as returned by `execute`.
+        """
+        targets = target_positions(signals, self.upper, self.lower, self.size, self.target)
+        if len(targets):
+            self.target = float(targets[-1])
+        # Orders go out where the target changes, and first of all where a previous batch left the
+        # position short of it.
+        changed = np.diff(targets, prepend=self.position) != 0
+        times, targets = np.asarray(times, dtype=np.int64)[changed], targets[changed]
+        if np.any(np.diff(times) < 0):
+            raise ValueError("Order times must be ascending")
+        self.orders += len(times)
+
+        matched, book = self._books_at(times + self.latency_ns)
+        # Orders no snapshot reached in time fill nothing, so the next order is sized as if they were never sent.
+        reached = matched != NULL_INT
+        matched, book, targets = matched[reached], book[reached], targets[reached]
+        quantities = np.diff(targets, prepend=self.position)
+        filled, _ = self._walk(book, quantities)
+        done = -1
+        for i in np.flatnonzero(_short(filled, quantities)):
+            if i <= done:
+                continue
+            # The shortfall rides on the next order, which may fill short in turn.
+            while i + 1 < len(quantities) and _short(filled[i], quantities[i]):
+                quantities[i + 1] += quantities[i] - np.copysign(filled[i], quantities[i])
+                filled[i + 1] = self._walk(book[i + 1:i + 2], quantities[i + 1:i + 2])[0][0]
+                i += 1
+            done = i
+        fills = self._fill(matched, book, quantities)
+        self._record(fills)
+        return fills
+
+    def execute(self, times, quantities):
+        """
+        Sends signed market orders (positive buys, negative sells) to the book, as they are: unlike
+        `run`, a partial fill doesn't resize the orders after it.
+
+        Returns:
+            dict: Arrays per filled order: 'time' (when it hit the book), 'side', 'quantity',
+                'price' (average, after slippage), 'fee', 'position', 'cash' and 'equity' (marked
+                at the mid of the snapshot filled against).
+        """
+        times = np.asarray(times, dtype=np.int64)
+        quantities = np.asarray(quantities, dtype=np.float64)
+        if np.any(np.diff(times) < 0):
+            raise ValueError("Order times must be ascending")
+        self.orders += len(times)
+
+        matched, book = self._books_at(times + self.latency_ns)
+        fills = self._fill(matched, book, quantities)
+        self._record(fills)
+        return fills
+
+    def _walk(self, book, quantities):
+        """
+        Walks the side of each snapshot that each signed order takes.
+
+        Returns:
+            tuple: (filled, average_price) per order, as returned by `walk_book`.
+        """
+        book = book.reshape(len(quantities), 2, LEVELS, 2)  # (order, bid/ask, level, price/size)
+        # Buys take the asks, sells take the bids.
+        taken = np.where((quantities > 0)[:, np.newaxis, np.newaxis], book[:, 1], book[:, 0])
+        return walk_book(taken[..., 0], taken[..., 1], np.abs(quantities))
+
+    def _fill(self, matched, book, quantities):
+        """
+        Fills orders against the snapshots matched to them and books the fills into the position and cash.
+
+        Args:
+            matched (np.ndarray): Snapshot time per order, NULL_INT if none was in reach.
+            book (np.ndarray): (orders, len(LEVEL_COLUMNS)) snapshot values per order.
+            quantities (np.ndarray): Signed quantity per order.
+
+        Returns:
+            dict: The fills, as returned by `execute`.
+        """
+        filled, price = self._walk(book, quantities)
+        book = book.reshape(len(matched), 2, LEVELS, 2)
+        buy = quantities > 0
+        keep = (matched != NULL_INT) & (filled > 0)
+        direction = np.where(buy, 1.0, -1.0)[keep]
+        filled, price = filled[keep], price[keep] * (1 + direction * self.slippage)
+        mid = (book[keep, 0, 0, 0] + book[keep, 1, 0, 0]) / 2
+        notional = filled * price
+        fees = notional * self.fee
+
+        position = self.position + np.cumsum(direction * filled)
+        cash = self.cash - np.cumsum(direction * notional + fees)
+        equity = cash + position * mid
+        fills = {
+            'time': matched[keep],
+            'side': np.where(direction > 0, 'buy', 'sell').astype(object),
+            'quantity': filled,
+            'price': price,
+            'fee': fees,
+            'position': position,
+            'cash': cash,
+            'equity': equity,
+        }
+
+        if len(filled):
+            self.position, self.cash = float(position[-1]), float(cash[-1])
+            self.last_mid = float(mid[-1])
+            self.fees += float(fees.sum())
+            self.volume += float(notional.sum())
+            self.trades += len(filled)
+            peaks = np.maximum.accumulate(np.maximum(equity, self.peak))
+            self.max_drawdown = max(self.max_drawdown, float((peaks - equity).max()))
+            self.peak = float(peaks[-1])
+        return fills
+
+    def _record(self, fills):
+        """ Writes the fills of one `run`/`execute` to the ExecutionDbManager in a single transaction. """
+        if self.execution_db is not None and len(fills['time']):
+            self.execution_db.record_transactions(fills['time'], fills['side'], fills['quantity'], fills['price'],
+                                                  fills['position'])
+
+    def _books_at(self, times):
+        """
+        Looks up the first snapshot at or after each of the ascending `times`, within `max_delay`.
+
+        Returns:
+            tuple: (timestamps, values) with values of shape (n, len(LEVEL_COLUMNS)). Times with no
+                snapshot in reach get NULL_INT and a row of NaN.
+        """
+        store = self.book_db.store
+        if not len(times):
+            return times.copy(), np.empty((0, len(LEVEL_COLUMNS)))
+        if store is None:
+            datetimes = pd.to_datetime(times).to_pydatetime()
+            return self.book_db.boundary_snapshots(datetimes, 'after', LEVEL_COLUMNS, within=self.max_delay)
+
+        matched = np.full(len(times), NULL_INT, dtype=np.int64)
+        values = np.full((len(times), len(LEVEL_COLUMNS)), np.nan)
+        first, last = day_of(times[0]), day_of(times[-1] + self.max_delay_ns)
+        position = 0
+        for day in store.days():
+            if day < first or day > last or position == len(times):
+                continue
+            partition = store.load_day(day, ['received_time'] + LEVEL_COLUMNS)
+            received = partition['received_time']
+            if not len(received):
+                continue
+            # Orders up to the day's last snapshot match in this day; later ones roll over to the next.
+            end = np.searchsorted(times, received[-1], side='right')
+            rows = np.searchsorted(received, times[position:end], side='left')
+            matched[position:end] = received[rows]
+            for i, column in enumerate(LEVEL_COLUMNS):
+                values[position:end, i] = partition[column][rows]
+            position = end
+
+        stale = (matched != NULL_INT) & (matched - times > self.max_delay_ns)
+        matched[stale] = NULL_INT
+        values[stale] = np.nan
+        return matched, values
+
+    def summary(self):
+        """ Returns the totals so far, with the open position marked at the last mid filled against. """
+        equity = self.cash + (self.position * self.last_mid if self.position else 0.0)
+        return {
+            'orders': self.orders,
+            'trades': self.trades,
+            'volume': self.volume,
+            'fees': self.fees,
+            'position': self.position,
+            'equity': equity,
+            'max_drawdown': self.max_drawdown,
+        }
@@ -1,62 +1,70 @@
+import datetime
+import os
 import numpy as np
 import pandas as pd
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Dense, Conv2D, Flatten, Dropout, MaxPooling2D
-from tensorflow.keras.utils import Sequence
+from tensorflow.keras.models import Sequential, load_model
+from tensorflow.keras.layers import Dense, Conv2D, Flatten, Dropout, MaxPooling2D, Input
+from ..common import metrics
+from .features import FeatureStore
+from .normalize import FeatureStats
+from .pipeline import LEVEL_FEATURES, OrderBookDataset, StepRate, feature_columns
 
 class CNNModel:
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, window=64, levels=5, horizon=50):
         """
         Initialize the CNN model with a database manager.
 
         Args:
-            db_manager (DbManager): The database manager to handle data loading.
+            db_manager (AssetPairDbManager): The database manager to stream order book data from.
+            window (int): Snapshots per sample.
+            levels (int): Book levels per side per snapshot.
+            horizon (int): Snapshots ahead whose mid-price direction is predicted.
         """
         self.db_manager = db_manager
+        self.window = window
+        self.levels = levels
+        self.horizon = horizon
         self.model = None
+        self.stats = None
 
-    def fetch_batch(self, batch_size, start_index, end_index):
+    def preprocess_data(self, df):
         """
-        Fetches a batch of data from the database.
+        Preprocess the order book data for CNN.
 
-        Args:
-            batch_size (int): The size of the batch to fetch.
-            start_index (int): The index to start fetching data.
-            end_index (int): The index to end fetching data.
+        Every batch is scaled with the same statistics the model was trained with, see `fit_stats`.
 
         Returns:
-            np.array: Batch of processed data ready for training.
+            np.array: (rows, levels, 4, 1) bid price, bid size, ask price and ask size per level.
         """
-        # Query the database to get the batch
-        dataframe = self.db_manager.load_data_batch(batch_size, start_index, end_index)
-        return self.preprocess_data(dataframe)
+        if self.stats is None:
+            raise ValueError("No normalization statistics; call fit_stats, train or load first")
+        cnn_input = self.stats.transform(df[feature_columns(self.levels)].to_numpy(dtype=np.float64))
+        return cnn_input.reshape(len(df), self.levels, len(LEVEL_FEATURES), 1)
 
-    def preprocess_data(self, df):
-        """
-        Preprocess the order book data for CNN.
-        """
-        num_levels = 5
-        features_per_level = 4
-        cnn_input = np.zeros((len(df), num_levels, features_per_level))
+    def fit_stats(self, start, end, method='zscore'):
+        """ Computes normalization statistics over [start, end) in one streaming pass over the store. """
+        self.stats = FeatureStats.scan(self.db_manager, start, end - datetime.timedelta(microseconds=1),
+                                       feature_columns(self.levels), method=method)
+        return self.stats
 
-        for i in range(num_levels):
-            cnn_input[:, i, 0] = df[f'bid_price_{i+1}']
-            cnn_input[:, i, 1] = df[f'bid_volume_{i+1}']
-            cnn_input[:, i, 2] = df[f'ask_price_{i+1}']
-            cnn_input[:, i, 3] = df[f'ask_volume_{i+1}']
-
-        cnn_input = cnn_input / cnn_input.max(axis=0)
-        return cnn_input.reshape(len(df), num_levels, features_per_level, 1)
+    def dataset(self, start, end, **kwargs):
+        """ Returns the OrderBookDataset for [start, end) matching this model's input. """
+        if self.stats is None:
+            self.fit_stats(start, end)
+        return OrderBookDataset(self.db_manager, start, end, window=self.window, levels=self.levels,
+                                horizon=self.horizon, stats=self.stats, **kwargs)
 
     def build_model(self):
         """
         Build the CNN model architecture.
         """
+        # 'same' padding keeps the narrow feature axis from collapsing below the kernel size.
         self.model = Sequential([
-            Conv2D(32, kernel_size=(3, 3), activation='relu', input_shape=(5, 4, 1)),
+            Input(shape=(self.window, self.levels * len(LEVEL_FEATURES), 1)),
+            Conv2D(32, kernel_size=(3, 3), activation='relu', padding='same'),
             MaxPooling2D(pool_size=(2, 2)),
             Dropout(0.25),
-            Conv2D(64, (3, 3), activation='relu'),
+            Conv2D(64, (3, 3), activation='relu', padding='same'),
             MaxPooling2D(pool_size=(2, 2)),
             Dropout(0.25),
             Flatten(),
@@ -67,18 +75,55 @@ class CNNModel:
 
         self.model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
 
-    def train(self, epochs, batch_size):
+    @metrics.timed('train')
+    def train(self, start, end, epochs, batch_size, **dataset_kwargs):
+        """
+        Trains the CNN model on the order book in [start, end), streamed through an OrderBookDataset.
+
+        Args:
+            start (datetime.datetime): Start of the training range.
+            end (datetime.datetime): End of the training range, exclusive.
+            epochs (int): Passes over the range. Only the first one reads the database.
+            batch_size (int): Windows per step.
+            dataset_kwargs: Passed to OrderBookDataset, e.g. stride or cache_dir.
+
+        Returns:
+            keras.callbacks.History: The fit history.
         """
-        Trains the CNN model using data fetched in batches.
+        if self.model is None:
+            self.build_model()
+        dataset = self.dataset(start, end, **dataset_kwargs).dataset(batch_size)
+        return self.model.fit(dataset, epochs=epochs, callbacks=[StepRate()], verbose=0)
+
+    def feature_store(self, root="data/features"):
+        """ Returns the FeatureStore of this model's inputs, keyed by its normalization statistics. """
+        if self.stats is None:
+            raise ValueError("No normalization statistics; call fit_stats, train or load first")
+        return FeatureStore(self.db_manager, self.stats, levels=self.levels, root=root)
+
+    @metrics.timed('train')
+    def train_on_store(self, store, start_date, end_date, epochs, batch_size, stride=1):
+        """
+        Trains on windows viewed straight out of a materialized FeatureStore.
+
+        Args:
+            store (FeatureStore): Store built with this model's statistics, see `feature_store`.
+            start_date (datetime.date): First day.
+            end_date (datetime.date): Last day.
         """
-        num_records = self.db_manager.count_records()
-        steps_per_epoch = num_records // batch_size
+        if self.model is None:
+            self.build_model()
+        store.update(start_date, end_date)
+        dataset = store.dataset(start_date, end_date, self.window, self.horizon, stride, batch_size=batch_size)
+        return self.model.fit(dataset, epochs=epochs, callbacks=[StepRate()], verbose=0)
 
-        for epoch in range(epochs):
-            for step in range(steps_per_epoch):
-                x_batch = self.fetch_batch(batch_size, step*batch_size, (step+1)*batch_size)
-                y_batch = ...  # Get labels for the batch
-                self.model.train_on_batch(x_batch, y_batch)
-            print(f'Epoch {epoch+1}/{epochs} complete.')
+    def save(self, directory):
+        """ Saves the model together with its normalization statistics. """
+        os.makedirs(directory, exist_ok=True)
+        self.model.save(os.path.join(directory, "model.keras"))
+        self.stats.save(os.path.join(directory, "stats.npz"))
 
-# Assume `DbManager` and `data_frame` setup similar to previous examples
+    def load(self, directory):
+        """ Loads a model and the normalization statistics saved with it. """
+        self.model = load_model(os.path.join(directory, "model.keras"))
+        self.stats = FeatureStats.load(os.path.join(directory, "stats.npz"))
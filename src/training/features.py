@@ -0,0 +1,148 @@
+import datetime
+import json
+import os
+import shutil
+import numpy as np
+import tensorflow as tf
+from numpy.lib.stride_tricks import as_strided
+from .pipeline import feature_columns, mid_price_labels
+
+
+class FeatureStore:
+    """
+    Materialized, memory-mapped model inputs, one partition per day.
+
+    Each day holds the normalized float32 feature matrix (rows, levels * 4) in the column order of
+    `feature_columns`, the raw mid price for labelling and the received_time of every row. Sliding
+    windows are `as_strided` views over the memory-mapped matrix, so no window is ever copied; only
+    the rows of a batch are gathered when it is fed to the model.
+
+    Partitions live under a directory keyed by the normalization statistics, so new statistics
+    start a new store. A manifest records the (rows, first, last) signature of the source day each
+    partition was built from, and `update` rebuilds exactly the days whose signature changed, e.g.
+    after collect.py ingested or backfilled them.
+    """
+
+    def __init__(self, db, stats, levels=5, root="data/features"):
+        """
+        Args:
+            db (AssetPairDbManager): Source of the order book.
+            stats (FeatureStats): Normalization statistics for `feature_columns(levels)`.
+            levels (int): Book levels per side.
+            root (str): Directory holding the stores.
+        """
+        self.db = db
+        self.stats = stats
+        self.levels = levels
+        self.columns = feature_columns(levels)
+        if stats.columns != self.columns:
+            raise ValueError("The normalization statistics don't match the feature columns")
+        name = os.path.splitext(os.path.basename(db.db_file))[0]
+        self.root = os.path.join(root, f"{name}_{getattr(db, 'backend', 'sqlite')}_{stats.fingerprint()}")
+        self.manifest_path = os.path.join(self.root, "manifest.json")
+        os.makedirs(self.root, exist_ok=True)
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def days(self):
+        """ Returns the sorted days (datetime.date) with a materialized partition. """
+        return sorted(datetime.date.fromisoformat(day) for day, signature in self.manifest.items() if signature[0])
+
+    def update(self, start_date, end_date):
+        """
+        Materializes every day in [start_date, end_date] that is new or changed in the database.
+        Empty days are recorded too, so they are only looked at again once they receive rows.
+
+        Returns:
+            list: The days (datetime.date) that were (re)built.
+        """
+        rebuilt = []
+        for day, signature in self.db.day_signatures(start_date, end_date):
+            key = day.isoformat()
+            if self.manifest.get(key) == signature:
+                continue
+            if signature[0] == 0:
+                shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            else:
+                self._build_day(day)
+            self.manifest[key] = signature
+            rebuilt.append(day)
+            self._write_manifest()
+        if rebuilt:
+            print(f"Feature store: rebuilt {len(rebuilt)} days up to {rebuilt[-1]}.")
+        return rebuilt
+
+    def _build_day(self, day):
+        start = datetime.datetime.combine(day, datetime.time())
+        end = start + datetime.timedelta(days=1) - datetime.timedelta(microseconds=1)
+        received, values = self.db.read_range(start, end, self.columns)
+        path = os.path.join(self.root, day.isoformat())
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, "received_time.npy"), received)
+        np.save(os.path.join(tmp_path, "features.npy"), self.stats.transform(values))
+        np.save(os.path.join(tmp_path, "mid.npy"), (values[:, 0] + values[:, 2]) / 2)  # bid_0_price and ask_0_price.
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    def _write_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def load_day(self, day):
+        """
+        Returns:
+            dict: 'received_time', 'features' and 'mid' memory-mapped arrays, or None if not materialized.
+        """
+        if not self.manifest.get(day.isoformat(), [0])[0]:
+            return None
+        path = os.path.join(self.root, day.isoformat())
+        return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+                for name in ('received_time', 'features', 'mid')}
+
+    def windows(self, day, window, horizon, stride=1, threshold=0.0):
+        """
+        Zero-copy sliding windows over one day, with their mid-price labels.
+
+        Returns:
+            tuple: (windows, labels) where windows is a read-only (count, window, levels * 4) strided
+                view of the memory-mapped features and labels is float32 of shape (count,). Same
+                windowing and labels as OrderBookDataset.
+        """
+        partition = self.load_day(day)
+        if partition is None:
+            return np.empty((0, window, len(self.columns)), dtype=np.float32), np.empty(0, dtype=np.float32)
+        features = partition['features']
+        labels = mid_price_labels(partition['mid'], window, horizon, stride, threshold)
+        row_stride, item_stride = features.strides
+        windows = as_strided(features, shape=(len(labels), window, features.shape[1]),
+                             strides=(row_stride * stride, row_stride, item_stride), writeable=False)
+        return windows, labels
+
+    def dataset(self, start_date, end_date, window, horizon, stride=1, threshold=0.0, batch_size=256, seed=None):
+        """
+        Batches of windows from the materialized days in [start_date, end_date], in shuffled order.
+
+        Returns:
+            tf.data.Dataset: Batches of (windows, labels), windows of shape (batch, window, levels * 4, 1).
+        """
+        days = [day for day in self.days() if start_date <= day <= end_date]
+        width = len(self.columns)
+
+        def batches():
+            rng = np.random.default_rng(seed)
+            for i in rng.permutation(len(days)):
+                windows, labels = self.windows(days[i], window, horizon, stride, threshold)
+                order = rng.permutation(len(labels))
+                for offset in range(0, len(order), batch_size):
+                    # Sorted indices keep the gather sequential within the memory map.
+                    index = np.sort(order[offset:offset + batch_size])
+                    yield windows[index][..., np.newaxis], labels[index]
+
+        signature = (tf.TensorSpec((None, window, width, 1), tf.float32), tf.TensorSpec((None,), tf.float32))
+        return tf.data.Dataset.from_generator(batches, output_signature=signature).prefetch(tf.data.AUTOTUNE)
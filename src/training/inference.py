@@ -0,0 +1,202 @@
+import collections
+import os
+import time
+import numpy as np
+import tensorflow as tf
+from ..common.codec import Book, BookDecoder, encode_signal, topic as feed_topic
+from ..common.rolling import RollingBuffer
+from ..common.sock import SockClient
+from ..db.asset import LEVEL_COLUMNS
+from .pipeline import feature_columns
+
+BACKENDS = ('keras', 'savedmodel', 'tflite')
+
+
+def batch_buckets(max_batch):
+    """ Padded batch sizes: powers of two up to max_batch, so each backend compiles only a few shapes. """
+    buckets = [1]
+    while buckets[-1] < max_batch:
+        buckets.append(min(buckets[-1] * 2, max_batch))
+    return buckets
+
+
+class Predictor:
+    """
+    Runs a Keras model on padded batches through one of several CPU backends.
+
+    'keras' calls the model inside a tf.function, 'savedmodel' exports it with `model.export` and
+    serves the loaded signature, and 'tflite' converts it and keeps one interpreter per batch size.
+    Batches are padded up to the next bucket of `batch_buckets`, so no backend retraces or
+    reallocates per call.
+    """
+
+    def __init__(self, model, backend='keras', max_batch=64, export_dir="models/cnn/serving"):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+        self.backend = backend
+        self.buckets = batch_buckets(max_batch)
+        self.input_shape = tuple(model.input_shape[1:])
+        if backend == 'keras':
+            self.function = tf.function(lambda x: model(x, training=False), reduce_retracing=True)
+        elif backend == 'savedmodel':
+            path = os.path.join(export_dir, "savedmodel")
+            model.export(path, verbose=False)
+            self.function = tf.saved_model.load(path).serve
+        else:
+            content = tf.lite.TFLiteConverter.from_keras_model(model).convert()
+            os.makedirs(export_dir, exist_ok=True)
+            with open(os.path.join(export_dir, "model.tflite"), 'wb') as f:
+                f.write(content)
+            self.interpreters = {}
+            for size in self.buckets:
+                interpreter = tf.lite.Interpreter(model_content=content)
+                index = interpreter.get_input_details()[0]['index']
+                interpreter.resize_tensor_input(index, (size,) + self.input_shape)
+                interpreter.allocate_tensors()
+                self.interpreters[size] = interpreter
+        self.padded = {size: np.zeros((size,) + self.input_shape, dtype=np.float32) for size in self.buckets}
+
+    def __call__(self, batch):
+        """ Returns one model output per row of a float32 batch of at most max_batch rows. """
+        size = next(size for size in self.buckets if size >= len(batch))
+        padded = self.padded[size]
+        padded[:len(batch)] = batch
+        if self.backend == 'tflite':
+            interpreter = self.interpreters[size]
+            interpreter.set_tensor(interpreter.get_input_details()[0]['index'], padded)
+            interpreter.invoke()
+            output = interpreter.get_tensor(interpreter.get_output_details()[0]['index'])
+        else:
+            output = self.function(tf.constant(padded)).numpy()
+        return output[:len(batch), 0]
+
+
+class InferenceService:
+    """
+    Scores live book snapshots with a trained CNNModel and publishes the signals.
+
+    Snapshots of the model's pair arrive through a SockClient subscribed to the pair's topic, as BOOK
+    or BOOK_DELTA frames, and are decoded by that topic's BookDecoder. Each one is normalized with
+    the model's statistics into a rolling window of the last `window` snapshots, and every full
+    window becomes a sample. Samples are micro-batched: a batch runs as soon as it holds `max_batch`
+    samples or its oldest sample has waited `max_latency` seconds, whichever comes first. Outputs
+    go back to the server as SIGNAL frames in one write per batch, which the server relays to the
+    other subscribers of the topic, and to `on_signals` if given.
+
+    Latency is measured from the moment a snapshot's frame is read off the socket to the moment
+    its signal is published; `stats` reports its percentiles and the batch size histogram.
+    """
+
+    def __init__(self, cnn, host='localhost', port=65432, max_batch=64, max_latency=0.005, backend='keras',
+                 export_dir="models/cnn/serving", on_signals=None, publish=True, history=100000, topic=None):
+        """
+        Args:
+            cnn (CNNModel): Trained model with normalization statistics, e.g. after `CNNModel.load`.
+            host (str): Feed host.
+            port (int): Feed port.
+            max_batch (int): Most samples per model call.
+            max_latency (float): Seconds a sample may wait for its batch to fill.
+            backend (str): One of BACKENDS.
+            export_dir (str): Where the 'savedmodel' and 'tflite' backends write their exports.
+            on_signals (callable): Called as `on_signals(times, values)` after every batch.
+            publish (bool): Send SIGNAL frames back to the server.
+            history (int): Latency samples kept for the percentiles.
+            topic (str): Feed of the pair to score, e.g. 'BINANCE:ETH-USDT'. Defaults to the pair of
+                the model's database.
+        """
+        if cnn.model is None or cnn.stats is None:
+            raise ValueError("InferenceService needs a trained model with normalization statistics")
+        if topic is None:
+            if cnn.db_manager is None:
+                raise ValueError("InferenceService needs the topic of the pair it scores")
+            topic = feed_topic(cnn.db_manager.exchange.value, cnn.db_manager.asset_pair)
+        self.cnn = cnn
+        self.topic = topic
+        # Frames don't name their topic, so only this pair is subscribed to and one decoder follows its book.
+        self.client = SockClient(host, port, topics=[topic])
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.on_signals = on_signals
+        self.publish = publish
+        self.predictor = Predictor(cnn.model, backend, max_batch, export_dir)
+        self.decoder = BookDecoder()
+        self.columns = feature_columns(cnn.levels)
+        self.feature_index = np.array([LEVEL_COLUMNS.index(column) for column in self.columns])
+        self.rows = RollingBuffer(cnn.window, len(self.columns), dtype=np.float32)
+
+        self.batch = np.empty((max_batch,) + self.predictor.input_shape, dtype=np.float32)
+        self.batch_times = np.empty(max_batch, dtype=np.int64)
+        self.batch_received = np.empty(max_batch)
+        self.pending = 0
+        self.latencies = collections.deque(maxlen=history)
+        self.batch_sizes = np.zeros(max_batch + 1, dtype=np.int64)
+        self.snapshots = 0
+        self.signals = 0
+        self.running = False
+
+    def run(self, duration=None):
+        """ Serves until `stop` is called, or for `duration` seconds. """
+        self.running = True
+        deadline = None if duration is None else time.monotonic() + duration
+        while self.running and (deadline is None or time.monotonic() < deadline):
+            # Wait for data no longer than the oldest pending sample may still wait.
+            timeout = 0.05
+            if self.pending:
+                timeout = max(self.batch_received[0] + self.max_latency - time.monotonic(), 0)
+            frames = self.client.receive_batch(timeout)
+            if self.client.socket is None:
+                time.sleep(0.05)  # Reconnecting; receive_batch returns at once while disconnected.
+            received = time.monotonic()
+            for payload in frames:
+                self.ingest(payload, received)
+            if self.pending and time.monotonic() - self.batch_received[0] >= self.max_latency:
+                self.flush()
+        if self.pending:
+            self.flush()
+
+    def stop(self):
+        self.running = False
+
+    def ingest(self, payload, received):
+        """ Folds one frame into the rolling window and queues a sample once the window is full. """
+        message = self.decoder.decode(payload)
+        if not isinstance(message, Book):
+            return
+        self.snapshots += 1
+        self.rows.append(self.cnn.stats.transform(message.levels[self.feature_index]))
+        if len(self.rows) < self.cnn.window:
+            return
+        self.batch[self.pending] = self.rows.view.reshape(self.predictor.input_shape)
+        self.batch_times[self.pending] = message.received_time
+        self.batch_received[self.pending] = received
+        self.pending += 1
+        if self.pending == self.max_batch:
+            self.flush()
+
+    def flush(self):
+        """ Runs the pending samples through the model and publishes their signals. """
+        count = self.pending
+        values = self.predictor(self.batch[:count])
+        times = self.batch_times[:count].copy()
+        if self.publish:
+            self.client.send_many([encode_signal(t, v) for t, v in zip(times.tolist(), values.tolist())])
+        if self.on_signals is not None:
+            self.on_signals(times, values)
+        published = time.monotonic()
+        self.latencies.extend((published - self.batch_received[:count]).tolist())
+        self.batch_sizes[count] += 1
+        self.signals += count
+        self.pending = 0
+
+    def stats(self):
+        """ Returns counters, latency percentiles in milliseconds and the batch size histogram. """
+        latencies = np.array(self.latencies) * 1000
+        return {
+            'snapshots': self.snapshots,
+            'signals': self.signals,
+            'batches': int(self.batch_sizes.sum()),
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'batch_sizes': {size: int(n) for size, n in enumerate(self.batch_sizes) if n},
+            'client': self.client.stats(),
+        }
@@ -0,0 +1,154 @@
+import hashlib
+import numpy as np
+
+METHODS = ('zscore', 'robust', 'max')
+
+
+class FeatureStats:
+    """
+    Per-column normalization statistics accumulated in one streaming pass.
+
+    Means and variances are merged chunk by chunk with the parallel form of Welford's algorithm
+    (Chan et al.), so they are numerically stable over billions of rows, and a fixed-size uniform
+    reservoir of rows backs the robust quantiles. Memory is bounded by the reservoir, whatever the
+    length of the history. NaNs (empty levels) are ignored.
+
+    The chosen statistics reduce to a per-column (center, scale) pair, applied by `transform` as a
+    single fused subtract-and-multiply into float32.
+    """
+
+    def __init__(self, columns, method='zscore', reservoir_size=100000, seed=0):
+        """
+        Args:
+            columns (list): Names of the columns, in the order of the value arrays.
+            method (str): 'zscore' for (x - mean) / std, 'robust' for (x - median) / IQR, or 'max'
+                for x / max(|x|).
+            reservoir_size (int): Rows sampled for the quantiles.
+            seed (int): Seed for the reservoir sampling.
+        """
+        if method not in METHODS:
+            raise ValueError(f"Unknown method '{method}', expected one of {METHODS}")
+        self.columns = list(columns)
+        self.method = method
+        width = len(self.columns)
+        self.count = np.zeros(width, dtype=np.int64)
+        self.mean = np.zeros(width)
+        self.m2 = np.zeros(width)
+        self.minimum = np.full(width, np.inf)
+        self.maximum = np.full(width, -np.inf)
+        self.reservoir = np.empty((reservoir_size, width))
+        self.seen = 0  # Rows offered to the reservoir.
+        self.rng = np.random.default_rng(seed)
+        self._coefficients = None
+
+    @classmethod
+    def scan(cls, db, start, end, columns, chunk_size=100000, **kwargs):
+        """
+        Accumulates statistics over [start, end] of an AssetPairDbManager with `iter_range`.
+
+        Args:
+            kwargs: Passed to the constructor, e.g. method.
+        """
+        stats = cls(columns, **kwargs)
+        for _, values in db.iter_range(start, end, columns, chunk_size=chunk_size):
+            stats.update(values)
+        return stats
+
+    def update(self, values):
+        """ Folds a (rows, columns) chunk into the statistics. """
+        if not len(values):
+            return
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=0)
+        mean = np.nansum(values, axis=0) / np.maximum(count, 1)
+        m2 = np.nansum((values - mean) ** 2, axis=0)
+
+        total = self.count + count
+        delta = mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean = np.where(total > 0, self.mean + delta * count / total, 0.0)
+            self.m2 = np.where(total > 0, self.m2 + m2 + delta ** 2 * self.count * count / total, 0.0)
+        self.count = total
+        self.minimum = np.fmin(self.minimum, np.where(valid, values, np.inf).min(axis=0))
+        self.maximum = np.fmax(self.maximum, np.where(valid, values, -np.inf).max(axis=0))
+        self._sample(values)
+        self._coefficients = None
+
+    def _sample(self, values):
+        """ Vectorized reservoir sampling (Algorithm R): row i is kept with probability size / (i + 1). """
+        size = len(self.reservoir)
+        index = self.seen + np.arange(len(values))
+        fill = index < size
+        self.reservoir[index[fill]] = values[fill]
+        slots = self.rng.integers(0, index[~fill] + 1)
+        keep = slots < size
+        # Later rows overwrite earlier ones in the same slot, as they would sequentially.
+        self.reservoir[slots[keep]] = values[~fill][keep]
+        self.seen += len(values)
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / np.maximum(self.count, 1))
+
+    def quantile(self, q):
+        """ Approximate per-column quantile(s) from the reservoir. """
+        return np.nanquantile(self.reservoir[:min(self.seen, len(self.reservoir))], q, axis=0)
+
+    def coefficients(self):
+        """
+        Returns:
+            tuple: (center, inv_scale) such that transform(x) = (x - center) * inv_scale. The center
+                stays float64, since prices far from zero would lose their low digits in float32.
+        """
+        if self._coefficients is None:
+            if self.method == 'zscore':
+                center, scale = self.mean, self.std
+            elif self.method == 'robust':
+                q25, q50, q75 = self.quantile([0.25, 0.5, 0.75])
+                center, scale = q50, q75 - q25
+            else:
+                center, scale = np.zeros(len(self.columns)), np.fmax(np.abs(self.minimum), np.abs(self.maximum))
+            scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+            center = np.where(np.isfinite(center), center, 0.0)
+            self._coefficients = center, (1 / scale).astype(np.float32)
+        return self._coefficients
+
+    def transform(self, values, out=None):
+        """
+        Normalizes a (..., columns) array in one fused pass. NaNs become 0, the normalized mean.
+
+        Args:
+            out (np.ndarray): Optional float32 output array, e.g. a preallocated batch buffer.
+
+        Returns:
+            np.ndarray: float32 array of the same shape.
+        """
+        center, inv_scale = self.coefficients()
+        if out is None:
+            out = np.empty(np.shape(values), dtype=np.float32)
+        np.subtract(values, center, out=out, casting='unsafe')
+        np.multiply(out, inv_scale, out=out)
+        np.nan_to_num(out, copy=False, nan=0.0)
+        return out
+
+    def fingerprint(self):
+        """ Short hash of the method and coefficients, for keying caches of transformed data. """
+        center, inv_scale = self.coefficients()
+        return hashlib.sha1(self.method.encode() + center.tobytes() + inv_scale.tobytes()).hexdigest()[:16]
+
+    def save(self, path):
+        """ Persists the statistics as an .npz file, so training and inference share them. """
+        np.savez(path, columns=np.array(self.columns), method=self.method, count=self.count, mean=self.mean,
+                 m2=self.m2, minimum=self.minimum, maximum=self.maximum,
+                 reservoir=self.reservoir[:min(self.seen, len(self.reservoir))], reservoir_size=len(self.reservoir),
+                 seen=self.seen)
+
+    @classmethod
+    def load(cls, path):
+        saved = np.load(path)
+        stats = cls(saved['columns'].tolist(), method=str(saved['method']), reservoir_size=int(saved['reservoir_size']))
+        stats.count, stats.mean, stats.m2 = saved['count'], saved['mean'], saved['m2']
+        stats.minimum, stats.maximum = saved['minimum'], saved['maximum']
+        stats.reservoir[:len(saved['reservoir'])] = saved['reservoir']
+        stats.seen = int(saved['seen'])
+        return stats
@@ -0,0 +1,178 @@
+import datetime
+import hashlib
+import os
+import time
+import numpy as np
+import tensorflow as tf
+from ..common import metrics
+from .normalize import FeatureStats
+
+# Per-level features in the order CNNModel has always used: bid price, bid size, ask price, ask size.
+LEVEL_FEATURES = ('bid_{}_price', 'bid_{}_size', 'ask_{}_price', 'ask_{}_size')
+
+
+def feature_columns(levels):
+    """ Order book columns feeding the model, level by level. """
+    return [name.format(i) for i in range(levels) for name in LEVEL_FEATURES]
+
+
+def mid_price_labels(mid, window, horizon, stride=1, threshold=0.0):
+    """
+    Labels every window by the mid price direction over the following `horizon` snapshots.
+
+    Window k covers rows [k * stride, k * stride + window) and ends at row e = k * stride + window - 1.
+    Its label is 1 if mid[e + horizon] exceeds mid[e] by more than `threshold` (relative), else 0.
+    Only windows with a full horizon after them are labelled.
+
+    Returns:
+        np.ndarray: float32 labels, one per window.
+    """
+    count = (len(mid) - horizon - window) // stride + 1
+    if count <= 0:
+        return np.empty(0, dtype=np.float32)
+    ends = np.arange(count) * stride + window - 1
+    return (mid[ends + horizon] > mid[ends] * (1 + threshold)).astype(np.float32)
+
+
+class OrderBookDataset:
+    """
+    Streams labelled order book windows from an AssetPairDbManager into a `tf.data.Dataset`.
+
+    The range is cut into time shards. Each shard is read with one `read_range` query, normalized
+    with the dataset-wide FeatureStats into a float32 feature matrix, labelled by mid-price
+    direction and cached as an .npz under `cache_dir`, so every epoch after the first (and every
+    later run over the same range) loads arrays instead of querying SQLite. Shards are read `parallel` at a time and their windows interleaved, then shuffled, batched
+    and prefetched. Windows are framed inside the graph with `tf.signal.frame`, so the (window,
+    features) tensors never exist in NumPy.
+
+    Windows do not span shard boundaries; the last `window + horizon - 1` rows of each shard only
+    serve as context and look-ahead.
+    """
+
+    def __init__(self, db, start, end, window=64, levels=5, horizon=50, stride=1, threshold=0.0,
+                 shard=datetime.timedelta(hours=1), cache_dir="data/tensors", parallel=4, stats=None):
+        """
+        Args:
+            db (AssetPairDbManager): Source of the order book.
+            start (datetime.datetime): Start of the training range.
+            end (datetime.datetime): End of the training range, exclusive.
+            window (int): Snapshots per sample.
+            levels (int): Book levels per side fed to the model.
+            horizon (int): Snapshots ahead used for the label.
+            stride (int): Snapshots between consecutive windows.
+            threshold (float): Relative mid-price move needed for an up label.
+            shard (datetime.timedelta): Time covered by one read.
+            cache_dir (str): Directory for preprocessed shards. None disables caching.
+            parallel (int): Shards read and interleaved concurrently.
+            stats (FeatureStats): Normalization statistics of the feature columns. Defaults to
+                computing z-score statistics over the range in one streaming pass.
+        """
+        self.db = db
+        self.window = window
+        self.levels = levels
+        self.horizon = horizon
+        self.stride = stride
+        self.threshold = threshold
+        self.cache_dir = cache_dir
+        self.parallel = parallel
+        self.columns = feature_columns(levels)
+        self.shards = []
+        shard_start = start
+        while shard_start < end:
+            self.shards.append((shard_start, min(shard_start + shard, end)))
+            shard_start += shard
+        self.stats = stats
+        if self.stats is None:
+            self.stats = FeatureStats.scan(db, start, end - datetime.timedelta(microseconds=1), self.columns)
+        self.reads = 0  # Shards read from the database rather than the cache.
+
+    @property
+    def num_features(self):
+        return len(self.columns)
+
+    def load_shard(self, index):
+        """
+        Returns the features and labels of one shard, from the cache if possible.
+
+        Returns:
+            tuple: (features, labels) with features float32 of shape (rows, num_features), already
+                trimmed to the rows the labelled windows cover, and labels float32 of shape (windows,).
+        """
+        index = int(index)
+        path = self._cache_path(index)
+        if path is not None and os.path.exists(path):
+            cached = np.load(path)
+            return cached['features'], cached['labels']
+
+        start, end = self.shards[index]
+        # read_range is inclusive, and stored timestamps have microsecond precision.
+        _, values = self.db.read_range(start, end - datetime.timedelta(microseconds=1), self.columns)
+        self.reads += 1
+        features = self.preprocess(values)
+        mid = (values[:, 0] + values[:, 2]) / 2  # bid_0_price and ask_0_price.
+        labels = mid_price_labels(mid, self.window, self.horizon, self.stride, self.threshold)
+        rows = (len(labels) - 1) * self.stride + self.window if len(labels) else 0
+        features = np.ascontiguousarray(features[:rows])
+        if path is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.tmp.npz"
+            np.savez(tmp_path, features=features, labels=labels)
+            os.replace(tmp_path, path)
+        return features, labels
+
+    def preprocess(self, values):
+        """ Normalizes raw feature columns with the dataset-wide statistics. """
+        return self.stats.transform(values)
+
+    def dataset(self, batch_size=256, shuffle_buffer=10000, seed=None):
+        """
+        Builds the input pipeline.
+
+        Returns:
+            tf.data.Dataset: Batches of (windows, labels), windows of shape (batch, window, num_features, 1).
+        """
+        def shard_windows(index):
+            features, labels = tf.numpy_function(self.load_shard, [index], (tf.float32, tf.float32))
+            features.set_shape([None, self.num_features])
+            labels.set_shape([None])
+            windows = tf.signal.frame(features, self.window, self.stride, axis=0)
+            return tf.data.Dataset.from_tensor_slices((windows[..., tf.newaxis], labels))
+
+        dataset = tf.data.Dataset.range(len(self.shards))
+        if shuffle_buffer:
+            dataset = dataset.shuffle(len(self.shards), seed=seed)
+        dataset = dataset.interleave(shard_windows, cycle_length=self.parallel,
+                                     num_parallel_calls=tf.data.AUTOTUNE, deterministic=seed is not None)
+        if shuffle_buffer:
+            dataset = dataset.shuffle(shuffle_buffer, seed=seed)
+        return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+    def _cache_path(self, index):
+        if self.cache_dir is None:
+            return None
+        start, end = self.shards[index]
+        key = "|".join([
+            self.db.db_file, getattr(self.db, 'backend', 'sqlite'), start.isoformat(), end.isoformat(),
+            str(self.window), str(self.levels), str(self.horizon), str(self.stride), str(self.threshold),
+            self.stats.fingerprint()
+        ])
+        return os.path.join(self.cache_dir, f"{hashlib.sha1(key.encode()).hexdigest()}.npz")
+
+
+class StepRate(tf.keras.callbacks.Callback):
+    """ Prints training steps/sec at the end of every epoch, and records each step in the 'train.step' histogram. """
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.started = time.perf_counter()
+        self.steps = 0
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.step_started = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.steps += 1
+        metrics.observe('train.step', time.perf_counter() - self.step_started, unit='seconds')
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.perf_counter() - self.started
+        print(f"Epoch {epoch + 1}: {self.steps} steps in {elapsed:.1f}s ({self.steps / elapsed:.1f} steps/sec)")
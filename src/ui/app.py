@@ -1,82 +1,112 @@
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from mplfinance.original_flavor import candlestick_ohlc
+import numpy as np
 import datetime
-import socket
-import json
 
-from common.sock import SockClient  # Ensure SockClient is implemented
+from ..common.sock import SockClient
+from ..common.codec import Account, Book, BookDecoder, Candle, Execution, coalesce_key, topic
+from .render import CandleRenderer
 
 class MarketUI:
-    def __init__(self):
-        self.client = SockClient()
-        self.fig, self.ax = plt.subplots()
-        
+    def __init__(self, exchange='BINANCE', asset_pair='ETH-USDT', bar_seconds=60, window=300):
+        # Only this pair's book is charted, so only its topic is subscribed to. Frames don't name
+        # their topic, so one decoder follows the book and coalescing can't mix pairs.
+        self.topic = topic(exchange, asset_pair)
+        self.client = SockClient(coalesce_key=coalesce_key, topics=[self.topic])
+        self.decoder = BookDecoder()
+
         # Setting up dark mode for matplotlib
         plt.style.use('dark_background')
+        self.fig, self.ax = plt.subplots()
         self.fig.patch.set_facecolor('#121212')
         self.ax.set_facecolor('#121212')
         self.ETH = 0
         self.USDT = 0
 
-    def fetch_market_data(self):
-        """ Fetch data from the socket. """
-        data = self.client.receive_data()
-        return json.loads(data)
-
-    def update_plot(self, frame):
-        """ Update plot with new data. """
-        data = self.fetch_market_data()
-        self.ETH = data['ETH']
-        self.USDT = data['USDT']
-        trades = data['trades']
-        
-        # Prepare data for candlestick chart
-        ochl = [
-            [datetime.datetime.strptime(trade['time'], '%Y-%m-%dT%H:%M:%S').timestamp(), trade['open'], trade['high'], trade['low'], trade['close']]
-            for trade in trades
-        ]
-        
-        # Clear the current axes
-        self.ax.clear()
-        candlestick_ohlc(self.ax, ochl, width=0.6, colorup='g', colordown='r')
-        
-        # Plot buy and sell points
-        buys = [(trade['time'], trade['price']) for trade in trades if trade['type'] == 'buy']
-        sells = [(trade['time'], trade['price']) for trade in trades if trade['type'] == 'sell']
-        self.ax.plot([datetime.datetime.strptime(b[0], '%Y-%m-%dT%H:%M:%S').timestamp() for b in buys], [b[1] for b in buys], '^', markersize=10, color='g')
-        self.ax.plot([datetime.datetime.strptime(s[0], '%Y-%m-%dT%H:%M:%S').timestamp() for s in sells], [s[1] for s in sells], 'v', markersize=10, color='r')
-
-        # Set plot labels and title
+        # Static decorations are laid out once; only the renderer's artists change per frame.
         self.ax.set_xlabel('Time')
         self.ax.set_ylabel('Price')
-        self.ax.set_title(f"Live Market Data for ETH-USDT: ETH={self.ETH}, USDT={self.USDT}")
-
-        # Format timestamps for better readability on the x-axis
+        self.ax.set_title(f"Live Market Data for {asset_pair}")
         self.ax.xaxis.set_major_formatter(plt.FuncFormatter(self.format_date))
-        plt.xticks(rotation=45)
-        plt.tight_layout()
+        plt.setp(self.ax.get_xticklabels(), rotation=45)
+        self.fig.tight_layout()
+        self.renderer = CandleRenderer(self.ax, bar_seconds=bar_seconds, window=window)
+
+    def fetch_market_data(self):
+        """ Fold every message received since the last frame into the UI state. """
+        for payload in self.client.receive_batch():
+            # None is a delta that can't be applied until the next keyframe.
+            message = self.decoder.decode(payload)
+            if message is not None:
+                self.apply(message)
+
+    def apply(self, message):
+        """ Fold one decoded message into the UI state. """
+        if isinstance(message, Candle):
+            self.renderer.update_candle(message.time / 1e9, message.open, message.high, message.low, message.close)
+        elif isinstance(message, Book):
+            # Chart the mid price: bid_0_price and ask_0_price lead the bid and ask halves of the levels.
+            levels = message.levels
+            self.renderer.update_price(message.received_time / 1e9, (levels[0] + levels[len(levels) // 2]) / 2)
+        elif isinstance(message, Execution):
+            self.renderer.add_execution(message.time / 1e9, message.side, message.price)
+        elif isinstance(message, Account):
+            self.ETH = message.base
+            self.USDT = message.quote
+
+    def update_plot(self, frame=None):
+        """ Update plot with new data. """
+        self.fetch_market_data()
+        self.renderer.set_label(f"ETH={self.ETH}, USDT={self.USDT}")
+        return self.renderer.draw()
 
     def format_date(self, x, pos=None):
         """ Format the date displayed on the x-axis. """
         return datetime.datetime.fromtimestamp(x).strftime('%Y-%m-%d %H:%M:%S')
 
-    def run(self):
-        """ Run the UI application. """
-        ani = animation.FuncAnimation(self.fig, self.update_plot, interval=1000)
+    def run(self, interval=100):
+        """ Run the UI application, rendering a frame every `interval` milliseconds. """
+        # A plain timer instead of FuncAnimation, which would redraw the whole figure after every frame.
+        self.timer = self.fig.canvas.new_timer(interval=interval)
+        self.timer.add_callback(self.update_plot)
+        self.timer.start()
         plt.show()
 
-    def playback_history(self, speed=1.0):
-        """ Simulate the playback of execution history at a given speed. """
-        start_date = datetime.datetime.now() - datetime.timedelta(days=30)  # Arbitrary start date
-        end_date = datetime.datetime.now()
-        current_date = start_date
+    def load_history(self, bar_store, start, end):
+        """
+        Charts stored bars before the live feed or a playback continues from `end`.
 
-        while current_date <= end_date:
-            trades = self.fetch_market_data_for_date(current_date)
-            self.update_plot(trades)
-            plt.pause(speed)  # Pause for 'speed' seconds
-            current_date += datetime.timedelta(days=1)
+        Args:
+            bar_store (BarStore): Rollups of the book, served at the renderer's bar duration.
+            start (datetime.datetime): Start of the history.
+            end (datetime.datetime): End of the history, exclusive.
+        """
+        bars = bar_store.bars(start, end, int(self.renderer.bar_seconds))
+        self.renderer.load_candles(np.column_stack([bars['time'] / 1e9, bars['open'], bars['high'],
+                                                    bars['low'], bars['close']]))
+
+    def playback_history(self, engine, start, end, speed=1.0, interval=100):
+        """
+        Replays a stored range instead of the live feed.
+
+        Args:
+            engine (PlaybackEngine): Engine over the book and execution databases to replay.
+            start (datetime.datetime): Start of the range.
+            end (datetime.datetime): End of the range.
+            speed (float): Playback speed multiplier, None for as fast as possible.
+            interval (int): Milliseconds between frames.
+        """
+        def update(frame=None):
+            for _, message in engine.poll():
+                self.apply(message)
+            self.renderer.set_label(f"Playback x{speed}" if speed is not None else "Playback")
+            return self.renderer.draw()
+
+        engine.start(start, end, speed)
+        self.timer = self.fig.canvas.new_timer(interval=interval)
+        self.timer.add_callback(update)
+        self.timer.start()
+        plt.show()
+        engine.stop()
 
 if __name__ == '__main__':
     ui = MarketUI()
@@ -0,0 +1,178 @@
+import numpy as np
+from ..common.rolling import RollingBuffer
+
+UP_COLOR = 'g'
+DOWN_COLOR = 'r'
+
+
+def vertical_segments(x, y0, y1):
+    """ One polyline of vertical segments x[i]: y0[i] -> y1[i], separated by NaN breaks. """
+    xs = np.empty(3 * len(x))
+    ys = np.empty(3 * len(x))
+    xs[0::3], xs[1::3], xs[2::3] = x, x, np.nan
+    ys[0::3], ys[1::3], ys[2::3] = y0, y1, np.nan
+    return xs, ys
+
+
+def decimate_ohlc(bars, buckets):
+    """
+    Min/max decimation of OHLC bars: consecutive bars are merged into at most `buckets` bars that keep
+    the first open, the highest high, the lowest low and the last close, so no extreme is lost.
+
+    Args:
+        bars (np.ndarray): (n, 5) rows of time, open, high, low, close.
+        buckets (int): Maximum number of bars to return.
+
+    Returns:
+        tuple: (bars, bars_per_bucket)
+    """
+    size = -(-len(bars) // buckets)
+    if size <= 1:
+        return bars, 1
+    starts = np.arange(0, len(bars), size)
+    ends = np.minimum(starts + size, len(bars)) - 1
+    merged = np.empty((len(starts), 5))
+    merged[:, 0] = bars[starts, 0]
+    merged[:, 1] = bars[starts, 1]
+    merged[:, 2] = np.maximum.reduceat(bars[:, 2], starts)
+    merged[:, 3] = np.minimum.reduceat(bars[:, 3], starts)
+    merged[:, 4] = bars[ends, 4]
+    return merged, size
+
+
+class CandleRenderer:
+    """
+    Incremental candlestick chart with buy/sell markers.
+
+    Bars and executions are kept in rolling NumPy buffers. A candle update only touches the newest bar,
+    and each frame rebuilds the visible bars with a few vectorized operations, decimating them to
+    about one bar per pixel column. Wicks and bodies are drawn as one NaN-separated line per colour
+    (bodies as thick, butt-capped segments) rather than one path per candle. The artists are animated and blitted
+    over a cached background, so a frame never redraws the axes; a full draw only happens when the
+    newest bar scrolls out of view or a price leaves the y range.
+    """
+
+    def __init__(self, ax, bar_seconds=60, window=300, capacity=100000):
+        """
+        Args:
+            ax (matplotlib.axes.Axes): Axes to draw on, with time as seconds since the epoch on the x axis.
+            bar_seconds (float): Duration of one bar.
+            window (int): Number of bars visible at once.
+            capacity (int): Number of bars and executions per side kept in memory.
+        """
+        self.ax = ax
+        self.canvas = ax.figure.canvas
+        self.bar_seconds = bar_seconds
+        self.window = window
+        self.bars = RollingBuffer(capacity, 5)
+        self.buys = RollingBuffer(capacity, 2)
+        self.sells = RollingBuffer(capacity, 2)
+
+        self.candles = {}
+        for up, color in ((True, UP_COLOR), (False, DOWN_COLOR)):
+            wicks, = ax.plot([], [], color=color, linewidth=1, animated=True)
+            bodies, = ax.plot([], [], color=color, solid_capstyle='butt', animated=True)
+            self.candles[up] = (wicks, bodies)
+        self.buy_markers, = ax.plot([], [], '^', markersize=10, color=UP_COLOR, animated=True)
+        self.sell_markers, = ax.plot([], [], 'v', markersize=10, color=DOWN_COLOR, animated=True)
+        self.label = ax.text(0.01, 0.98, '', transform=ax.transAxes, va='top', animated=True)
+        self.artists = [*self.candles[True], *self.candles[False], self.buy_markers, self.sell_markers, self.label]
+
+        self.background = None
+        self.full_draws = 0
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def update_candle(self, time, open, high, low, close):
+        """ Updates the newest bar if `time` matches it, otherwise appends a new bar. """
+        row = (time, open, high, low, close)
+        if len(self.bars) and self.bars.view[-1, 0] == time:
+            self.bars.replace_last(row)
+        else:
+            self.bars.append(row)
+
+    def load_candles(self, candles):
+        """ Appends a (bars, 5) array of time, open, high, low, close rows, e.g. history from a BarStore. """
+        self.bars.extend(candles)
+
+    def update_price(self, time, price):
+        """ Folds a price tick into the bar containing `time`, opening a new bar if needed. """
+        bar_time = time - time % self.bar_seconds
+        if len(self.bars) and self.bars.view[-1, 0] == bar_time:
+            _, open, high, low, _ = self.bars.view[-1]
+            self.bars.replace_last((bar_time, open, max(high, price), min(low, price), price))
+        else:
+            self.bars.append((bar_time, price, price, price, price))
+
+    def add_execution(self, time, side, price):
+        (self.buys if side == 'buy' else self.sells).append((time, price))
+
+    def set_label(self, text):
+        self.label.set_text(text)
+
+    def draw(self):
+        """ Renders one frame, blitting unless the view has to move. """
+        if self._update_limits() or self.background is None:
+            # The draw_event handler caches the new background and draws the artists on top.
+            self.canvas.draw()
+            self.full_draws += 1
+        else:
+            self.canvas.restore_region(self.background)
+            self._draw_artists()
+            self.canvas.blit(self.ax.bbox)
+        return self.artists
+
+    def _update_limits(self):
+        """ Scrolls or rescales the view if the data left it. Returns whether the limits changed. """
+        if not len(self.bars):
+            return False
+        left, right = self.ax.get_xlim()
+        bottom, top = self.ax.get_ylim()
+        newest = self.bars.view[-1, 0]
+        span = self.window * self.bar_seconds
+        changed = False
+        if not left <= newest <= right - self.bar_seconds:
+            # Leave a quarter of the window free so the view scrolls once per 1/4 window, not per bar.
+            left, right = newest - 0.75 * span, newest + 0.25 * span
+            self.ax.set_xlim(left, right)
+            changed = True
+        visible = self._visible(left, right)
+        low, high = visible[:, 3].min(), visible[:, 2].max()
+        if changed or low < bottom or high > top:
+            margin = max(high - low, abs(high) * 1e-4) * 0.1
+            self.ax.set_ylim(low - margin, high + margin)
+            changed = True
+        return changed
+
+    def _visible(self, left, right):
+        bars = self.bars.view
+        lo, hi = np.searchsorted(bars[:, 0], [left - self.bar_seconds, right], side='left')
+        return bars[lo:hi]
+
+    def _draw_artists(self):
+        left, right = self.ax.get_xlim()
+        bars, size = decimate_ohlc(self._visible(left, right), max(int(self.ax.bbox.width), 1))
+        times, opens, highs, lows, closes = bars.T
+
+        center = times + 0.5 * size * self.bar_seconds
+        # Bodies are 60% of a bucket wide, converted to points for the line width.
+        pixels_per_second = self.ax.bbox.width / (right - left)
+        width = max(0.6 * size * self.bar_seconds * pixels_per_second * 72 / self.ax.figure.dpi, 1)
+        up = closes >= opens
+        for side in (True, False):
+            mask = up == side
+            wicks, bodies = self.candles[side]
+            wicks.set_data(*vertical_segments(center[mask], lows[mask], highs[mask]))
+            bodies.set_data(*vertical_segments(center[mask], opens[mask], closes[mask]))
+            bodies.set_linewidth(width)
+
+        for markers, executions in ((self.buy_markers, self.buys), (self.sell_markers, self.sells)):
+            points = executions.view
+            lo, hi = np.searchsorted(points[:, 0], [left, right])
+            markers.set_data(points[lo:hi, 0], points[lo:hi, 1])
+
+        for artist in self.artists:
+            self.ax.draw_artist(artist)
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_artists()